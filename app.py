@@ -1,471 +1,118 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, redirect, stream_with_context
 from flask_cors import CORS
-from database import DatabaseManager
-from importador import ImportadorDatos
+from database import MODOS_IMPORTACION, crear_database_manager
+from catalogo import normalizar
+from importador import ImportadorDatos, huella_archivo
+from importaciones import GestorImportaciones
+from exportador import ExportadorDatos, FORMATOS
+from estaticos import RecursosEstaticos
+import metricas
+from datetime import date
+import hashlib
+import json
 import os
+import time
 
-app = Flask(__name__)
+LIMITE_PAGINA = 1000
+LIMITE_PAGINA_MAX = 10000
+PUNTOS_SERIE = 600
+PUNTOS_SERIE_MAX = 5000
+MAX_SERIES = 20
+MAX_LOTE = 10000
+
+app = Flask(__name__, static_folder=None)
 CORS(app)
 
-# Inicializar gestores
-db = DatabaseManager()
+# Inicializar gestores (DATABASE_URL=sqlite:///... usa la base embebida de la estación)
+db = crear_database_manager()
 importador = ImportadorDatos(db)
-
-# Inicializar la base de datos al inicio
-db.init_database()
+importaciones = GestorImportaciones(db, importador)
+exportador = ExportadorDatos(db)
+estaticos = RecursosEstaticos()
+metricas.registrar_pool(db.estadisticas_pool)
+
+# El esquema lo aplica `python gestion.py migrar` una vez por despliegue (fase release);
+# cada worker solo comprueba la versión. DB_MIGRAR_AL_INICIAR=1 migra al arrancar.
+if os.environ.get('DB_MIGRAR_AL_INICIAR', '').lower() in ('1', 'true', 'si'):
+    db.init_database()
+else:
+    estado_esquema = db.estado_esquema()
+    if not estado_esquema['success'] or estado_esquema['data']['pendientes']:
+        print(f"⚠ Esquema de la base de datos sin actualizar ({estado_esquema['message']}): ejecute python gestion.py migrar")
+# La cola de importaciones guarda los archivos como objetos grandes de Postgres y la procesa
+# `python gestion.py procesar-importaciones` (un solo proceso worker por despliegue).
+# IMPORT_EN_WEB=1 arranca además los hilos de trabajo en cada proceso web.
+if not db.embebida and os.environ.get('IMPORT_EN_WEB', '').lower() in ('1', 'true', 'si'):
+    importaciones.iniciar()
+
+@app.before_request
+def iniciar_cronometro():
+    g.inicio = time.perf_counter()
+
+@app.after_request
+def registrar_metricas(respuesta):
+    """Latencia y código de estado por ruta (la plantilla de la ruta, no la URL, para acotar las etiquetas)"""
+    ruta = request.url_rule.rule if request.url_rule else 'sin_ruta'
+    metricas.registrar_peticion(ruta, request.method, respuesta.status_code, time.perf_counter() - g.inicio)
+    metricas.actualizar_pool()
+    return respuesta
 
 @app.route('/')
 def index():
-    """Ruta principal que sirve el HTML"""
-    html_content = '''<!DOCTYPE html>
-<html lang="es">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>APP HTTP - Laboratorio</title>
-    <script src="https://unpkg.com/react@18/umd/react.production.min.js"></script>
-    <script src="https://unpkg.com/react-dom@18/umd/react-dom.production.min.js"></script>
-    <script src="https://cdn.tailwindcss.com"></script>
-    <style>
-        body {
-            margin: 0;
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', 'Roboto', 'Oxygen', 'Ubuntu', 'Cantarell', 'Fira Sans', 'Droid Sans', 'Helvetica Neue', sans-serif;
-        }
-    </style>
-</head>
-<body>
-    <div id="root"></div>
-    <script>
-        // Aquí iría el código React compilado
-        // Por ahora, usaremos una interfaz HTML simple
-        window.location.href = '/dashboard';
-    </script>
-</body>
-</html>'''
-    return html_content
+    """Ruta principal: redirige al dashboard"""
+    return redirect('/dashboard')
 
 @app.route('/dashboard')
 def dashboard():
     """Dashboard principal con interfaz completa"""
-    return '''<!DOCTYPE html>
-<html lang="es">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>APP HTTP - Dashboard</title>
-    <script src="https://cdn.tailwindcss.com"></script>
-    <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css">
-    <style>
-        .sidebar-transition { transition: width 0.3s ease; }
-        .slide-button {
-            position: fixed;
-            left: 0;
-            top: 50%;
-            transform: translateY(-50%);
-            z-index: 1000;
-        }
-    </style>
-</head>
-<body class="bg-gray-50">
-    <div id="app" class="flex h-screen">
-        <!-- Sidebar -->
-        <div id="sidebar" class="sidebar-transition w-80 bg-white border-r border-gray-200 overflow-hidden">
-            <div class="p-6 border-b border-gray-200">
-                <div class="flex items-center justify-between">
-                    <h1 class="text-xl font-semibold text-gray-800">APP HTTP</h1>
-                    <button onclick="toggleSidebar()" class="p-2 hover:bg-gray-100 rounded-lg">
-                        <i class="fas fa-times"></i>
-                    </button>
-                </div>
-            </div>
-            
-            <div class="p-4 overflow-y-auto" style="height: calc(100vh - 80px);">
-                <!-- Menú principal -->
-                <div class="space-y-1 mb-6">
-                    <button onclick="showView('home')" class="w-full flex items-center gap-3 px-4 py-2.5 rounded-lg text-gray-700 hover:bg-gray-100">
-                        <i class="fas fa-home"></i>
-                        <span class="font-medium">Inicio</span>
-                    </button>
-                    <button onclick="showView('import')" class="w-full flex items-center gap-3 px-4 py-2.5 rounded-lg text-gray-700 hover:bg-gray-100">
-                        <i class="fas fa-upload"></i>
-                        <span class="font-medium">Importar Datos</span>
-                    </button>
-                    <button onclick="showView('export')" class="w-full flex items-center gap-3 px-4 py-2.5 rounded-lg text-gray-700 hover:bg-gray-100">
-                        <i class="fas fa-download"></i>
-                        <span class="font-medium">Exportar Datos</span>
-                    </button>
-                    <button onclick="showView('database')" class="w-full flex items-center gap-3 px-4 py-2.5 rounded-lg text-gray-700 hover:bg-gray-100">
-                        <i class="fas fa-database"></i>
-                        <span class="font-medium">Base de Datos</span>
-                    </button>
-                </div>
-
-                <div class="border-t border-gray-200 pt-4">
-                    <h3 class="text-xs font-semibold text-gray-500 uppercase mb-3 px-2">Puntos de Muestreo</h3>
-                    
-                    <!-- Fisicoquímica -->
-                    <div class="mb-2">
-                        <button onclick="toggleSection('fisicoquimica')" class="w-full flex items-center justify-between px-3 py-2 text-sm font-medium text-gray-700 hover:bg-gray-100 rounded-lg">
-                            <div class="flex items-center gap-2">
-                                <i class="fas fa-flask text-blue-600"></i>
-                                <span>Fisicoquímica</span>
-                            </div>
-                            <i class="fas fa-chevron-down" id="icon-fisicoquimica"></i>
-                        </button>
-                        <div id="section-fisicoquimica" class="hidden ml-4 mt-1 space-y-1">
-                            <!-- Vapor -->
-                            <div class="mb-2">
-                                <button onclick="toggleSection('vapor')" class="w-full flex items-center justify-between px-3 py-2 text-sm font-medium text-gray-700 hover:bg-gray-100 rounded-lg">
-                                    <div class="flex items-center gap-2">
-                                        <i class="fas fa-wind text-orange-500" style="font-size: 0.875rem;"></i>
-                                        <span>Vapor</span>
-                                    </div>
-                                    <i class="fas fa-chevron-right text-sm" id="icon-vapor"></i>
-                                </button>
-                                <div id="section-vapor" class="hidden ml-6 mt-1 space-y-1">
-                                    <!-- Puntos PMV -->
-                                </div>
-                            </div>
-                            
-                            <!-- Agua -->
-                            <div class="mb-2">
-                                <button onclick="toggleSection('agua')" class="w-full flex items-center justify-between px-3 py-2 text-sm font-medium text-gray-700 hover:bg-gray-100 rounded-lg">
-                                    <div class="flex items-center gap-2">
-                                        <i class="fas fa-droplet text-blue-500" style="font-size: 0.875rem;"></i>
-                                        <span>Agua</span>
-                                    </div>
-                                    <i class="fas fa-chevron-right text-sm" id="icon-agua"></i>
-                                </button>
-                                <div id="section-agua" class="hidden ml-6 mt-1 space-y-1">
-                                    <!-- Puntos PA -->
-                                </div>
-                            </div>
-                        </div>
-                    </div>
-
-                    <!-- Microbiología -->
-                    <div class="mb-2">
-                        <button onclick="toggleSection('microbiologia')" class="w-full flex items-center justify-between px-3 py-2 text-sm font-medium text-gray-700 hover:bg-gray-100 rounded-lg">
-                            <div class="flex items-center gap-2">
-                                <i class="fas fa-bacteria text-green-600"></i>
-                                <span>Microbiología</span>
-                            </div>
-                            <i class="fas fa-chevron-down" id="icon-microbiologia"></i>
-                        </button>
-                        <div id="section-microbiologia" class="hidden ml-6 mt-1 space-y-1">
-                            <button onclick="showCategoryForm('nitrogeno', 'microbiologia')" class="w-full px-3 py-2 text-xs text-gray-600 hover:bg-gray-50 rounded-lg text-left">
-                                Nitrógeno
-                            </button>
-                            <button onclick="showCategoryForm('aire_comprimido', 'microbiologia')" class="w-full px-3 py-2 text-xs text-gray-600 hover:bg-gray-50 rounded-lg text-left">
-                                Aire comprimido
-                            </button>
-                            <button onclick="showCategoryForm('vapor_micro', 'microbiologia')" class="w-full px-3 py-2 text-xs text-gray-600 hover:bg-gray-50 rounded-lg text-left">
-                                Vapor
-                            </button>
-                        </div>
-                    </div>
-                </div>
-            </div>
-        </div>
-
-        <!-- Botón slide -->
-        <button id="slideButton" onclick="toggleSidebar()" class="slide-button hidden bg-blue-600 text-white p-3 rounded-r-lg shadow-lg hover:bg-blue-700">
-            <i class="fas fa-bars"></i>
-        </button>
-
-        <!-- Contenido principal -->
-        <div class="flex-1 flex flex-col overflow-hidden">
-            <header class="bg-white border-b border-gray-200 px-6 py-4">
-                <div class="flex items-center justify-between">
-                    <h2 id="pageTitle" class="text-xl font-semibold text-gray-800">Panel Principal</h2>
-                    <div class="flex items-center gap-2">
-                        <div class="w-3 h-3 bg-green-500 rounded-full"></div>
-                        <span class="text-sm text-gray-600">Conectado</span>
-                    </div>
-                </div>
-            </header>
-
-            <main id="mainContent" class="flex-1 overflow-y-auto p-6">
-                <!-- Contenido dinámico -->
-                <div id="homeView">
-                    <div class="max-w-6xl mx-auto">
-                        <div class="grid grid-cols-1 md:grid-cols-4 gap-6 mb-8">
-                            <div class="bg-white p-6 rounded-xl border border-gray-200 shadow-sm">
-                                <div class="flex items-center justify-between mb-4">
-                                    <h3 class="text-sm font-semibold text-gray-800">Vapor</h3>
-                                    <i class="fas fa-wind text-orange-500"></i>
-                                </div>
-                                <p class="text-2xl font-bold text-gray-900">8</p>
-                                <p class="text-xs text-gray-600 mt-1">Puntos PMV</p>
-                            </div>
-                            <div class="bg-white p-6 rounded-xl border border-gray-200 shadow-sm">
-                                <div class="flex items-center justify-between mb-4">
-                                    <h3 class="text-sm font-semibold text-gray-800">Agua</h3>
-                                    <i class="fas fa-droplet text-blue-500"></i>
-                                </div>
-                                <p class="text-2xl font-bold text-gray-900">18</p>
-                                <p class="text-xs text-gray-600 mt-1">Puntos PA</p>
-                            </div>
-                            <div class="bg-white p-6 rounded-xl border border-gray-200 shadow-sm">
-                                <div class="flex items-center justify-between mb-4">
-                                    <h3 class="text-sm font-semibold text-gray-800">Microbiología</h3>
-                                    <i class="fas fa-bacteria text-green-600"></i>
-                                </div>
-                                <p class="text-2xl font-bold text-gray-900">3</p>
-                                <p class="text-xs text-gray-600 mt-1">Categorías</p>
-                            </div>
-                            <div class="bg-white p-6 rounded-xl border border-gray-200 shadow-sm">
-                                <div class="flex items-center justify-between mb-4">
-                                    <h3 class="text-sm font-semibold text-gray-800">Total</h3>
-                                    <i class="fas fa-database text-purple-600"></i>
-                                </div>
-                                <p class="text-2xl font-bold text-gray-900">26</p>
-                                <p class="text-xs text-gray-600 mt-1">Puntos totales</p>
-                            </div>
-                        </div>
-                    </div>
-                </div>
-            </main>
-        </div>
-    </div>
-
-    <script>
-        let sidebarOpen = true;
-        
-        const estructuraData = {
-            vapor: {
-                PMV001: ['PH', 'CONDUCTIVIDAD', 'CLORO', 'DUREZA', 'COLOR', 'TURBIDEZ', 'HIERRO', 'SOLIDOS', 'SULFATOS'],
-                PMV002: ['PH', 'CONDUCTIVIDAD', 'CLORO', 'DUREZA', 'COLOR', 'TURBIDEZ', 'HIERRO', 'SOLIDOS', 'SULFATOS'],
-                PMV003: ['DUREZA', 'HIERRO', 'SULFATOS'],
-                PMV004: ['CONDUCTIVIDAD', 'CLORO'],
-                PMV005: ['PH', 'CONDUCTIVIDAD'],
-                PMV006: ['PH', 'CONDUCTIVIDAD'],
-                PMV007: ['CONDUCTIVIDAD', 'TOC'],
-                PMV008: ['CONDUCTIVIDAD', 'TOC']
-            },
-            agua: {
-                PA001: ['TOC', 'PH', 'CONDUCTIVIDAD'],
-                PA002: ['PH', 'CONDUCTIVIDAD', 'TOC'],
-                PA003: ['CONDUCTIVIDAD', 'PH', 'TOC'],
-                PA004: ['COLOR', 'TURBIDEZ', 'TOC', 'PH', 'CONDUCTIVIDAD'],
-                PA005: ['DUREZA', 'HIERRO', 'SULFATOS', 'TOC', 'PH', 'CONDUCTIVIDAD'],
-                PA006: ['PH', 'CONDUCTIVIDAD', 'CLORO', 'DUREZA', 'COLOR', 'TURBIDEZ', 'HIERRO', 'SOLIDOS TOTALES', 'SULFATOS', 'TOC'],
-                PA007: ['PH', 'CONDUCTIVIDAD', 'TOC'],
-                PA008: ['PH', 'CONDUCTIVIDAD', 'CLORO', 'TOC'],
-                PA009: ['PH', 'CONDUCTIVIDAD', 'TOC'],
-                PA010: ['PH', 'CONDUCTIVIDAD', 'TOC'],
-                PA011: ['PH', 'CONDUCTIVIDAD', 'TOC'],
-                PA012: ['TOC', 'PH', 'CONDUCTIVIDAD'],
-                PA013: ['PH', 'CONDUCTIVIDAD', 'TOC'],
-                PA014: ['PH', 'CONDUCTIVIDAD', 'TOC'],
-                PA015: ['PH', 'CONDUCTIVIDAD', 'TOC'],
-                PA016: ['PH', 'CONDUCTIVIDAD', 'TOC'],
-                PA017: ['PH', 'CONDUCTIVIDAD', 'TOC'],
-                PA018: ['PH', 'CONDUCTIVIDAD', 'TOC']
-            }
-        };
-
-        function toggleSidebar() {
-            sidebarOpen = !sidebarOpen;
-            const sidebar = document.getElementById('sidebar');
-            const slideButton = document.getElementById('slideButton');
-            
-            if (sidebarOpen) {
-                sidebar.classList.remove('w-0');
-                sidebar.classList.add('w-80');
-                slideButton.classList.add('hidden');
-            } else {
-                sidebar.classList.remove('w-80');
-                sidebar.classList.add('w-0');
-                slideButton.classList.remove('hidden');
-            }
-        }
-
-        function toggleSection(section) {
-            const sectionEl = document.getElementById('section-' + section);
-            const icon = document.getElementById('icon-' + section);
-            
-            if (sectionEl.classList.contains('hidden')) {
-                sectionEl.classList.remove('hidden');
-                icon.classList.remove('fa-chevron-right');
-                icon.classList.add('fa-chevron-down');
-            } else {
-                sectionEl.classList.add('hidden');
-                icon.classList.remove('fa-chevron-down');
-                icon.classList.add('fa-chevron-right');
-            }
-        }
-
-        function showParameterForm(punto, parametro, tipo) {
-            document.getElementById('pageTitle').textContent = parametro + ' - ' + punto;
-            document.getElementById('mainContent').innerHTML = `
-                <div class="max-w-2xl mx-auto">
-                    <div class="bg-white rounded-xl border border-gray-200 p-8">
-                        <div class="mb-6">
-                            <div class="flex items-center gap-3 mb-2">
-                                <span class="px-3 py-1 rounded-full text-sm font-medium ${
-                                    tipo === 'vapor' ? 'bg-orange-100 text-orange-700' :
-                                    tipo === 'agua' ? 'bg-blue-100 text-blue-700' :
-                                    'bg-green-100 text-green-700'
-                                }">${punto}</span>
-                                <i class="fas fa-chevron-right text-gray-400"></i>
-                                <span class="text-lg font-semibold text-gray-800">${parametro}</span>
-                            </div>
-                        </div>
-
-                        <form onsubmit="submitForm(event, '${punto}', '${parametro}', '${tipo}')" class="space-y-6">
-                            <div>
-                                <label class="block text-sm font-medium text-gray-700 mb-2">Fecha de medición</label>
-                                <input type="date" id="fecha" required 
-                                    value="${new Date().toISOString().split('T')[0]}"
-                                    class="w-full px-4 py-3 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500 focus:border-transparent">
-                            </div>
-
-                            <div>
-                                <label class="block text-sm font-medium text-gray-700 mb-2">Valor (${parametro})</label>
-                                <input type="text" id="dato" required placeholder="Ej: 150.5"
-                                    oninput="validateNumber(this)"
-                                    class="w-full px-4 py-3 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500 focus:border-transparent">
-                                <p class="mt-1 text-xs text-gray-500">Use punto (.) para decimales. No se permiten comas.</p>
-                            </div>
-
-                            <div>
-                                <label class="block text-sm font-medium text-gray-700 mb-2">Notas (opcional)</label>
-                                <textarea id="nota" rows="3" placeholder="Agregar observaciones..."
-                                    class="w-full px-4 py-3 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500 focus:border-transparent resize-none"></textarea>
-                            </div>
-
-                            <div class="flex gap-3">
-                                <button type="button" onclick="showView('home')"
-                                    class="flex-1 px-6 py-3 border border-gray-300 text-gray-700 rounded-lg hover:bg-gray-50 font-medium">
-                                    Cancelar
-                                </button>
-                                <button type="submit"
-                                    class="flex-1 px-6 py-3 bg-blue-600 text-white rounded-lg hover:bg-blue-700 font-medium">
-                                    Guardar Datos
-                                </button>
-                            </div>
-                        </form>
-                    </div>
-                </div>
-            `;
-        }
-
-        function validateNumber(input) {
-            let value = input.value;
-            value = value.replace(/,/g, '.');
-            value = value.replace(/[^0-9.]/g, '');
-            const parts = value.split('.');
-            if (parts.length > 2) {
-                value = parts[0] + '.' + parts.slice(1).join('');
-            }
-            input.value = value;
-        }
-
-        async function submitForm(event, punto, parametro, tipo) {
-            event.preventDefault();
-            
-            const fecha = document.getElementById('fecha').value;
-            const dato = document.getElementById('dato').value;
-            const nota = document.getElementById('nota').value;
-
-            const data = {
-                punto: punto,
-                parametro: parametro,
-                tipo: tipo,
-                fecha: fecha,
-                dato: parseFloat(dato),
-                nota: nota
-            };
-
-            try {
-                const response = await fetch('/api/guardar', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify(data)
-                });
-
-                const result = await response.json();
-                
-                if (result.success) {
-                    alert('✓ Datos guardados correctamente');
-                    showView('home');
-                } else {
-                    alert('Error: ' + result.message);
-                }
-            } catch (error) {
-                alert('Error de conexión: ' + error.message);
-            }
-        }
-
-        function showView(view) {
-            document.getElementById('pageTitle').textContent = 
-                view === 'home' ? 'Panel Principal' :
-                view === 'import' ? 'Importar Datos' :
-                view === 'export' ? 'Exportar Datos' :
-                'Base de Datos';
-            
-            // Implementar otras vistas aquí
-        }
-
-        // Cargar puntos al iniciar
-        window.onload = function() {
-            // Cargar vapor
-            const vaporSection = document.getElementById('section-vapor');
-            Object.keys(estructuraData.vapor).forEach(punto => {
-                const div = document.createElement('div');
-                div.innerHTML = `
-                    <button onclick="toggleSection('${punto}')" class="w-full flex items-center justify-between px-3 py-2 text-sm rounded-lg text-gray-600 hover:bg-gray-50">
-                        <span class="font-mono text-xs">${punto}</span>
-                        <i class="fas fa-chevron-right text-xs" id="icon-${punto}"></i>
-                    </button>
-                    <div id="section-${punto}" class="hidden ml-4 mt-1 space-y-1 border-l-2 border-orange-200 pl-3">
-                        ${estructuraData.vapor[punto].map(param => `
-                            <button onclick="showParameterForm('${punto}', '${param}', 'vapor')"
-                                class="w-full text-left text-xs text-gray-600 py-1.5 px-2 hover:bg-orange-50 hover:text-orange-600 rounded flex items-center justify-between group">
-                                <span>${param}</span>
-                                <i class="fas fa-plus text-xs opacity-0 group-hover:opacity-100"></i>
-                            </button>
-                        `).join('')}
-                    </div>
-                `;
-                vaporSection.appendChild(div);
-            });
-
-            // Cargar agua
-            const aguaSection = document.getElementById('section-agua');
-            Object.keys(estructuraData.agua).forEach(punto => {
-                const div = document.createElement('div');
-                div.innerHTML = `
-                    <button onclick="toggleSection('${punto}')" class="w-full flex items-center justify-between px-3 py-2 text-sm rounded-lg text-gray-600 hover:bg-gray-50">
-                        <span class="font-mono text-xs">${punto}</span>
-                        <i class="fas fa-chevron-right text-xs" id="icon-${punto}"></i>
-                    </button>
-                    <div id="section-${punto}" class="hidden ml-4 mt-1 space-y-1 border-l-2 border-blue-200 pl-3">
-                        ${estructuraData.agua[punto].map(param => `
-                            <button onclick="showParameterForm('${punto}', '${param}', 'agua')"
-                                class="w-full text-left text-xs text-gray-600 py-1.5 px-2 hover:bg-blue-50 hover:text-blue-600 rounded flex items-center justify-between group">
-                                <span>${param}</span>
-                                <i class="fas fa-plus text-xs opacity-0 group-hover:opacity-100"></i>
-                            </button>
-                        `).join('')}
-                    </div>
-                `;
-                aguaSection.appendChild(div);
-            });
-        };
-    </script>
-</body>
-</html>'''
+    return estaticos.respuesta('dashboard.html', request)
+
+@app.route('/static/<path:nombre>')
+def recurso_estatico(nombre):
+    """CSS, JS e iconos del dashboard, precomprimidos y con ETag"""
+    respuesta = estaticos.respuesta(nombre, request)
+    return respuesta if respuesta is not None else ('', 404)
+
+@app.route('/api/catalogo', methods=['GET'])
+def obtener_catalogo():
+    """Puntos de muestreo y parámetros (categoría -> tipo -> punto -> parámetros), con ETag"""
+    estructura, etag = db.catalogo.estructura()
+    cabeceras = {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'}
+    candidatos = {e.strip().removeprefix('W/').strip('"') for e in request.headers.get('If-None-Match', '').split(',')}
+    if etag and (etag in candidatos or '*' in candidatos):
+        return Response(status=304, headers=cabeceras)
+    return jsonify({'success': True, 'data': estructura}), 200, cabeceras
+
+@app.route('/api/catalogo', methods=['POST', 'DELETE'])
+def modificar_catalogo():
+    """Dar de alta (POST) o de baja (DELETE) puntos y parámetros.
+
+    Cuerpo: {"categoria", "tipo", "punto", "parametros": [...]} o una lista de ellos; en
+    DELETE, sin parámetros se da de baja el punto entero.
+    """
+    try:
+        entradas = request.get_json(silent=True)
+        if isinstance(entradas, dict):
+            entradas = [entradas]
+        if not isinstance(entradas, list) or not entradas:
+            return jsonify({'success': False, 'message': 'Envíe una entrada de catálogo o una lista'}), 400
+
+        if request.method == 'POST':
+            resultado = db.guardar_catalogo(entradas)
+        else:
+            resultado = db.eliminar_catalogo(entradas)
+        if not resultado['success']:
+            return jsonify(resultado), 500 if resultado['message'].startswith('Error') else 400
+        return jsonify(resultado)
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
 
 @app.route('/api/guardar', methods=['POST'])
 def guardar_medicion():
     """Endpoint para guardar una nueva medición"""
     try:
         datos = request.json
-        punto = datos.get('punto')
-        parametro = datos.get('parametro')
-        tipo = datos.get('tipo')
+        tipo, punto, parametro = normalizar(datos.get('tipo'), datos.get('punto'), datos.get('parametro'))
         fecha = datos.get('fecha')
         dato = datos.get('dato')
         nota = datos.get('nota')
@@ -491,63 +138,388 @@ def guardar_medicion():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/guardar/lote', methods=['POST'])
+def guardar_lote():
+    """Guardar varias mediciones en una transacción: array JSON, {"mediciones": [...]} o NDJSON.
+    
+    Con la cabecera Idempotency-Key, un reintento con el mismo contenido devuelve la
+    respuesta original sin duplicar filas.
+    """
+    try:
+        cuerpo = request.get_data()
+        if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+            items = [json.loads(linea) for linea in cuerpo.splitlines() if linea.strip()]
+        else:
+            items = json.loads(cuerpo or b'null')
+            if isinstance(items, dict):
+                items = items.get('mediciones')
+        if not isinstance(items, list) or not items:
+            return jsonify({'success': False, 'message': 'Envíe una lista de mediciones'}), 400
+        if len(items) > MAX_LOTE:
+            return jsonify({'success': False, 'message': f'Máximo {MAX_LOTE} mediciones por petición'}), 413
+        
+        clave = request.headers.get('Idempotency-Key')
+        if clave is not None and not 0 < len(clave) <= 255:
+            return jsonify({'success': False, 'message': 'Idempotency-Key no válida'}), 400
+        resultado = db.insertar_mediciones_lote(items, clave, hashlib.sha256(cuerpo).hexdigest())
+        
+        if resultado.get('conflicto'):
+            return jsonify(resultado), 422
+        if not resultado['success']:
+            return jsonify(resultado), 500
+        respuesta = jsonify(resultado)
+        if resultado.get('repetida'):
+            respuesta.headers['Idempotent-Replayed'] = 'true'
+        return respuesta
+    except ValueError as e:
+        # json.JSONDecodeError es un ValueError
+        return jsonify({'success': False, 'message': f'JSON no válido: {str(e)}'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @app.route('/api/importar', methods=['POST'])
 def importar_datos():
-    """Endpoint para importar datos desde Excel o TXT"""
+    """Endpoint para encolar una importación desde Excel o TXT.
+    
+    modo: 'omitir' (por defecto), 'sobrescribir' o 'duplicar' las filas cuya clave
+    tipo, punto, parametro, fecha ya existe. Un archivo idéntico a uno ya importado
+    no se procesa (salvo con modo 'duplicar').
+    """
     try:
         file = request.files.get('file')
         categoria = request.form.get('categoria')
         tipo = request.form.get('tipo')
+        modo = request.form.get('modo', 'omitir')
         
         if not file or not categoria:
             return jsonify({'success': False, 'message': 'Archivo o categoría no proporcionados'}), 400
+        if modo not in MODOS_IMPORTACION:
+            return jsonify({'success': False, 'message': f"modo debe ser {', '.join(MODOS_IMPORTACION)}"}), 400
         
-        if tipo == 'excel':
-            resultado = importador.procesar_excel(file, categoria)
-        else:
-            resultado = importador.procesar_txt(file, categoria)
+        formato = 'excel' if tipo == 'excel' else 'txt'
+        if db.embebida:
+            # Sin cola en la base embebida: se importa en la propia petición
+            huella = huella_archivo(file.stream)
+            previo = db.buscar_archivo_importado(categoria, huella) if modo != 'duplicar' else None
+            if previo:
+                return jsonify({
+                    'success': True,
+                    'omitido': True,
+                    'message': f"Archivo ya importado el {previo['creado']:%Y-%m-%d %H:%M} "
+                               f"({previo['filas']} filas): no se vuelve a importar",
+                    'huella': huella
+                })
+            if formato == 'excel':
+                resultado = importador.procesar_excel(file, categoria, modo=modo)
+            else:
+                resultado = importador.procesar_txt(file, categoria, modo=modo)
+            if resultado['success']:
+                filas = resultado['insertados'] + resultado['actualizados'] + resultado['omitidos']
+                db.registrar_archivo_importado(categoria, huella, file.filename, filas)
+            return jsonify(resultado), 200 if resultado['success'] else 400
+        resultado = importaciones.encolar(file, categoria, formato, nombre_archivo=file.filename, modo=modo)
         
-        if resultado['success']:
+        if resultado.get('omitido'):
             return jsonify(resultado)
+        if resultado['success']:
+            resultado['estado_url'] = f"/api/importaciones/{resultado['id']}"
+            return jsonify(resultado), 202
         else:
-            return jsonify(resultado), 400
+            return jsonify(resultado), 500
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
 
+@app.route('/api/importaciones', methods=['GET'])
+def listar_importaciones():
+    """Listar las últimas importaciones"""
+    try:
+        limite = min(int(request.args.get('limite', 50)), 500)
+        return jsonify(importaciones.listar(limite))
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/importaciones/<id_trabajo>', methods=['GET'])
+def estado_importacion(id_trabajo):
+    """Estado, progreso y errores de una importación"""
+    try:
+        resultado = importaciones.obtener(id_trabajo)
+        if resultado['success']:
+            return jsonify(resultado)
+        return jsonify(resultado), 404
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/importaciones/<id_trabajo>/cancelar', methods=['POST'])
+def cancelar_importacion(id_trabajo):
+    """Cancelar una importación en cola o en curso"""
+    try:
+        resultado = importaciones.cancelar(id_trabajo)
+        if resultado['success']:
+            return jsonify(resultado)
+        return jsonify(resultado), 409 if 'finalizado' in resultado['message'] else 404
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+def _filtros_consulta(args=None):
+    """Filtros de mediciones desde la query string (punto, parametro, tipo, fecha_inicio, fecha_fin)"""
+    args = request.args if args is None else args
+    filtros = {}
+    for campo in ('punto', 'parametro', 'tipo'):
+        if args.get(campo):
+            filtros[campo] = args[campo]
+    for campo in ('fecha_inicio', 'fecha_fin'):
+        if args.get(campo):
+            try:
+                filtros[campo] = date.fromisoformat(args[campo])
+            except ValueError:
+                raise ValueError(f'{campo} debe tener formato AAAA-MM-DD')
+    return filtros
+
+def _campos_consulta(args=None):
+    """Columnas pedidas con ?campos=fecha,dato (todas si no se indica)"""
+    campos = (request.args if args is None else args).get('campos')
+    return [c.strip() for c in campos.split(',') if c.strip()] if campos else None
+
+def _json_en_streaming(filas):
+    """Serializar filas como {"data": [...], "success": ...} a medida que llegan del cursor"""
+    yield '{"data": ['
+    try:
+        for i, fila in enumerate(filas):
+            yield (',' if i else '') + app.json.dumps(fila)
+        yield '], "success": true}'
+    except Exception as e:
+        # La cabecera 200 ya se envió: el error viaja al final del propio JSON
+        yield '], "success": false, "message": ' + app.json.dumps(f'Error: {str(e)}') + '}'
+
 @app.route('/api/obtener/<categoria>', methods=['GET'])
 def obtener_mediciones(categoria):
-    """Obtener todas las mediciones de una categoría"""
+    """Obtener mediciones de una categoría con filtros, paginación por cursor o en streaming"""
+    try:
+        filtros = _filtros_consulta()
+        campos = _campos_consulta()
+        cursor = request.args.get('cursor')
+        
+        if request.args.get('stream', '').lower() in ('1', 'true', 'si'):
+            filas = db.iterar_mediciones(categoria, filtros, campos, cursor)
+            return Response(stream_with_context(_json_en_streaming(filas)), mimetype='application/json')
+        
+        limite = min(int(request.args.get('limite', LIMITE_PAGINA)), LIMITE_PAGINA_MAX)
+        resultado = db.obtener_mediciones(categoria, filtros, limite=limite, cursor=cursor, campos=campos)
+        if resultado['success']:
+            return jsonify(resultado)
+        return jsonify(resultado), 400
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/exportar/<categoria>', methods=['GET'])
+def exportar_datos(categoria):
+    """Exportar mediciones en CSV, XLSX o Parquet en streaming (opcionalmente con gzip)"""
     try:
-        resultado = db.obtener_mediciones(categoria)
+        formato = request.args.get('formato', 'csv').lower()
+        comprimir = request.args.get('gzip', '').lower() in ('1', 'true', 'si')
+        contenido = exportador.exportar(
+            categoria, formato, _filtros_consulta(), _campos_consulta(), comprimir=comprimir
+        )
+        
+        mimetype, extension = FORMATOS[formato]
+        nombre = f"mediciones_{categoria}_{date.today().isoformat()}.{extension}"
+        headers = {'Content-Disposition': f'attachment; filename="{nombre}"'}
+        if comprimir:
+            headers['Content-Encoding'] = 'gzip'
+        return Response(stream_with_context(contenido), mimetype=mimetype, headers=headers)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/series/<categoria>', methods=['GET'])
+def obtener_series(categoria):
+    """Series reducidas para gráficos: ?serie=PA006:CONDUCTIVIDAD[:agua]&serie=...&puntos=600&metodo=lttb"""
+    try:
+        series = []
+        for texto in request.args.getlist('serie'):
+            partes = [p.strip() for p in texto.split(':')]
+            if len(partes) not in (2, 3) or not all(partes):
+                raise ValueError(f"Serie no válida '{texto}': use punto:parametro[:tipo]")
+            serie = {'punto': partes[0], 'parametro': partes[1].upper()}
+            if len(partes) == 3:
+                serie['tipo'] = partes[2].lower()
+            series.append(serie)
+        if not series:
+            raise ValueError('Indique al menos una serie con ?serie=punto:parametro')
+        if len(series) > MAX_SERIES:
+            raise ValueError(f'Máximo {MAX_SERIES} series por petición')
+        
+        filtros = _filtros_consulta()
+        max_puntos = min(max(int(request.args.get('puntos', PUNTOS_SERIE)), 3), PUNTOS_SERIE_MAX)
+        resultado = db.obtener_series(
+            categoria,
+            series,
+            fecha_inicio=filtros.get('fecha_inicio'),
+            fecha_fin=filtros.get('fecha_fin'),
+            max_puntos=max_puntos,
+            metodo=request.args.get('metodo', 'lttb').lower()
+        )
+        if resultado['success']:
+            return jsonify(resultado)
+        return jsonify(resultado), 400
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/matriz/<categoria>', methods=['GET'])
+def obtener_matriz(categoria):
+    """Matriz fecha × parámetro de un punto: ?punto=PA006&fecha_inicio=...&agregado=promedio&formato=json|csv
+    (columnas del catálogo o ?parametros=PH,TOC)"""
+    try:
+        filtros = _filtros_consulta()
+        if not filtros.get('punto'):
+            raise ValueError('Indique el punto con ?punto=')
+        formato = request.args.get('formato', 'json').lower()
+        if formato not in ('json', 'csv'):
+            raise ValueError(f'Formato no soportado: {formato}')
+        parametros = request.args.get('parametros')
+        parametros = [p.strip().upper() for p in parametros.split(',') if p.strip()] if parametros else None
+
+        resultado = db.obtener_matriz(
+            categoria,
+            filtros['punto'],
+            tipo=filtros.get('tipo'),
+            parametros=parametros,
+            fecha_inicio=filtros.get('fecha_inicio'),
+            fecha_fin=filtros.get('fecha_fin'),
+            agregado=request.args.get('agregado', 'promedio').lower()
+        )
+        if not resultado['success']:
+            return jsonify(resultado), 400
+        if formato == 'csv':
+            nombre = f"matriz_{categoria}_{filtros['punto']}_{date.today().isoformat()}.csv"
+            return Response(
+                stream_with_context(exportador.matriz_csv(resultado)),
+                mimetype=FORMATOS['csv'][0],
+                headers={'Content-Disposition': f'attachment; filename="{nombre}"'}
+            )
         return jsonify(resultado)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @app.route('/api/estadisticas/<categoria>', methods=['GET'])
 def obtener_estadisticas(categoria):
-    """Obtener estadísticas de una categoría"""
+    """Obtener estadísticas de una categoría (opcionalmente de un punto/parámetro y rango de fechas)"""
     try:
-        resultado = db.obtener_estadisticas(categoria)
+        filtros = _filtros_consulta()
+        resultado = db.obtener_estadisticas(
+            categoria,
+            punto=filtros.get('punto'),
+            parametro=filtros.get('parametro'),
+            fecha_inicio=filtros.get('fecha_inicio'),
+            fecha_fin=filtros.get('fecha_fin')
+        )
         return jsonify(resultado)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/estadisticas/<categoria>/grupos', methods=['GET'])
+def obtener_estadisticas_agrupadas(categoria):
+    """Estadísticas de todos los puntos y parámetros de una categoría en una sola consulta"""
+    try:
+        filtros = _filtros_consulta()
+        resultado = db.obtener_estadisticas_agrupadas(
+            categoria,
+            fecha_inicio=filtros.get('fecha_inicio'),
+            fecha_fin=filtros.get('fecha_fin'),
+            tipo=filtros.get('tipo')
+        )
+        if resultado['success']:
+            return jsonify(resultado)
+        return jsonify(resultado), 400
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/spc/<categoria>/estado', methods=['GET'])
+def estado_spc(categoria):
+    """Estado SPC y límites de control de las series (?punto=&parametro=)"""
+    try:
+        resultado = db.obtener_estado_spc(
+            categoria,
+            punto=request.args.get('punto'),
+            parametro=request.args.get('parametro')
+        )
+        if resultado['success']:
+            return jsonify(resultado)
+        return jsonify(resultado), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/spc/<categoria>/eventos', methods=['GET'])
+def eventos_spc(categoria):
+    """Eventos fuera de control o de especificación (?punto=&parametro=&regla=&antes_de=&limite=)"""
+    try:
+        resultado = db.obtener_eventos_spc(
+            categoria,
+            punto=request.args.get('punto'),
+            parametro=request.args.get('parametro'),
+            regla=request.args.get('regla'),
+            antes_de=request.args.get('antes_de'),
+            limite=min(int(request.args.get('limite', 100)), LIMITE_PAGINA_MAX)
+        )
+        if resultado['success']:
+            return jsonify(resultado)
+        return jsonify(resultado), 400
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/spc/<categoria>/limites', methods=['PUT'])
+def limites_especificacion(categoria):
+    """Guardar límites de especificación: {punto, parametro, limite_inferior, limite_superior}"""
+    try:
+        datos = request.json or {}
+        if not datos.get('punto') or not datos.get('parametro'):
+            return jsonify({'success': False, 'message': 'Faltan punto o parametro'}), 400
+        resultado = db.guardar_limites_especificacion(
+            categoria,
+            datos['punto'],
+            datos['parametro'].upper(),
+            limite_inferior=datos.get('limite_inferior'),
+            limite_superior=datos.get('limite_superior')
+        )
+        if resultado['success']:
+            return jsonify(resultado)
+        return jsonify(resultado), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas en formato de texto de Prometheus (agregadas entre los workers de gunicorn)"""
+    metricas.actualizar_pool()
+    return Response(metricas.exponer(), content_type=metricas.CONTENT_TYPE)
+
 @app.route('/health', methods=['GET'])
 def health():
     """Verificar estado del servidor"""
     try:
-        conn = db.get_connection()
-        if conn:
-            conn.close()
-            db_status = "conectada"
-        else:
-            db_status = "desconectada"
+        with db.conexion() as conn:
+            db_status = "conectada" if conn else "desconectada"
         
         return jsonify({
             'status': 'OK',
             'message': 'Servidor funcionando',
-            'database': db_status
+            'database': db_status,
+            'pool': db.estadisticas_pool(),
+            'cache': db.estadisticas_cache()
         })
     except:
         return jsonify({'status': 'OK', 'database': 'error'})
@@ -555,6 +527,9 @@ def health():
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     
+    # Servidor de desarrollo: un solo proceso, se puede migrar directamente
+    db.init_database()
+    
     print("=" * 60)
     print("🚀 SERVIDOR INICIADO")
     print(f"📍 Puerto: {port}")
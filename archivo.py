@@ -0,0 +1,380 @@
+"""Archivo histórico de mediciones en Parquet (almacenamiento frío).
+
+`python gestion.py archivar` mueve las mediciones con fecha anterior al corte
+(ARCHIVO_MESES meses atrás, 24 por defecto) a archivos Parquet comprimidos con
+zstd, uno por categoría, tipo, punto y año y por ejecución:
+
+    ARCHIVO_DIR/fisicoquimica/tipo=agua/punto=PA1/anio=2021/<uuid>.parquet
+
+ARCHIVO_DIR es obligatorio y debe apuntar a almacenamiento persistente y
+compartido por todas las réplicas (un volumen montado o un recurso de red), nunca
+al sistema de archivos del contenedor: las filas archivadas se borran de Postgres
+y deben conservarse 5 años. Sin ARCHIVO_DIR no se archiva nada. Antes de borrar,
+cada archivo escrito se vuelve a leer y se comprueba que contiene exactamente las
+filas que se van a borrar.
+
+La tabla archivo_manifiesto guarda cada archivo con su rango de fechas. Las
+consultas de DatabaseManager la miran primero y solo leen los archivos cuyo
+tipo, punto y rango de fechas pueden contener filas de la consulta; dentro de
+cada archivo se leen solo las columnas pedidas y los filtros se aplican con las
+estadísticas de cada grupo de filas (las filas van ordenadas por parametro y fecha).
+
+Los resúmenes diarios conservan las filas archivadas: el borrado se hace con
+pharma.archivando = 'on' y el trigger de bajas no recalcula esos días, así que
+obtener_estadisticas sigue sin leer Parquet. Las funciones reciben una conexión
+o un cursor y dejan la transacción a quien las llama, salvo archivar(), que
+confirma archivo a archivo.
+"""
+import os
+import uuid
+from datetime import date, datetime
+from urllib.parse import quote
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # sin pyarrow no se puede archivar ni leer el archivo
+    pa = pc = ds = pq = None
+
+CARPETA_ARCHIVO = os.environ.get('ARCHIVO_DIR') or None
+MESES_ARCHIVO = int(os.environ.get('ARCHIVO_MESES', 24))
+FILAS_POR_GRUPO = int(os.environ.get('ARCHIVO_FILAS_GRUPO', 50000))
+IDS_POR_BORRADO = 10000
+
+COLUMNAS = ('id', 'tipo', 'punto', 'parametro', 'fecha', 'dato', 'nota', 'timestamp')
+ORDEN_DESC = [('fecha', 'descending'), ('timestamp', 'descending'), ('id', 'descending')]
+
+
+def _esquema():
+    return pa.schema([
+        ('id', pa.int64()),
+        ('tipo', pa.string()),
+        ('punto', pa.string()),
+        ('parametro', pa.string()),
+        ('fecha', pa.date32()),
+        ('dato', pa.decimal128(10, 4)),
+        ('nota', pa.string()),
+        ('timestamp', pa.timestamp('us')),
+    ])
+
+
+def _requiere_pyarrow():
+    if pa is None:
+        raise RuntimeError('El archivo histórico necesita pyarrow (pip install pyarrow)')
+
+
+def _carpeta():
+    """Carpeta del archivo; sin ARCHIVO_DIR no se lee ni se escribe en ningún sitio por defecto"""
+    if not CARPETA_ARCHIVO:
+        raise RuntimeError(
+            'ARCHIVO_DIR no está definido: debe apuntar a almacenamiento persistente compartido por las réplicas'
+        )
+    return CARPETA_ARCHIVO
+
+
+def fecha_corte(meses=None, hoy=None):
+    """Primer día del mes de hace `meses` meses: lo anterior se archiva"""
+    meses = MESES_ARCHIVO if meses is None else int(meses)
+    hoy = hoy or date.today()
+    total = hoy.year * 12 + hoy.month - 1 - meses
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def consulta_archivos(categoria, filtros=None, clave=None):
+    """(sql, params) de los archivos del manifiesto que pueden tener filas de la consulta, año más reciente primero"""
+    filtros = filtros or {}
+    condiciones = ['categoria = %s']
+    params = [categoria]
+    for campo in ('tipo', 'punto'):
+        if filtros.get(campo):
+            condiciones.append(f'{campo} = %s')
+            params.append(filtros[campo])
+    if filtros.get('fecha_inicio'):
+        condiciones.append('fecha_max >= %s')
+        params.append(filtros['fecha_inicio'])
+    if filtros.get('fecha_fin'):
+        condiciones.append('fecha_min <= %s')
+        params.append(filtros['fecha_fin'])
+    if clave:
+        condiciones.append('fecha_min <= %s')
+        params.append(clave[0])
+    return f'''
+        SELECT anio, ruta FROM archivo_manifiesto
+        WHERE {' AND '.join(condiciones)}
+        ORDER BY anio DESC, ruta
+    ''', params
+
+
+def archivos(cur, categoria, filtros=None, clave=None):
+    """Lista de (anio, ruta) del manifiesto para una consulta (vacía si no hay nada archivado)"""
+    cur.execute(*consulta_archivos(categoria, filtros, clave))
+    return [(fila[0], fila[1]) for fila in cur.fetchall()]
+
+
+def _filtro(filtros=None, clave=None):
+    """Expresión de pyarrow equivalente al WHERE de la consulta de mediciones"""
+    filtros = filtros or {}
+    expresion = None
+    condiciones = []
+    for campo in ('tipo', 'punto', 'parametro'):
+        if filtros.get(campo):
+            condiciones.append(ds.field(campo) == filtros[campo])
+    if filtros.get('fecha_inicio'):
+        condiciones.append(ds.field('fecha') >= _fecha(filtros['fecha_inicio']))
+    if filtros.get('fecha_fin'):
+        condiciones.append(ds.field('fecha') <= _fecha(filtros['fecha_fin']))
+    if clave:
+        # (fecha, timestamp, id) < clave, como la paginación por clave en SQL
+        fecha, marca_tiempo, id = clave
+        marca_tiempo = pa.scalar(marca_tiempo or datetime.min, pa.timestamp('us'))
+        condiciones.append(
+            (ds.field('fecha') < fecha)
+            | ((ds.field('fecha') == fecha) & (ds.field('timestamp') < marca_tiempo))
+            | ((ds.field('fecha') == fecha) & (ds.field('timestamp') == marca_tiempo) & (ds.field('id') < id))
+        )
+    for condicion in condiciones:
+        expresion = condicion if expresion is None else expresion & condicion
+    return expresion
+
+
+def _fecha(valor):
+    return valor if isinstance(valor, date) else date.fromisoformat(str(valor)[:10])
+
+
+def leer_tabla(rutas, columnas, filtros=None, clave=None):
+    """Tabla de pyarrow con las columnas pedidas de las filas que cumplen los filtros"""
+    _requiere_pyarrow()
+    carpeta = _carpeta()
+    dataset = ds.dataset(
+        [os.path.join(carpeta, ruta) for ruta in rutas], schema=_esquema(), format='parquet'
+    )
+    return dataset.to_table(columns=list(columnas), filter=_filtro(filtros, clave))
+
+
+def iterar(archivos_consulta, columnas, filtros=None, clave=None):
+    """Filas archivadas (dicts) en orden fecha DESC, timestamp DESC, id DESC.
+
+    Los archivos de años distintos no se solapan, así que se leen año a año del
+    más reciente al más antiguo: la memoria depende de un año, no del archivo entero,
+    y quien pare al completar una página no lee los años anteriores.
+    """
+    columnas = list(dict.fromkeys(list(columnas) + ['fecha', 'timestamp', 'id']))
+    por_anio = {}
+    for anio, ruta in archivos_consulta:
+        por_anio.setdefault(anio, []).append(ruta)
+    for anio in sorted(por_anio, reverse=True):
+        tabla = leer_tabla(por_anio[anio], columnas, filtros, clave).sort_by(ORDEN_DESC)
+        for lote in tabla.to_batches():
+            yield from lote.to_pylist()
+
+
+def leer_serie(archivos_consulta, filtros=None):
+    """(dias desde 1970, dato) de las filas archivadas de una serie, en orden cronológico"""
+    rutas = [ruta for _, ruta in archivos_consulta]
+    tabla = leer_tabla(rutas, ('fecha', 'timestamp', 'id', 'dato'), filtros).sort_by(
+        [('fecha', 'ascending'), ('timestamp', 'ascending'), ('id', 'ascending')]
+    )
+    dias = pc.cast(tabla['fecha'], pa.int32()).to_numpy(zero_copy_only=False).astype('float64')
+    # decimal -> float64 directo no redondea al double más cercano (7.2 saldría 7.200000000000001)
+    datos = pc.cast(pc.cast(tabla['dato'], pa.string()), pa.float64()).to_numpy(zero_copy_only=False)
+    return dias, datos
+
+
+def leer_series(archivos_consulta, filtros=None):
+    """{parametro: [(fecha, dato, tipo, id), ...]} de las filas archivadas, cada serie en orden cronológico"""
+    rutas = [ruta for _, ruta in archivos_consulta]
+    tabla = leer_tabla(rutas, ('tipo', 'parametro', 'fecha', 'timestamp', 'id', 'dato'), filtros).sort_by(
+        [('parametro', 'ascending'), ('fecha', 'ascending'), ('timestamp', 'ascending'), ('id', 'ascending')]
+    )
+    datos = pc.cast(pc.cast(tabla['dato'], pa.string()), pa.float64()).to_pylist()
+    series = {}
+    for parametro, fecha, dato, tipo, id in zip(
+        tabla['parametro'].to_pylist(), tabla['fecha'].to_pylist(), datos,
+        tabla['tipo'].to_pylist(), tabla['id'].to_pylist()
+    ):
+        series.setdefault(parametro, []).append((fecha, dato, tipo, id))
+    return series
+
+
+def _agregados(archivos_consulta, claves, filtros=None, parametros=None, valores=False):
+    """{clave: agregados} de las filas archivadas agrupadas por `claves`, para combinarlos con los de la tabla.
+
+    Cada grupo trae n, suma y suma_cuadrados (Decimal exactos), minimo, maximo y la primera y
+    la última fila en orden cronológico como (fecha, timestamp, id, dato); con valores=True,
+    también los datos (float) para los percentiles.
+    """
+    rutas = [ruta for _, ruta in archivos_consulta]
+    if not rutas:
+        return {}
+    columnas = list(dict.fromkeys(list(claves) + ['fecha', 'timestamp', 'id', 'dato']))
+    tabla = leer_tabla(rutas, columnas, filtros)
+    if parametros is not None:
+        tabla = tabla.filter(pc.is_in(tabla['parametro'], value_set=pa.array(list(parametros), pa.string())))
+    # Sin timestamp la fila va la primera del día, como en la paginación
+    marca = pc.fill_null(tabla['timestamp'], pa.scalar(datetime.min, pa.timestamp('us')))
+    tabla = tabla.set_column(tabla.schema.get_field_index('timestamp'), 'timestamp', marca)
+    tabla = tabla.sort_by([('fecha', 'ascending'), ('timestamp', 'ascending'), ('id', 'ascending')])
+    tabla = tabla.append_column('cuadrado', pc.multiply(tabla['dato'], tabla['dato']))
+    tabla = tabla.append_column('fila', pa.array(range(len(tabla)), pa.int64()))
+    agregaciones = [
+        ('dato', 'count'), ('dato', 'sum'), ('cuadrado', 'sum'), ('dato', 'min'), ('dato', 'max'),
+        ('fila', 'first'), ('fila', 'last'),
+    ]
+    if valores:
+        tabla = tabla.append_column('valor', pc.cast(pc.cast(tabla['dato'], pa.string()), pa.float64()))
+        agregaciones.append(('valor', 'list'))
+    # use_threads=False conserva el orden cronológico dentro de cada grupo para first/last
+    agregada = tabla.group_by(list(claves), use_threads=False).aggregate(agregaciones).to_pylist()
+
+    def fila(i):
+        return tuple(tabla[c][i].as_py() for c in ('fecha', 'timestamp', 'id', 'dato'))
+
+    resultado = {}
+    for grupo in agregada:
+        agregados = {
+            'n': grupo['dato_count'],
+            'suma': grupo['dato_sum'],
+            'suma_cuadrados': grupo['cuadrado_sum'],
+            'minimo': grupo['dato_min'],
+            'maximo': grupo['dato_max'],
+            'primera': fila(grupo['fila_first']),
+            'ultima': fila(grupo['fila_last']),
+        }
+        if valores:
+            agregados['valores'] = grupo['valor_list']
+        resultado[tuple(grupo[c] for c in claves)] = agregados
+    return resultado
+
+
+def agregados_grupos(archivos_consulta, filtros=None):
+    """{(tipo, punto, parametro): agregados} de las filas archivadas, con los datos para los percentiles"""
+    return _agregados(archivos_consulta, ('tipo', 'punto', 'parametro'), filtros, valores=True)
+
+
+def agregados_celdas(archivos_consulta, filtros=None, parametros=None):
+    """{(fecha, parametro): agregados} de las filas archivadas de los parámetros pedidos"""
+    return _agregados(archivos_consulta, ('fecha', 'parametro'), filtros, parametros)
+
+
+def resumen_diario(archivos_consulta):
+    """Agregados diarios (tipo, punto, parametro, fecha, n, suma, suma_cuadrados, minimo, maximo) del archivo"""
+    rutas = [ruta for _, ruta in archivos_consulta]
+    if not rutas:
+        return []
+    tabla = leer_tabla(rutas, ('tipo', 'punto', 'parametro', 'fecha', 'dato'))
+    tabla = tabla.append_column('cuadrado', pc.multiply(tabla['dato'], tabla['dato']))
+    agregada = tabla.group_by(['tipo', 'punto', 'parametro', 'fecha']).aggregate([
+        ('dato', 'count'), ('dato', 'sum'), ('cuadrado', 'sum'), ('dato', 'min'), ('dato', 'max'),
+    ])
+    columnas = ('tipo', 'punto', 'parametro', 'fecha', 'dato_count', 'dato_sum', 'cuadrado_sum', 'dato_min', 'dato_max')
+    return list(zip(*(agregada[c].to_pylist() for c in columnas)))
+
+
+def _ruta(categoria, tipo, punto, anio):
+    return os.path.join(
+        categoria, f'tipo={quote(tipo, safe="")}', f'punto={quote(punto, safe="")}', f'anio={anio}',
+        f'{uuid.uuid4().hex}.parquet'
+    )
+
+
+def _comprobar_archivo(ruta, ids):
+    """Releer un archivo recién escrito y fallar si no contiene exactamente las filas `ids`"""
+    with open(ruta, 'rb') as f:
+        os.fsync(f.fileno())
+    archivo_parquet = pq.ParquetFile(ruta)
+    filas = archivo_parquet.metadata.num_rows
+    if filas != len(ids):
+        raise RuntimeError(f'{ruta}: el archivo tiene {filas} filas y se iban a borrar {len(ids)}')
+    leidos = archivo_parquet.read(columns=['id'])['id'].to_pylist()
+    if sorted(leidos) != sorted(ids):
+        raise RuntimeError(f'{ruta}: los ids del archivo no coinciden con las filas a borrar')
+
+
+def archivar(conn, categoria, tabla, corte):
+    """Mover a Parquet las filas con fecha < corte; cada archivo se confirma en su propia transacción.
+
+    Devuelve {'archivos': n, 'filas': n, 'bytes': n}.
+    """
+    _requiere_pyarrow()
+    carpeta = _carpeta()
+    esquema = _esquema()
+    cur = conn.cursor()
+    cur.execute(f'''
+        SELECT tipo, punto, EXTRACT(YEAR FROM fecha)::int AS anio
+        FROM {tabla}
+        WHERE fecha < %s
+        GROUP BY 1, 2, 3
+        ORDER BY 3, 1, 2
+    ''', (corte,))
+    grupos = cur.fetchall()
+    conn.commit()
+
+    total = {'archivos': 0, 'filas': 0, 'bytes': 0}
+    for tipo, punto, anio in grupos:
+        desde = date(anio, 1, 1)
+        hasta = min(date(anio + 1, 1, 1), corte)
+        relativa = _ruta(categoria, tipo, punto, anio)
+        ruta = os.path.join(carpeta, relativa)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        try:
+            # El trigger de bajas no toca los resúmenes diarios: las filas siguen contando
+            cur.execute("SET LOCAL pharma.archivando = 'on'")
+            lector = conn.cursor(name=f'archivo_{uuid.uuid4().hex}')
+            lector.itersize = FILAS_POR_GRUPO
+            lector.execute(f'''
+                SELECT {', '.join(COLUMNAS)}
+                FROM {tabla}
+                WHERE tipo = %s AND punto = %s AND fecha >= %s AND fecha < %s
+                ORDER BY parametro, fecha, timestamp, id
+            ''', (tipo, punto, desde, hasta))
+
+            ids = []
+            fecha_min = fecha_max = None
+            with pq.ParquetWriter(ruta, esquema, compression='zstd') as writer:
+                while True:
+                    filas = lector.fetchmany(FILAS_POR_GRUPO)
+                    if not filas:
+                        break
+                    columnas = list(zip(*filas))
+                    writer.write_table(pa.Table.from_arrays(
+                        [pa.array(valores, type=campo.type) for valores, campo in zip(columnas, esquema)],
+                        schema=esquema
+                    ))
+                    ids.extend(columnas[0])
+                    fecha_min = min(columnas[4]) if fecha_min is None else min(fecha_min, min(columnas[4]))
+                    fecha_max = max(columnas[4]) if fecha_max is None else max(fecha_max, max(columnas[4]))
+            lector.close()
+
+            if not ids:
+                os.remove(ruta)
+                conn.rollback()
+                continue
+
+            # Las filas solo se borran si el archivo en disco las contiene todas
+            _comprobar_archivo(ruta, ids)
+
+            for inicio in range(0, len(ids), IDS_POR_BORRADO):
+                cur.execute(
+                    f'DELETE FROM {tabla} WHERE fecha >= %s AND fecha < %s AND id = ANY(%s)',
+                    (desde, hasta, ids[inicio:inicio + IDS_POR_BORRADO])
+                )
+            tamano = os.path.getsize(ruta)
+            cur.execute('''
+                INSERT INTO archivo_manifiesto (categoria, tipo, punto, anio, ruta, filas, fecha_min, fecha_max, bytes)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ''', (categoria, tipo, punto, anio, relativa, len(ids), fecha_min, fecha_max, tamano))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            # Sin entrada en el manifiesto el archivo no se lee, pero no se deja basura
+            if os.path.exists(ruta):
+                os.remove(ruta)
+            raise
+
+        total['archivos'] += 1
+        total['filas'] += len(ids)
+        total['bytes'] += tamano
+    cur.close()
+    return total
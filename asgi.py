@@ -0,0 +1,156 @@
+"""Modo ASGI: lecturas concurrentes sin bloquear un worker por consulta.
+
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker --workers 2
+
+Las rutas más consultadas desde el dashboard (/api/obtener sin stream,
+/api/estadisticas y /api/guardar) se atienden de forma nativa con
+DatabaseManagerAsync; el resto de rutas de app.py se sirven a través de un
+adaptador WSGI con su propio pool de hilos. El contrato JSON (cuerpo, códigos de
+estado y CORS) es el mismo que en el modo WSGI.
+"""
+import json
+import os
+import re
+import time
+from urllib.parse import parse_qsl
+
+from a2wsgi import WSGIMiddleware
+
+from app import app as flask_app, db, _filtros_consulta, _campos_consulta, LIMITE_PAGINA, LIMITE_PAGINA_MAX
+from database_async import DatabaseManagerAsync
+import metricas
+
+HILOS_WSGI = int(os.environ.get('ASGI_HILOS_WSGI', 10))
+
+db_async = DatabaseManagerAsync(db)
+wsgi = WSGIMiddleware(flask_app, workers=HILOS_WSGI)
+
+
+async def obtener_mediciones(categoria, args, cuerpo):
+    filtros = _filtros_consulta(args)
+    campos = _campos_consulta(args)
+    limite = min(int(args.get('limite', LIMITE_PAGINA)), LIMITE_PAGINA_MAX)
+    resultado = await db_async.obtener_mediciones(
+        categoria, filtros, limite=limite, cursor=args.get('cursor'), campos=campos
+    )
+    return resultado, 200 if resultado['success'] else 400
+
+
+async def obtener_estadisticas(categoria, args, cuerpo):
+    filtros = _filtros_consulta(args)
+    resultado = await db_async.obtener_estadisticas(
+        categoria,
+        punto=filtros.get('punto'),
+        parametro=filtros.get('parametro'),
+        fecha_inicio=filtros.get('fecha_inicio'),
+        fecha_fin=filtros.get('fecha_fin')
+    )
+    return resultado, 200
+
+
+async def guardar_medicion(categoria, args, cuerpo):
+    datos = json.loads(cuerpo)
+    tipo = datos.get('tipo')
+    resultado = await db_async.insertar_medicion(
+        categoria='fisicoquimica' if tipo in ('vapor', 'agua') else 'microbiologia',
+        tipo=tipo,
+        punto=datos.get('punto'),
+        parametro=datos.get('parametro'),
+        fecha=datos.get('fecha'),
+        dato=datos.get('dato'),
+        nota=datos.get('nota')
+    )
+    return resultado, 200
+
+
+# (método, patrón de ruta, manejador); lo que no encaja pasa a Flask
+RUTAS = [
+    ('GET', re.compile(r'^/api/obtener/([^/]+)$'), obtener_mediciones),
+    ('GET', re.compile(r'^/api/estadisticas/([^/]+)$'), obtener_estadisticas),
+    ('POST', re.compile(r'^/api/guardar()$'), guardar_medicion),
+]
+# Misma etiqueta de ruta que en Flask (la plantilla de url_rule)
+PLANTILLAS = {
+    obtener_mediciones: '/api/obtener/<categoria>',
+    obtener_estadisticas: '/api/estadisticas/<categoria>',
+    guardar_medicion: '/api/guardar',
+}
+
+
+def _buscar_ruta(scope, args):
+    for metodo, patron, manejador in RUTAS:
+        m = patron.match(scope['path'])
+        if m and scope['method'] == metodo:
+            # El streaming de /api/obtener sigue en Flask (generador sobre cursor con nombre)
+            if manejador is obtener_mediciones and args.get('stream', '').lower() in ('1', 'true', 'si'):
+                return None, None
+            return manejador, m.group(1)
+    return None, None
+
+
+async def _leer_cuerpo(receive):
+    partes = []
+    while True:
+        mensaje = await receive()
+        partes.append(mensaje.get('body', b''))
+        if not mensaje.get('more_body'):
+            return b''.join(partes)
+
+
+async def _responder(send, resultado, estado):
+    # Mismo formato que jsonify (compacto, claves ordenadas, salto de línea final)
+    cuerpo = (flask_app.json.dumps(resultado, separators=(',', ':')) + '\n').encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': estado,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(cuerpo)).encode()),
+            (b'access-control-allow-origin', b'*'),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': cuerpo})
+
+
+async def _lifespan(receive, send):
+    while True:
+        mensaje = await receive()
+        if mensaje['type'] == 'lifespan.startup':
+            try:
+                if not db.embebida:
+                    await db_async.abrir()
+            except Exception as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif mensaje['type'] == 'lifespan.shutdown':
+            await db_async.cerrar()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """Aplicación ASGI"""
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    args = {}
+    for clave, valor in parse_qsl(scope.get('query_string', b'').decode('utf-8', 'replace')):
+        args.setdefault(clave, valor)  # como request.args.get: el primer valor
+    manejador, categoria = (None, None) if db.embebida else _buscar_ruta(scope, args)
+    if manejador is None:
+        return await wsgi(scope, receive, send)
+
+    inicio = time.perf_counter()
+    await db_async.abrir()
+    try:
+        cuerpo = await _leer_cuerpo(receive)
+        resultado, estado = await manejador(categoria, args, cuerpo)
+    except ValueError as e:
+        resultado, estado = {'success': False, 'message': str(e)}, (500 if manejador is guardar_medicion else 400)
+    except Exception as e:
+        resultado, estado = {'success': False, 'message': str(e)}, 500
+    await _responder(send, resultado, estado)
+    metricas.registrar_peticion(PLANTILLAS[manejador], scope['method'], estado, time.perf_counter() - inicio)
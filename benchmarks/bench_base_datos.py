@@ -0,0 +1,401 @@
+"""Benchmark reproducible de DatabaseManager e ImportadorDatos contra Postgres.
+
+Crea una base de datos desechable en un servidor Postgres local, le aplica las
+migraciones, la llena con datos sintéticos con la estructura real del dashboard
+(8 puntos PMV y 18 PA con sus parámetros, más las categorías de microbiología) y
+mide:
+
+    insertar_medicion, importación CSV (insertando todo, omitiendo o sobrescribiendo
+    las claves existentes) y Excel (una hoja y una hoja por punto, con
+    el pico de memoria de Python), obtener_mediciones con cada combinación de
+    filtros y obtener_estadisticas.
+
+El resultado se escribe en JSON y puede compararse con uno anterior; sale con
+código 1 si alguna medida empeora más del umbral.
+
+Servidor: BENCH_DATABASE_URL (por defecto postgresql://postgres@localhost:5432/postgres).
+Sin Postgres local, un contenedor desechable sirve igual:
+
+    docker run --rm -d -p 55432:5432 -e POSTGRES_HOST_AUTH_METHOD=trust postgres:16
+    BENCH_DATABASE_URL=postgresql://postgres@localhost:55432/postgres python benchmarks/bench_base_datos.py
+
+Uso:
+    python benchmarks/bench_base_datos.py [--filas 10k|1m|10m|N] [--repeticiones 20]
+        [--salida resultado.json] [--comparar base.json] [--umbral 0.2] [--conservar]
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import date, timedelta
+from urllib.parse import urlparse, urlunparse
+
+import numpy as np
+import pandas as pd
+import psycopg2
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, RAIZ)
+
+# Estructura del dashboard (static/dashboard.js): tipo -> punto -> parámetros
+ESTRUCTURA_FISICOQUIMICA = {
+    'vapor': {
+        'PMV001': ['PH', 'CONDUCTIVIDAD', 'CLORO', 'DUREZA', 'COLOR', 'TURBIDEZ', 'HIERRO', 'SOLIDOS', 'SULFATOS'],
+        'PMV002': ['PH', 'CONDUCTIVIDAD', 'CLORO', 'DUREZA', 'COLOR', 'TURBIDEZ', 'HIERRO', 'SOLIDOS', 'SULFATOS'],
+        'PMV003': ['DUREZA', 'HIERRO', 'SULFATOS'],
+        'PMV004': ['CONDUCTIVIDAD', 'CLORO'],
+        'PMV005': ['PH', 'CONDUCTIVIDAD'],
+        'PMV006': ['PH', 'CONDUCTIVIDAD'],
+        'PMV007': ['CONDUCTIVIDAD', 'TOC'],
+        'PMV008': ['CONDUCTIVIDAD', 'TOC'],
+    },
+    'agua': {
+        'PA001': ['TOC', 'PH', 'CONDUCTIVIDAD'],
+        'PA002': ['PH', 'CONDUCTIVIDAD', 'TOC'],
+        'PA003': ['CONDUCTIVIDAD', 'PH', 'TOC'],
+        'PA004': ['COLOR', 'TURBIDEZ', 'TOC', 'PH', 'CONDUCTIVIDAD'],
+        'PA005': ['DUREZA', 'HIERRO', 'SULFATOS', 'TOC', 'PH', 'CONDUCTIVIDAD'],
+        'PA006': ['PH', 'CONDUCTIVIDAD', 'CLORO', 'DUREZA', 'COLOR', 'TURBIDEZ', 'HIERRO', 'SOLIDOS TOTALES',
+                  'SULFATOS', 'TOC'],
+        'PA007': ['PH', 'CONDUCTIVIDAD', 'TOC'],
+        'PA008': ['PH', 'CONDUCTIVIDAD', 'CLORO', 'TOC'],
+        'PA009': ['PH', 'CONDUCTIVIDAD', 'TOC'],
+        'PA010': ['PH', 'CONDUCTIVIDAD', 'TOC'],
+        'PA011': ['PH', 'CONDUCTIVIDAD', 'TOC'],
+        'PA012': ['TOC', 'PH', 'CONDUCTIVIDAD'],
+        'PA013': ['PH', 'CONDUCTIVIDAD', 'TOC'],
+        'PA014': ['PH', 'CONDUCTIVIDAD', 'TOC'],
+        'PA015': ['PH', 'CONDUCTIVIDAD', 'TOC'],
+        'PA016': ['PH', 'CONDUCTIVIDAD', 'TOC'],
+        'PA017': ['PH', 'CONDUCTIVIDAD', 'TOC'],
+        'PA018': ['PH', 'CONDUCTIVIDAD', 'TOC'],
+    },
+}
+
+# Categorías de microbiología del dashboard (nitrógeno, aire comprimido, vapor)
+ESTRUCTURA_MICROBIOLOGIA = {
+    'nitrogeno': {f'N2-{i:02d}': ['RECUENTO_TOTAL', 'HONGOS_LEVADURAS'] for i in range(1, 5)},
+    'aire_comprimido': {f'AC-{i:02d}': ['RECUENTO_TOTAL', 'HONGOS_LEVADURAS'] for i in range(1, 7)},
+    'vapor_micro': {f'PMV{i:03d}': ['RECUENTO_TOTAL', 'ENDOTOXINAS'] for i in range(1, 9)},
+}
+
+# Media y desviación típicas por parámetro (para que las estadísticas tengan sentido)
+VALORES = {
+    'PH': (6.5, 0.3), 'CONDUCTIVIDAD': (1.1, 0.2), 'TOC': (250.0, 40.0), 'CLORO': (0.05, 0.02),
+    'DUREZA': (2.0, 0.5), 'COLOR': (5.0, 1.0), 'TURBIDEZ': (0.5, 0.1), 'HIERRO': (0.02, 0.005),
+    'SOLIDOS': (10.0, 2.0), 'SOLIDOS TOTALES': (10.0, 2.0), 'SULFATOS': (20.0, 4.0),
+    'RECUENTO_TOTAL': (3.0, 2.0), 'HONGOS_LEVADURAS': (1.0, 1.0), 'ENDOTOXINAS': (0.1, 0.05),
+}
+
+TAMANOS = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+FRACCION_MICROBIOLOGIA = 0.1
+DIAS_HISTORICO = 3 * 365
+LOTE_CARGA = 100_000
+FILAS_CSV_MAX = 200_000
+FILAS_EXCEL_MAX = 20_000
+
+
+def series(estructura):
+    """Lista de (tipo, punto, parametro) de una estructura"""
+    return [(tipo, punto, parametro)
+            for tipo, puntos in estructura.items()
+            for punto, parametros in puntos.items()
+            for parametro in parametros]
+
+
+def generar_filas(estructura, filas, rng, fin=None):
+    """Bloques de tuplas (tipo, punto, parametro, fecha, dato, nota) repartidas entre las series"""
+    fin = fin or date.today()
+    lista = series(estructura)
+    medias = np.array([VALORES[p][0] for _, _, p in lista])
+    desviaciones = np.array([VALORES[p][1] for _, _, p in lista])
+    for inicio in range(0, filas, LOTE_CARGA):
+        n = min(LOTE_CARGA, filas - inicio)
+        indices = rng.integers(0, len(lista), n)
+        dias = rng.integers(0, DIAS_HISTORICO, n)
+        datos = np.abs(rng.normal(medias[indices], desviaciones[indices])).round(4)
+        fechas = [fin - timedelta(days=int(d)) for d in dias]
+        notas = np.where(rng.random(n) < 0.02, 'revisar', None)
+        yield [(*lista[i], fecha, float(dato), nota)
+               for i, fecha, dato, nota in zip(indices, fechas, datos, notas)]
+
+
+def dataframe_importacion(estructura, filas, rng):
+    """DataFrame con el formato de los archivos que se importan (texto, coma decimal)"""
+    filas_generadas = next(generar_filas(estructura, filas, rng))
+    df = pd.DataFrame(filas_generadas, columns=['tipo', 'punto', 'parametro', 'fecha', 'dato', 'nota'])
+    df['fecha'] = pd.to_datetime(df['fecha']).dt.strftime('%Y-%m-%d')
+    df['dato'] = df['dato'].map(lambda v: f'{v:.4f}'.replace('.', ','))
+    return df
+
+
+class BaseDesechable:
+    """Base de datos creada para el benchmark y eliminada al terminar"""
+
+    def __init__(self, url_servidor, conservar=False):
+        self.url_servidor = url_servidor
+        self.conservar = conservar
+        self.nombre = f'bench_{uuid.uuid4().hex[:12]}'
+        partes = urlparse(url_servidor)
+        self.url = urlunparse(partes._replace(path=f'/{self.nombre}'))
+
+    def _admin(self, sql):
+        conn = psycopg2.connect(self.url_servidor)
+        conn.autocommit = True
+        try:
+            conn.cursor().execute(sql)
+        finally:
+            conn.close()
+
+    def __enter__(self):
+        self._admin(f"CREATE DATABASE {self.nombre} ENCODING 'UTF8' TEMPLATE template0")
+        return self
+
+    def __exit__(self, *exc):
+        if self.conservar:
+            print(f'Base conservada: {self.url}')
+        else:
+            self._admin(f'DROP DATABASE IF EXISTS {self.nombre} WITH (FORCE)')
+        return False
+
+
+def medir(nombre, funcion, repeticiones, resultados, calentar=True):
+    """Ejecutar funcion() varias veces y guardar mediana, p95, mínimo y filas/s"""
+    if calentar:
+        funcion()
+    tiempos = []
+    filas = 0
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+        if isinstance(resultado, dict):
+            if not resultado.get('success'):
+                raise RuntimeError(f"{nombre}: {resultado.get('message')}")
+            if isinstance(resultado.get('insertados'), int):
+                filas = resultado['insertados']
+            elif isinstance(resultado.get('data'), list):
+                filas = len(resultado['data'])
+    tiempos.sort()
+    mediana = statistics.median(tiempos)
+    resultados[nombre] = {
+        'mediana_ms': round(mediana * 1000, 3),
+        'p95_ms': round(tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))] * 1000, 3),
+        'min_ms': round(tiempos[0] * 1000, 3),
+        'repeticiones': repeticiones,
+        'filas': filas,
+    }
+    if filas:
+        resultados[nombre]['filas_s'] = round(filas / mediana)
+    print(f"{nombre:<60} {resultados[nombre]['mediana_ms']:>10.2f} ms  (p95 {resultados[nombre]['p95_ms']:.2f})"
+          + (f"  {resultados[nombre]['filas_s']:>10,} filas/s" if filas else ''))
+
+
+def medir_memoria(nombre, funcion, resultados):
+    """Añadir a la medida `nombre` el pico de memoria reservada por Python durante funcion()"""
+    tracemalloc.start()
+    try:
+        funcion()
+        pico = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    resultados[nombre]['pico_mb'] = round(pico / 2 ** 20, 1)
+    print(f"{'':<60} pico de memoria {resultados[nombre]['pico_mb']:.1f} MB")
+
+
+def excel_por_hojas(df, ruta):
+    """Libro con una hoja por punto y sin columna punto, como los exporta el LIMS"""
+    with pd.ExcelWriter(ruta) as libro:
+        pd.DataFrame({'instrucciones': ['Una hoja por punto de muestreo']}).to_excel(
+            libro, sheet_name='Instrucciones', index=False)
+        for punto, grupo in df.groupby('punto', sort=True):
+            grupo.drop(columns='punto').to_excel(libro, sheet_name=punto, index=False)
+
+
+def cargar(db, filas, rng):
+    """Llenar la base con `filas` mediciones (10% de microbiología) y preparar particiones y estadísticas"""
+    micro = int(filas * FRACCION_MICROBIOLOGIA)
+    inicio = time.perf_counter()
+    for categoria, estructura, n in (('fisicoquimica', ESTRUCTURA_FISICOQUIMICA, filas - micro),
+                                     ('microbiologia', ESTRUCTURA_MICROBIOLOGIA, micro)):
+        for bloque in generar_filas(estructura, n, rng):
+            resultado = db.insertar_mediciones_bulk(categoria, bloque)
+            if not resultado['success']:
+                raise RuntimeError(resultado['message'])
+    db.crear_particiones()
+    with db.conexion() as conn:
+        conn.autocommit = True
+        conn.cursor().execute('VACUUM ANALYZE')
+        conn.autocommit = False
+    segundos = time.perf_counter() - inicio
+    print(f'Carga de {filas:,} filas: {segundos:.1f} s ({filas / segundos:,.0f} filas/s)')
+    return {'segundos': round(segundos, 3), 'filas': filas}
+
+
+def bench_insertar(db, repeticiones, resultados):
+    contador = itertools.count()
+    medir('insertar_medicion', lambda: db.insertar_medicion(
+        'fisicoquimica', 'agua', 'PA001', 'PH', date.today().isoformat(), 6.5 + next(contador) % 10 / 100
+    ), repeticiones, resultados)
+
+
+def bench_importar(db, importador, filas, rng, resultados):
+    with tempfile.TemporaryDirectory() as carpeta:
+        n_csv = min(filas, FILAS_CSV_MAX)
+        ruta_csv = os.path.join(carpeta, 'importacion.csv')
+        dataframe_importacion(ESTRUCTURA_FISICOQUIMICA, n_csv, rng).to_csv(ruta_csv, sep=';', index=False)
+
+        def importar_csv(modo='duplicar'):
+            with open(ruta_csv, 'rb') as f:
+                return importador.procesar_txt(f, 'fisicoquimica', modo=modo)
+        medir(f'importar_csv[{n_csv}]', importar_csv, 3, resultados, calentar=False)
+        # Reimportación del mismo archivo: todas las claves existen y se omiten
+        medir(f'importar_csv_omitir[{n_csv}]', lambda: importar_csv('omitir'), 3, resultados, calentar=False)
+        medir(f'importar_csv_sobrescribir[{n_csv}]', lambda: importar_csv('sobrescribir'), 3, resultados,
+              calentar=False)
+
+        n_excel = min(filas, FILAS_EXCEL_MAX)
+        ruta_excel = os.path.join(carpeta, 'importacion.xlsx')
+        df_excel = dataframe_importacion(ESTRUCTURA_FISICOQUIMICA, n_excel, rng)
+        df_excel.to_excel(ruta_excel, index=False)
+        ruta_hojas = os.path.join(carpeta, 'importacion_hojas.xlsx')
+        excel_por_hojas(df_excel, ruta_hojas)
+
+        for nombre, ruta in ((f'importar_excel[{n_excel}]', ruta_excel),
+                             (f'importar_excel_hojas[{n_excel}]', ruta_hojas)):
+            def importar_excel(ruta=ruta):
+                return importador.procesar_excel(ruta, 'fisicoquimica', modo='duplicar')
+            medir(nombre, importar_excel, 3, resultados, calentar=False)
+            medir_memoria(nombre, importar_excel, resultados)
+
+
+def combinaciones(opciones):
+    """Todas las combinaciones (incluida la vacía) de un dict de filtros"""
+    claves = list(opciones)
+    for r in range(len(claves) + 1):
+        for grupo in itertools.combinations(claves, r):
+            filtros = {}
+            for clave in grupo:
+                filtros.update(opciones[clave])
+            yield '+'.join(grupo) or 'sin_filtros', filtros
+
+
+def bench_consultas(db, repeticiones, resultados):
+    hoy = date.today()
+    rango = {'fecha_inicio': hoy - timedelta(days=90), 'fecha_fin': hoy}
+    opciones = {
+        'tipo': {'tipo': 'agua'},
+        'punto': {'punto': 'PA006'},
+        'parametro': {'parametro': 'PH'},
+        'rango': rango,
+    }
+    for nombre, filtros in combinaciones(opciones):
+        medir(f'obtener_mediciones[{nombre}]',
+              lambda f=filtros: db.obtener_mediciones('fisicoquimica', f, limite=1000),
+              repeticiones, resultados)
+
+    opciones.pop('tipo')
+    for nombre, filtros in combinaciones(opciones):
+        medir(f'obtener_estadisticas[{nombre}]',
+              lambda f=filtros: db.obtener_estadisticas('fisicoquimica', **f),
+              repeticiones, resultados)
+    medir('obtener_estadisticas[microbiologia]', lambda: db.obtener_estadisticas('microbiologia'),
+          repeticiones, resultados)
+
+
+def comparar(actual, base, umbral):
+    """Imprimir la variación de cada medida frente a la base; devuelve las que empeoran más del umbral"""
+    regresiones = []
+    print(f"\nComparación con la base ({base['meta'].get('commit', '?')}, umbral {umbral:.0%})")
+    if base['meta'].get('filas') != actual['meta']['filas']:
+        print(f"Aviso: la base se midió con {base['meta'].get('filas')} filas y esta ejecución con {actual['meta']['filas']}")
+    for nombre, medida in actual['resultados'].items():
+        anterior = base['resultados'].get(nombre)
+        if not anterior or not anterior['mediana_ms']:
+            continue
+        variacion = medida['mediana_ms'] / anterior['mediana_ms'] - 1
+        marca = '  REGRESIÓN' if variacion > umbral else ''
+        print(f"{nombre:<60} {anterior['mediana_ms']:>10.2f} -> {medida['mediana_ms']:>10.2f} ms  {variacion:+7.1%}{marca}")
+        if marca:
+            regresiones.append(nombre)
+    return regresiones
+
+
+def metadatos(db, filas):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    with db.conexion() as conn:
+        cur = conn.cursor()
+        cur.execute('SHOW server_version')
+        version_pg = cur.fetchone()[0]
+    return {
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'filas': filas,
+        'python': platform.python_version(),
+        'postgres': version_pg,
+        'maquina': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de DatabaseManager e ImportadorDatos')
+    parser.add_argument('--filas', default='10k', help='10k, 1m, 10m o un número de filas')
+    parser.add_argument('--repeticiones', type=int, default=20)
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--salida', help='Archivo JSON con los resultados')
+    parser.add_argument('--comparar', help='JSON de una ejecución anterior con el que comparar')
+    parser.add_argument('--umbral', type=float, default=0.2, help='Empeoramiento máximo admitido (0.2 = 20%%)')
+    parser.add_argument('--conservar', action='store_true', help='No borrar la base al terminar')
+    args = parser.parse_args()
+
+    filas = TAMANOS.get(args.filas.lower()) or int(args.filas)
+    rng = np.random.default_rng(args.semilla)
+    url_servidor = os.environ.get('BENCH_DATABASE_URL', 'postgresql://postgres@localhost:5432/postgres')
+
+    with BaseDesechable(url_servidor, args.conservar) as base:
+        # Sin caché de resultados: se mide la base de datos, no la memoria
+        os.environ['DATABASE_URL'] = base.url
+        os.environ['CACHE_BACKEND'] = 'ninguno'
+        from database import DatabaseManager
+        from importador import ImportadorDatos
+
+        db = DatabaseManager()
+        migracion = db.migrar()
+        if not migracion['success']:
+            raise RuntimeError(migracion['message'])
+
+        resultado = {'meta': metadatos(db, filas), 'carga': cargar(db, filas, rng), 'resultados': {}}
+        bench_consultas(db, args.repeticiones, resultado['resultados'])
+        bench_insertar(db, args.repeticiones, resultado['resultados'])
+        bench_importar(db, ImportadorDatos(db), filas, rng, resultado['resultados'])
+        db.pool.cerrar()
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f'\nResultados en {args.salida}')
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            regresiones = comparar(resultado, json.load(f), args.umbral)
+        if regresiones:
+            print(f'\n{len(regresiones)} medidas empeoran más de un {args.umbral:.0%}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
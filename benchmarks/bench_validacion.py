@@ -0,0 +1,84 @@
+"""Benchmark de la etapa de validación del importador (sin base de datos).
+
+Compara la validación fila a fila con df.iterrows() (implementación anterior)
+con la validación por columnas de ImportadorDatos._validar_dataframe.
+
+Uso:
+    python benchmarks/bench_validacion.py [filas]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from importador import ImportadorDatos
+
+
+def generar_dataframe(filas, semilla=42):
+    """DataFrame sintético con el formato de las exportaciones CSV (texto, coma decimal, ~1% de errores)"""
+    rng = np.random.default_rng(semilla)
+    fechas = pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 5 * 365, filas), unit='D')
+    df = pd.DataFrame({
+        'fecha': fechas.strftime('%Y-%m-%d'),
+        'punto': rng.choice([f' PA{i:03d} ' for i in range(1, 19)], filas),
+        'parametro': rng.choice(['ph', 'conductividad', 'toc', 'Cloro'], filas),
+        'dato': [f'{v:.3f}'.replace('.', ',') for v in rng.uniform(0, 100, filas)],
+        'nota': np.where(rng.random(filas) < 0.1, 'revisar', None),
+    })
+    malas = rng.choice(filas, max(1, filas // 100), replace=False)
+    df.loc[malas[::2], 'fecha'] = 'sin fecha'
+    df.loc[malas[1::2], 'dato'] = 'n/d'
+    return df
+
+
+def validar_iterrows(df):
+    """Implementación anterior: normalización fila a fila"""
+    datos_validos = []
+    errores = []
+    for idx, row in df.iterrows():
+        try:
+            fecha = pd.to_datetime(row['fecha']).date()
+            dato = float(str(row['dato']).replace(',', '.'))
+            punto = str(row['punto']).strip()
+            parametro = str(row['parametro']).strip().upper()
+            tipo = row.get('tipo', 'agua')
+            nota = str(row['nota']) if 'nota' in row and pd.notna(row['nota']) else None
+            datos_validos.append({
+                'tipo': tipo,
+                'punto': punto,
+                'parametro': parametro,
+                'fecha': fecha,
+                'dato': dato,
+                'nota': nota
+            })
+        except Exception as e:
+            errores.append(f"Fila {idx + 2}: {str(e)}")
+    return datos_validos, errores
+
+
+def medir(nombre, funcion, df):
+    inicio = time.perf_counter()
+    validos, errores = funcion(df)
+    segundos = time.perf_counter() - inicio
+    print(f'{nombre:<12} {segundos:8.3f} s  {len(df) / segundos:12,.0f} filas/s  '
+          f'({len(validos)} válidas, {len(errores)} errores)')
+    return segundos
+
+
+def main():
+    filas = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    df = generar_dataframe(filas)
+    importador = ImportadorDatos(None)
+
+    print(f'Validación de {filas:,} filas')
+    antes = medir('iterrows', validar_iterrows, df.copy())
+    despues = medir('vectorizada', lambda d: importador._validar_dataframe(d)[::2], df.copy())
+    print(f'Aceleración: x{antes / despues:.1f}')
+
+
+if __name__ == '__main__':
+    main()
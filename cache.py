@@ -0,0 +1,313 @@
+"""Caché de resultados de consultas invalidada por escrituras.
+
+Cada entrada se guarda bajo una clave que incluye la versión actual de la tabla
+consultada; insertar o eliminar mediciones incrementa esa versión, así que las
+entradas anteriores dejan de encontrarse (y acaban saliendo por LRU o TTL).
+
+Las versiones viven en la tabla cache_versiones de la propia base de datos
+(VersionesBaseDatos): una escritura de cualquier worker, trabajo de importación o
+comando de gestion.py deja obsoletas las entradas de todos los procesos. Cada
+proceso guarda una copia de las versiones y la relee como mucho cada
+CACHE_VERSIONES_TTL segundos (1 por defecto), así que un acierto no cuesta ninguna
+consulta; las escrituras del propio proceso se ven al momento y las de los demás
+tras ese intervalo. El backend solo decide dónde se guardan los resultados:
+    memoria  - diccionario LRU en el proceso (por defecto)
+    sqlite   - archivo SQLite local compartido por los workers de gunicorn
+    ninguno  - sin caché
+"""
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def clave_consulta(*partes):
+    """Clave estable a partir de los argumentos de una consulta (filtros en cualquier orden)"""
+    texto = json.dumps(partes, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+
+class CacheMemoria:
+    """LRU con límite de entradas y TTL dentro del proceso.
+
+    Devuelve el mismo objeto que se guardó: quien lo reciba no debe modificarlo.
+    """
+
+    def __init__(self, max_entradas=1000, ttl=300):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return None
+            expira, valor = entrada
+            if expira < time.monotonic():
+                del self._entradas[clave]
+                return None
+            self._entradas.move_to_end(clave)
+            return valor
+
+    def guardar(self, clave, valor):
+        with self._lock:
+            self._entradas[clave] = (time.monotonic() + self.ttl, valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def tamano(self):
+        return len(self._entradas)
+
+
+class CacheSqlite:
+    """LRU con TTL en un archivo SQLite compartido por los procesos de la máquina"""
+
+    def __init__(self, ruta, max_entradas=1000, ttl=300):
+        self.ruta = ruta
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._conexion() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS entradas (
+                    clave TEXT PRIMARY KEY,
+                    valor BLOB NOT NULL,
+                    expira REAL NOT NULL,
+                    usado REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_entradas_usado ON entradas(usado)')
+
+    def _conexion(self):
+        # Una conexión por hilo (y por proceso: se abre después del fork de gunicorn)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.ruta, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def obtener(self, clave):
+        conn = self._conexion()
+        ahora = time.time()
+        fila = conn.execute('SELECT valor, expira FROM entradas WHERE clave = ?', (clave,)).fetchone()
+        if fila is None:
+            return None
+        if fila[1] < ahora:
+            conn.execute('DELETE FROM entradas WHERE clave = ?', (clave,))
+            return None
+        conn.execute('UPDATE entradas SET usado = ? WHERE clave = ?', (ahora, clave))
+        return pickle.loads(fila[0])
+
+    def guardar(self, clave, valor):
+        conn = self._conexion()
+        ahora = time.time()
+        conn.execute(
+            'INSERT OR REPLACE INTO entradas (clave, valor, expira, usado) VALUES (?, ?, ?, ?)',
+            (clave, pickle.dumps(valor, pickle.HIGHEST_PROTOCOL), ahora + self.ttl, ahora)
+        )
+        conn.execute('''
+            DELETE FROM entradas WHERE clave IN (
+                SELECT clave FROM entradas ORDER BY usado DESC LIMIT -1 OFFSET ?
+            )
+        ''', (self.max_entradas,))
+
+    def limpiar(self):
+        self._conexion().execute('DELETE FROM entradas')
+
+    def tamano(self):
+        return self._conexion().execute('SELECT COUNT(*) FROM entradas').fetchone()[0]
+
+
+class VersionesBaseDatos:
+    """Versiones de las tablas en cache_versiones, visibles para todos los procesos.
+
+    Las versiones se leen todas a la vez y se reutilizan durante `ttl` segundos: un
+    proceso puede servir resultados de otro proceso con hasta `ttl` segundos de
+    retraso, nunca más. La escritura incrementa la versión después de confirmar y
+    actualiza la copia local, así que este proceso no vuelve a servir lo anterior y
+    ninguno guarda con la versión nueva un resultado leído antes de la escritura.
+    Las versiones solo crecen: al combinar la copia local con lo leído se toma el
+    máximo.
+    """
+
+    def __init__(self, conexion, ttl=None):
+        self.conexion = conexion  # DatabaseManager.conexion
+        self.ttl = float(os.environ.get('CACHE_VERSIONES_TTL', 1)) if ttl is None else ttl
+        self._versiones = {}
+        self._leidas = None
+        self._lock = threading.Lock()
+
+    def al_dia(self):
+        """Si la copia local sirve todavía (version() no consultará la base)"""
+        leidas = self._leidas
+        return leidas is not None and time.monotonic() - leidas < self.ttl
+
+    def version(self, tabla):
+        if not self.al_dia():
+            self._refrescar()
+        with self._lock:
+            return self._versiones.get(tabla, 0)
+
+    def _refrescar(self):
+        leidas = time.monotonic()
+        with self.conexion() as conn:
+            if not conn:
+                raise RuntimeError('Error de conexión')
+            cur = conn.cursor()
+            cur.execute('SELECT tabla, version FROM cache_versiones')
+            filas = cur.fetchall()
+            cur.close()
+        with self._lock:
+            for tabla, version in filas:
+                self._versiones[tabla] = max(version, self._versiones.get(tabla, 0))
+            self._leidas = leidas
+
+    def incrementar_version(self, tabla, conn=None):
+        """Incrementar la versión; `conn` reutiliza la conexión (ya confirmada) de quien escribió"""
+        if conn is not None:
+            version = self._incrementar(conn, tabla)
+        else:
+            with self.conexion() as conn:
+                if not conn:
+                    raise RuntimeError('Error de conexión')
+                version = self._incrementar(conn, tabla)
+        with self._lock:
+            self._versiones[tabla] = max(version, self._versiones.get(tabla, 0))
+
+    @staticmethod
+    def _incrementar(conn, tabla):
+        cur = conn.cursor()
+        cur.execute('''
+            INSERT INTO cache_versiones (tabla, version) VALUES (%s, 1)
+            ON CONFLICT (tabla) DO UPDATE SET version = cache_versiones.version + 1
+            RETURNING version
+        ''', (tabla,))
+        version = cur.fetchone()[0]
+        cur.close()
+        conn.commit()
+        return version
+
+
+class CacheResultados:
+    """Fachada sobre un backend con contadores de aciertos y fallos de este proceso"""
+
+    def __init__(self, backend, versiones):
+        self.backend = backend
+        self.versiones = versiones
+        self.aciertos = 0
+        self.fallos = 0
+        self.errores = 0
+        self._lock = threading.Lock()
+
+    def consultar(self, tabla, operacion, argumentos, funcion):
+        """Devolver el resultado cacheado de funcion() o calcularlo; solo se guardan los éxitos"""
+        clave = self.clave(tabla, operacion, argumentos)
+        resultado = self.obtener(clave)
+        if resultado is None:
+            resultado = funcion()
+            self.guardar(clave, resultado)
+        return resultado
+
+    def clave(self, tabla, operacion, argumentos):
+        """Clave con la versión actual de la tabla; None si no hay caché o no se puede leer.
+
+        La versión se lee antes de consultar: si hay una escritura entre medias, el
+        resultado queda guardado con la versión antigua y no se vuelve a servir.
+        """
+        if self.backend is None:
+            return None
+        try:
+            return f'{tabla}:{self.versiones.version(tabla)}:{operacion}:{clave_consulta(argumentos)}'
+        except Exception as e:
+            print(f"Error en caché: {e}")
+            self._contar('errores')
+            return None
+
+    def clave_bloquea(self):
+        """Si clave() tendría que consultar la base para refrescar las versiones"""
+        return self.backend is not None and not self.versiones.al_dia()
+
+    def obtener(self, clave):
+        """Resultado guardado bajo la clave (None si no hay)"""
+        if clave is None:
+            return None
+        try:
+            resultado = self.backend.obtener(clave)
+        except Exception as e:
+            print(f"Error en caché: {e}")
+            self._contar('errores')
+            return None
+        self._contar('aciertos' if resultado is not None else 'fallos')
+        return resultado
+
+    def guardar(self, clave, resultado):
+        """Guardar un resultado correcto bajo la clave"""
+        if clave is None or not resultado.get('success'):
+            return
+        try:
+            self.backend.guardar(clave, resultado)
+        except Exception as e:
+            print(f"Error en caché: {e}")
+            self._contar('errores')
+
+    def invalidar(self, tabla, conn=None):
+        """Marcar como obsoletas todas las entradas de una tabla (en todos los procesos)"""
+        if self.backend is None:
+            return
+        try:
+            self.versiones.incrementar_version(tabla, conn)
+        except Exception as e:
+            # Sin poder invalidar no se puede seguir sirviendo la caché con seguridad
+            print(f"Error al invalidar la caché: {e}")
+            self._contar('errores')
+            self.backend.limpiar()
+
+    def _contar(self, contador):
+        with self._lock:
+            setattr(self, contador, getattr(self, contador) + 1)
+
+    def estadisticas(self):
+        total = self.aciertos + self.fallos
+        return {
+            'backend': type(self.backend).__name__ if self.backend else None,
+            'entradas': self.backend.tamano() if self.backend else 0,
+            'aciertos': self.aciertos,
+            'fallos': self.fallos,
+            'errores': self.errores,
+            'tasa_aciertos': round(self.aciertos / total, 3) if total else None,
+        }
+
+
+def crear_cache(versiones):
+    """Crear la caché según CACHE_BACKEND, CACHE_MAX_ENTRADAS, CACHE_TTL y CACHE_RUTA.
+
+    `versiones` (VersionesBaseDatos) comparte las versiones entre procesos.
+    """
+    tipo = os.environ.get('CACHE_BACKEND', 'memoria').lower()
+    max_entradas = int(os.environ.get('CACHE_MAX_ENTRADAS', 1000))
+    ttl = float(os.environ.get('CACHE_TTL', 300))
+
+    if tipo == 'ninguno':
+        backend = None
+    elif tipo == 'sqlite':
+        ruta = os.environ.get('CACHE_RUTA', '/tmp/laboratorio_cache.sqlite3')
+        backend = CacheSqlite(ruta, max_entradas=max_entradas, ttl=ttl)
+    elif tipo == 'memoria':
+        backend = CacheMemoria(max_entradas=max_entradas, ttl=ttl)
+    else:
+        raise ValueError(f'Backend de caché no soportado: {tipo}')
+    return CacheResultados(backend, versiones)
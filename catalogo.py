@@ -0,0 +1,107 @@
+"""Catálogo de puntos de muestreo y de los parámetros que se miden en cada uno.
+
+La estructura de la planta vive en la tabla catalogo (categoria, tipo, punto,
+parametro). El dashboard construye la barra lateral con /api/catalogo y el
+importador, /api/guardar y /api/guardar/lote validan contra IndiceCatalogo: un
+conjunto por categoría en memoria del proceso, así que cada fila cuesta una
+búsqueda en un hash y ninguna consulta.
+
+Cada cambio del catálogo incrementa catalogo_version en la misma transacción. El
+índice comprueba esa versión como mucho cada CATALOGO_REFRESCO segundos (los
+cambios hechos en este proceso se ven al momento) y solo relee la tabla si ha
+cambiado. Una categoría sin entradas no se valida: microbiología no tiene todavía
+puntos dados de alta.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+REFRESCO = float(os.environ.get('CATALOGO_REFRESCO', 30))
+
+
+def normalizar(tipo, punto, parametro):
+    """(tipo, punto, parametro) tal como se guardan y se buscan en el catálogo.
+
+    La misma regla para /api/guardar, /api/guardar/lote, el importador y las altas del
+    catálogo: sin espacios en los extremos, tipo en minúsculas y parámetro en mayúsculas.
+    """
+    return _texto(tipo, str.lower), _texto(punto), _texto(parametro, str.upper)
+
+
+def normalizar_columnas(tipos, puntos, parametros):
+    """normalizar() sobre columnas de texto de pandas (NA se conserva)"""
+    return tipos.str.strip().str.lower(), puntos.str.strip(), parametros.str.strip().str.upper()
+
+
+def _texto(valor, convertir=None):
+    if valor is None:
+        return None
+    valor = str(valor).strip()
+    return convertir(valor) if convertir else valor
+
+
+class IndiceCatalogo:
+    """Índice en memoria del catálogo, recargado cuando cambia catalogo_version"""
+
+    def __init__(self, db, refresco=None):
+        self.db = db
+        self.refresco = REFRESCO if refresco is None else refresco
+        self._lock = threading.Lock()
+        self._version = None
+        self._comprobado = 0.0
+        self._claves = {}
+        self._estructura = {}
+        self.etag = None
+
+    def refrescar(self, forzar=False):
+        """Releer el catálogo si su versión ha cambiado (como mucho una comprobación cada `refresco` s)"""
+        if not forzar and self._version is not None and time.monotonic() - self._comprobado < self.refresco:
+            return
+        with self._lock:
+            if not forzar and self._version is not None and time.monotonic() - self._comprobado < self.refresco:
+                return
+            version = self.db.version_catalogo()
+            self._comprobado = time.monotonic()
+            if version is None or version == self._version:
+                return
+            filas = self.db.filas_catalogo()
+            if filas is None:
+                return
+
+            claves = {}
+            estructura = {}
+            for categoria, tipo, punto, parametro in filas:
+                claves.setdefault(categoria, set()).add((tipo, punto, parametro))
+                estructura.setdefault(categoria, {}).setdefault(tipo, {}).setdefault(punto, []).append(parametro)
+            self._claves = {categoria: frozenset(c) for categoria, c in claves.items()}
+            self._estructura = estructura
+            self.etag = hashlib.sha256(json.dumps(estructura).encode('utf-8')).hexdigest()[:16]
+            self._version = version
+
+    def estructura(self):
+        """(categoría -> tipo -> punto -> parámetros, ETag del contenido)"""
+        self.refrescar()
+        return self._estructura, self.etag
+
+    def contiene(self, categoria, tipo, punto, parametro):
+        """Si la medición está en el catálogo (siempre True para categorías sin catálogo)"""
+        self.refrescar()
+        claves = self._claves.get(categoria)
+        return not claves or (tipo, punto, parametro) in claves
+
+    def comprobar(self, categoria, tipo, punto, parametro):
+        """Lanzar ValueError si la medición no está en el catálogo"""
+        if not self.contiene(categoria, tipo, punto, parametro):
+            raise ValueError(f'{tipo} {punto} {parametro} no está en el catálogo')
+
+    def filtro(self, categoria, tipos, puntos, parametros):
+        """Array booleano con las filas que están en el catálogo (columnas alineadas)"""
+        self.refrescar()
+        claves = self._claves.get(categoria)
+        if not claves:
+            return np.ones(len(tipos), dtype=bool)
+        return np.fromiter((clave in claves for clave in zip(tipos, puntos, parametros)), dtype=bool, count=len(tipos))
@@ -1,236 +1,1739 @@
+import numpy as np
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+import base64
+import csv
+import heapq
+import io
+import json
+import math
 import os
+import threading
+import uuid
+from contextlib import contextmanager
+from decimal import Decimal, localcontext
+from itertools import groupby, islice
 from urllib.parse import urlparse
-from datetime import datetime
+from datetime import date, datetime
+from pool_conexiones import PoolConexiones
+from cache import VersionesBaseDatos, crear_cache
+from catalogo import IndiceCatalogo, normalizar
+from series import METODOS as METODOS_REDUCCION, reducir
+import spc
+import particiones
+import archivo
+import esquema
+import metricas
+
+CATEGORIAS = ('fisicoquimica', 'microbiologia')
+COLUMNAS_MEDICION = ('tipo', 'punto', 'parametro', 'fecha', 'dato', 'nota')
+COLUMNAS_CONSULTA = ('id',) + COLUMNAS_MEDICION + ('timestamp',)
+COLUMNAS_CLAVE = ('fecha', 'timestamp', 'id')
+PERCENTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+# Rejilla de cuantiles de la tabla para combinar sus percentiles con los del archivo
+CUANTILES = tuple(i / 100 for i in range(101))
+PARTICIONES_FUTURAS = int(os.environ.get('DB_PARTICIONES_FUTURAS', 1))
+HORAS_IDEMPOTENCIA = int(os.environ.get('IDEMPOTENCIA_HORAS', 24))
+# Qué hacer con las filas cuya clave natural (tipo, punto, parametro, fecha) ya existe
+MODOS_IMPORTACION = ('omitir', 'sobrescribir', 'duplicar')
+# Cómo resumir en la matriz fecha × parámetro varias muestras del mismo día:
+# (función SQL, orden de la única muestra que cuenta o None si cuentan todas, equivalente en Python)
+AGREGADOS_MATRIZ = {
+    'promedio': ('AVG', None, lambda c: float(c['suma'] / c['n'])),
+    'minimo': ('MIN', None, lambda c: float(c['minimo'])),
+    'maximo': ('MAX', None, lambda c: float(c['maximo'])),
+    'primero': ('MAX', 'ASC', lambda c: float(c['primera'][3])),
+    'ultimo': ('MAX', 'DESC', lambda c: float(c['ultima'][3])),
+    'n': ('COUNT', None, lambda c: c['n']),
+}
+
+
+def codificar_cursor(fecha, marca_tiempo, id):
+    """Cursor opaco de paginación a partir de la clave (fecha, timestamp, id) de la última fila"""
+    clave = [fecha.isoformat(), marca_tiempo.isoformat() if marca_tiempo else None, id]
+    return base64.urlsafe_b64encode(json.dumps(clave).encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """Recuperar la clave (fecha, timestamp, id) de un cursor de paginación"""
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        fecha, marca_tiempo, id = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        return (
+            date.fromisoformat(fecha),
+            datetime.fromisoformat(marca_tiempo) if marca_tiempo else None,
+            int(id)
+        )
+    except (ValueError, TypeError):
+        raise ValueError('Cursor de paginación no válido')
+
+def _clave_orden(medicion):
+    """Clave (fecha, timestamp, id) de una fila para mezclar tabla y archivo en el orden de la paginación"""
+    return (medicion['fecha'], medicion['timestamp'] or datetime.min, medicion['id'])
+
+
+def _clave_cronologica(fila):
+    """Clave de orden de una fila (fecha, timestamp, id, dato) de los agregados de tabla y archivo"""
+    return (fila[0], fila[1] or datetime.min, fila[2])
+
+
+def _combinar_agregados(a, b):
+    """Agregados de un mismo grupo en la tabla (a) y en el archivo (b)"""
+    return {
+        'n': a['n'] + b['n'],
+        'suma': a['suma'] + b['suma'],
+        'suma_cuadrados': a['suma_cuadrados'] + b['suma_cuadrados'],
+        'minimo': min(a['minimo'], b['minimo']),
+        'maximo': max(a['maximo'], b['maximo']),
+        'primera': min(a['primera'], b['primera'], key=_clave_cronologica),
+        'ultima': max(a['ultima'], b['ultima'], key=_clave_cronologica),
+        'rejilla': a.get('rejilla'),
+        'n_rejilla': a['n'],
+        'valores': b.get('valores'),
+    }
+
+
+def _percentiles_agregados(agregados):
+    """Valores de PERCENTILES de un grupo: exactos si sus filas están solo en la tabla o solo en el archivo.
+
+    Si están en los dos, cada dato archivado pesa 1 y cada punto de la rejilla de cuantiles de la
+    tabla pesa n_tabla / len(CUANTILES); el error es de menos de un 1 % del rango de la tabla.
+    """
+    rejilla, valores = agregados.get('rejilla'), agregados.get('valores')
+    if valores is None:
+        return [rejilla[round(p * 100)] for p in PERCENTILES]
+    if rejilla is None:
+        return np.percentile(valores, [p * 100 for p in PERCENTILES]).tolist()
+    puntos = np.concatenate([np.asarray(valores, dtype=float), np.asarray(rejilla, dtype=float)])
+    pesos = np.concatenate([
+        np.ones(len(valores)), np.full(len(rejilla), agregados['n_rejilla'] / len(rejilla))
+    ])
+    orden = np.argsort(puntos, kind='stable')
+    puntos, pesos = puntos[orden], pesos[orden]
+    # Posición de cada punto en el centro de su peso: con pesos 1 coincide con percentile_cont
+    posiciones = np.cumsum(pesos) - pesos / 2 - 0.5
+    return np.interp([p * (pesos.sum() - 1) for p in PERCENTILES], posiciones, puntos).tolist()
+
+
+def _estadisticas_agregados(tipo, punto, parametro, agregados):
+    """Estadísticas de un grupo a partir de sus agregados; mismas claves que la consulta agrupada"""
+    n = agregados['n']
+    with localcontext() as contexto:
+        contexto.prec = 50
+        promedio = agregados['suma'] / n
+        varianza = (agregados['suma_cuadrados'] - agregados['suma'] * promedio) / (n - 1) if n > 1 else None
+        desviacion = max(varianza, Decimal(0)).sqrt() if varianza is not None else None
+    resultado = {
+        'tipo': tipo,
+        'punto': punto,
+        'parametro': parametro,
+        'total': n,
+        'promedio': +promedio,
+        'maximo': agregados['maximo'],
+        'minimo': agregados['minimo'],
+        'desviacion_estandar': +desviacion if desviacion is not None else None,
+        'ultimo_valor': agregados['ultima'][3],
+        'ultima_fecha': agregados['ultima'][0],
+    }
+    for percentil, valor in zip(PERCENTILES, _percentiles_agregados(agregados)):
+        if percentil == 0.5:
+            resultado['mediana'] = valor
+        else:
+            resultado[f'p{round(percentil * 100):02d}'] = valor
+    return resultado
+
+def crear_database_manager(database_url=None):
+    """DatabaseManager según DATABASE_URL: sqlite:///ruta para la base embebida, Postgres en otro caso"""
+    database_url = database_url or os.environ.get('DATABASE_URL')
+    if database_url and database_url.startswith('sqlite:'):
+        from database_sqlite import DatabaseManagerSqlite
+        return DatabaseManagerSqlite(database_url)
+    return DatabaseManager(database_url)
 
 class DatabaseManager:
     """Clase para gestionar todas las operaciones de la base de datos"""
     
-    def __init__(self):
-        self.database_url = os.environ.get('DATABASE_URL')
+    # True en backends embebidos (SQLite) sin cola de importaciones, SPC ni particiones
+    embebida = False
+    # Columnas de una serie para obtener_series: días desde 1970 y dato como float
+    SQL_SERIE = "fecha - DATE '1970-01-01', dato::float8"
+    SQL_AHORA = 'LOCALTIMESTAMP'
+    
+    def __init__(self, database_url=None):
+        self.database_url = database_url or os.environ.get('DATABASE_URL')
+        self._parametros = self._parsear_url(self.database_url)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self.cache = crear_cache(VersionesBaseDatos(self.conexion))
+        self.catalogo = IndiceCatalogo(self)
+    
+    @staticmethod
+    def _parsear_url(database_url):
+        """Convertir DATABASE_URL en parámetros de psycopg2 (una sola vez)"""
+        if database_url:
+            result = urlparse(database_url)
+            return {
+                'database': result.path[1:],
+                'user': result.username,
+                'password': result.password,
+                'host': result.hostname,
+                'port': result.port
+            }
+        return {
+            'database': "laboratorio",
+            'user': "postgres",
+            'password': "postgres",
+            'host': "localhost",
+            'port': "5432"
+        }
     
     def get_connection(self):
-        """Crear conexión a la base de datos"""
-        try:
-            if self.database_url:
-                result = urlparse(self.database_url)
-                conn = psycopg2.connect(
-                    database=result.path[1:],
-                    user=result.username,
-                    password=result.password,
-                    host=result.hostname,
-                    port=result.port
-                )
-            else:
-                conn = psycopg2.connect(
-                    database="laboratorio",
-                    user="postgres",
-                    password="postgres",
-                    host="localhost",
-                    port="5432"
-                )
-            return conn
+        """Crear una conexión nueva a la base de datos (sin pool)"""
+        try:
+            return psycopg2.connect(**self._parametros)
         except Exception as e:
             print(f"Error de conexión: {e}")
             return None
     
+    @property
+    def pool(self):
+        """Pool de conexiones, creado al primer uso en cada proceso"""
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = PoolConexiones(
+                        lambda: psycopg2.connect(**self._parametros),
+                        minimo=int(os.environ.get('DB_POOL_MIN', 1)),
+                        maximo=int(os.environ.get('DB_POOL_MAX', 10)),
+                        timeout=float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+                        verificar_tras=float(os.environ.get('DB_POOL_VERIFICAR_TRAS', 30))
+                    )
+        return self._pool
+    
+    @contextmanager
+    def conexion(self):
+        """Tomar prestada una conexión del pool; produce None si no hay conexión"""
+        conn = self.pool.obtener()
+        descartar = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            descartar = True
+            raise
+        finally:
+            self.pool.devolver(conn, descartar=descartar)
+    
+    def estadisticas_pool(self):
+        """Estadísticas del pool de conexiones de este proceso"""
+        return self.pool.estadisticas()
+    
+    def estadisticas_cache(self):
+        """Aciertos y fallos de la caché de resultados en este proceso"""
+        return self.cache.estadisticas()
+    
+    def migrar(self, hasta=None):
+        """Aplicar las migraciones pendientes del esquema (una sola vez por despliegue)"""
+        try:
+            with self.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión'}
+                
+                aplicadas = esquema.migrar(conn, hasta)
+                reconstruidas = self._reconstruir_spc_vacio(conn)
+                return {
+                    'success': True,
+                    'message': f'✓ {len(aplicadas)} migraciones aplicadas',
+                    'data': [{'version': v, 'nombre': n, 'duracion_ms': d} for v, n, d in aplicadas],
+                    'spc_reconstruido': reconstruidas
+                }
+        except Exception as e:
+            return {'success': False, 'message': f'Error: {str(e)}'}
+
+    def _reconstruir_spc_vacio(self, conn):
+        """Construir el estado SPC de las categorías con histórico y sin estado (p. ej. recién migradas).
+
+        Es un dato derivado: no lo calculan las migraciones, que no dependen del código de spc.
+        """
+        cur = conn.cursor()
+        cur.execute("SELECT to_regclass('spc_estado') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            cur.close()
+            return {}
+        reconstruidas = {}
+        for categoria in CATEGORIAS:
+            tabla = self._tabla(categoria)
+            cur.execute(f'''
+                SELECT NOT EXISTS (SELECT 1 FROM spc_estado WHERE categoria = %s)
+                   AND EXISTS (SELECT 1 FROM {tabla})
+            ''', (categoria,))
+            if cur.fetchone()[0]:
+                reconstruidas[categoria] = spc.recalcular(conn, categoria, tabla)
+                conn.commit()
+                print(f"✓ Estado SPC de {categoria} construido ({reconstruidas[categoria]} series)")
+        cur.close()
+        conn.commit()
+        return reconstruidas
+
+    def estado_esquema(self):
+        """Versión del esquema frente a las migraciones disponibles (consulta barata para el arranque)"""
+        try:
+            with self.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión'}
+                
+                cur = conn.cursor()
+                data = esquema.estado(cur)
+                cur.close()
+                conn.commit()
+                pendientes = len(data['pendientes'])
+                return {
+                    'success': True,
+                    'message': f'{pendientes} migraciones pendientes' if pendientes else '✓ Esquema al día',
+                    'data': data
+                }
+        except Exception as e:
+            return {'success': False, 'message': f'Error: {str(e)}'}
+
     def init_database(self):
-        """Inicializar las tablas de la base de datos"""
-        conn = self.get_connection()
-        if not conn:
-            print("No se pudo conectar a la base de datos")
+        """Inicializar la base de datos aplicando las migraciones pendientes"""
+        resultado = self.migrar()
+        if not resultado['success']:
+            print(f"Error al inicializar la base de datos: {resultado['message']}")
             return False
-        
+        print("✓ Base de datos inicializada correctamente")
+        return True
+
+    def crear_particiones(self, anios_futuros=None):
+        """Crear las particiones de los próximos años y las de los años que hayan caído en DEFAULT"""
         try:
-            cur = conn.cursor()
-            
-            # Tabla principal para fisicoquímica
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS mediciones_fisicoquimica (
-                    id SERIAL PRIMARY KEY,
-                    tipo VARCHAR(20) NOT NULL,
-                    punto VARCHAR(20) NOT NULL,
-                    parametro VARCHAR(50) NOT NULL,
-                    fecha DATE NOT NULL,
-                    dato DECIMAL(10, 4) NOT NULL,
-                    nota TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            with self.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión'}
+                
+                cur = conn.cursor()
+                # Los workers de importación y el cron pueden coincidir: uno crea y el resto ya las encuentra
+                cur.execute('SELECT pg_advisory_xact_lock(%s)', (particiones.LLAVE_PARTICIONES,))
+                creadas = {}
+                for categoria in CATEGORIAS:
+                    creadas[categoria] = self._asegurar_particiones(cur, categoria, anios_futuros)
+                conn.commit()
+                cur.close()
+                
+                total = sum(len(anios) for anios in creadas.values())
+                return {
+                    'success': True,
+                    'message': f'✓ {total} particiones creadas',
+                    'data': creadas
+                }
+        except Exception as e:
+            return {'success': False, 'message': f'Error: {str(e)}'}
+
+    @staticmethod
+    def _asegurar_particiones(cur, categoria, anios_futuros=None):
+        """Particiones del año anterior, el actual, los futuros y los años presentes en DEFAULT"""
+        if anios_futuros is None:
+            anios_futuros = PARTICIONES_FUTURAS
+        anio_actual = date.today().year
+        anios = set(range(anio_actual - 1, anio_actual + anios_futuros + 1))
+        anios.update(particiones.anios_en_default(cur, categoria))
+        return particiones.asegurar_particiones(cur, categoria, anios)
+
+    def archivar(self, meses=None, categoria=None):
+        """Mover al archivo Parquet las mediciones con fecha anterior al corte (ARCHIVO_MESES meses atrás)"""
+        categorias = [categoria] if categoria else list(CATEGORIAS)
+        try:
+            corte = archivo.fecha_corte(meses)
+            with self.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión'}
+                
+                totales = {}
+                for cat in categorias:
+                    try:
+                        totales[cat] = archivo.archivar(conn, cat, self._tabla(cat), corte)
+                    finally:
+                        self.cache.invalidar(f'mediciones_{cat}')
+                
+                filas = sum(t['filas'] for t in totales.values())
+                return {
+                    'success': True,
+                    'message': f'✓ {filas} mediciones archivadas (fecha anterior a {corte.isoformat()})',
+                    'data': totales
+                }
+        except Exception as e:
+            return {'success': False, 'message': f'Error: {str(e)}'}
+
+    def _archivos(self, conn, categoria, filtros=None, cursor=None):
+        """Archivos Parquet del manifiesto que pueden contener filas de la consulta (anio, ruta)"""
+        cur = conn.cursor()
+        archivados = archivo.archivos(cur, categoria, filtros, decodificar_cursor(cursor) if cursor else None)
+        cur.close()
+        return archivados
+
+    @staticmethod
+    def _filas_archivo(archivados, filtros, campos, extra, cursor=None):
+        """Filas archivadas con las mismas columnas y el mismo orden que la consulta de mediciones"""
+        columnas = list(campos or COLUMNAS_CONSULTA) + list(extra)
+        return archivo.iterar(archivados, columnas, filtros, decodificar_cursor(cursor) if cursor else None)
+
+    def _combinar_archivo(self, mediciones, archivados, filtros, campos, extra, cursor=None, limite=None):
+        """Mezclar una página de la tabla con el archivo; el archivo se deja de leer al completar la página"""
+        filas = heapq.merge(
+            mediciones, self._filas_archivo(archivados, filtros, campos, extra, cursor), key=_clave_orden, reverse=True
+        )
+        return list(islice(filas, int(limite) + 1)) if limite else list(filas)
+
+    def insertar_medicion(self, categoria, tipo, punto, parametro, fecha, dato, nota=None):
+        """Insertar una nueva medición (punto y parámetro deben estar en el catálogo)"""
+        try:
+            tipo, punto, parametro = normalizar(tipo, punto, parametro)
+            self.catalogo.comprobar(categoria, tipo, punto, parametro)
+        except ValueError as e:
+            return {'success': False, 'message': f'Error: {str(e)}'}
+        try:
+            with self.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión'}
+                
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+                tabla = self._tabla(categoria)
+                
+                cur.execute(f'''
+                    INSERT INTO {tabla} (tipo, punto, parametro, fecha, dato, nota)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    RETURNING id, tipo, punto, parametro, fecha, dato, nota, timestamp
+                ''', (tipo, punto, parametro, fecha, float(dato), nota))
+                
+                nuevo_registro = cur.fetchone()
+                self._procesar_spc(
+                    conn.cursor(), categoria,
+                    [tuple(nuevo_registro[c] for c in COLUMNAS_MEDICION)], ids=[nuevo_registro['id']]
                 )
-            ''')
-        
-            # Tabla para microbiología
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS mediciones_microbiologia (
-                    id SERIAL PRIMARY KEY,
-                    tipo VARCHAR(50) NOT NULL,
-                    punto VARCHAR(50) NOT NULL,
-                    parametro VARCHAR(50) NOT NULL,
-                    fecha DATE NOT NULL,
-                    dato DECIMAL(10, 4) NOT NULL,
-                    nota TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                conn.commit()
+                cur.close()
+                self.cache.invalidar(tabla, conn)
+                
+                return {
+                    'success': True,
+                    'message': '✓ Datos guardados correctamente',
+                    'data': dict(nuevo_registro)
+                }
+        except Exception as e:
+            return {'success': False, 'message': f'Error: {str(e)}'}
+
+    def insertar_mediciones_bulk(self, categoria, filas, tamano_lote=None, metodo='copy', modo='duplicar', desde=None):
+        """Insertar muchas mediciones en una sola transacción (COPY o VALUES multi-fila).
+        
+        modo decide qué pasa con las filas cuya clave natural (tipo, punto, parametro, fecha)
+        ya está en la tabla: 'duplicar' las inserta igualmente, 'omitir' las descarta y
+        'sobrescribir' sustituye las filas existentes de esa clave. En esos dos modos las
+        filas se cargan primero en una tabla temporal y se fusionan con una sola sentencia.
+        Las filas con timestamp >= desde no cuentan como existentes: son de la misma
+        importación (bloques anteriores); la respuesta trae el desde para el bloque siguiente.
+        """
+        if metodo not in ('copy', 'values'):
+            return {'success': False, 'message': f'Método de inserción no soportado: {metodo}'}
+        if modo not in MODOS_IMPORTACION:
+            return {'success': False, 'message': f'Modo de importación no soportado: {modo}'}
+        
+        tamano_lote = tamano_lote or int(os.environ.get('DB_BULK_LOTE', 5000))
+        tabla = self._tabla(categoria)
+        columnas = ', '.join(COLUMNAS_MEDICION)
+        insertados = actualizados = omitidos = 0
+        errores = []
+        
+        try:
+            with self.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión', 'insertados': 0, 'errores': []}
+                
+                cur = conn.cursor()
+                cur.execute(f'SELECT {self.SQL_AHORA}')
+                desde = desde or cur.fetchone()[0]
+                destino = tabla if modo == 'duplicar' else self._crear_tabla_carga(cur, tabla)
+                lote = []
+                indices = []
+                insertadas = []
+                
+                for indice, fila in enumerate(filas):
+                    try:
+                        lote.append(self._tupla_medicion(fila))
+                        indices.append(indice)
+                    except (TypeError, ValueError) as e:
+                        errores.append({'indice': indice, 'error': str(e)})
+                        continue
+                    if len(lote) >= tamano_lote:
+                        insertados += self._insertar_lote(cur, destino, columnas, lote, indices, metodo, errores, insertadas)
+                        lote, indices = [], []
+                if lote:
+                    insertados += self._insertar_lote(cur, destino, columnas, lote, indices, metodo, errores, insertadas)
+                
+                if modo != 'duplicar':
+                    insertadas, actualizados, reemplazadas = self._fusionar_carga(cur, tabla, destino, modo, desde)
+                    omitidos = insertados - len(insertadas)
+                    insertados = len(insertadas) - actualizados
+                else:
+                    reemplazadas = set()
+                
+                self._procesar_spc(cur, categoria, insertadas, reemplazadas=reemplazadas)
+                conn.commit()
+                cur.close()
+                if insertados or actualizados:
+                    self.cache.invalidar(tabla, conn)
+                
+                mensaje = f'✓ {insertados} registros insertados'
+                if actualizados or omitidos:
+                    mensaje += f' ({actualizados} actualizados, {omitidos} omitidos)'
+                return {
+                    'success': True,
+                    'message': mensaje,
+                    'insertados': insertados,
+                    'actualizados': actualizados,
+                    'omitidos': omitidos,
+                    'errores': errores,
+                    'desde': desde
+                }
+        except Exception as e:
+            return {'success': False, 'message': f'Error: {str(e)}', 'insertados': 0, 'errores': errores}
+
+    def buscar_archivo_importado(self, categoria, huella):
+        """Importación anterior de un archivo con el mismo contenido (huella SHA-256), o None"""
+        try:
+            with self.conexion() as conn:
+                if not conn:
+                    return None
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+                cur.execute('''
+                    SELECT categoria, huella, nombre_archivo, importacion, filas, creado
+                    FROM archivos_importados WHERE categoria = %s AND huella = %s
+                ''', (categoria, huella))
+                fila = cur.fetchone()
+                cur.close()
+                return dict(fila) if fila else None
+        except Exception as e:
+            print(f"Error al buscar archivo importado: {e}")
+            return None
+
+    def registrar_archivo_importado(self, categoria, huella, nombre_archivo=None, filas=0, importacion=None):
+        """Guardar la huella de un archivo importado para no volver a procesarlo"""
+        try:
+            with self.conexion() as conn:
+                if not conn:
+                    return False
+                cur = conn.cursor()
+                cur.execute('''
+                    INSERT INTO archivos_importados (categoria, huella, nombre_archivo, importacion, filas)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (categoria, huella) DO NOTHING
+                ''', (categoria, huella, nombre_archivo, importacion, filas))
+                conn.commit()
+                cur.close()
+                return True
+        except Exception as e:
+            print(f"Error al registrar archivo importado: {e}")
+            return False
+
+    def recibir_sincronizacion(self, estacion, categoria, filas):
+        """Insertar mediciones enviadas por una estación embebida, exactamente una vez.
+        
+        filas son tuplas (id_local, tipo, punto, parametro, fecha, dato, nota) ordenadas por
+        id_local. La marca de agua de la estación se actualiza en la misma transacción que
+        la inserción, así que reenviar un lote ya recibido no duplica nada.
+        """
+        tabla = self._tabla(categoria)
+        columnas = ', '.join(COLUMNAS_MEDICION)
+        errores = []
+        try:
+            with self.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión'}
+                
+                cur = conn.cursor()
+                cur.execute('''
+                    INSERT INTO sincronizacion_estaciones (estacion, categoria) VALUES (%s, %s)
+                    ON CONFLICT (estacion, categoria) DO NOTHING
+                ''', (estacion, categoria))
+                # Bloquea la fila: dos envíos simultáneos de la misma estación se serializan
+                cur.execute(
+                    'SELECT ultimo_id FROM sincronizacion_estaciones WHERE estacion = %s AND categoria = %s FOR UPDATE',
+                    (estacion, categoria)
                 )
-            ''')
+                ultimo_id = cur.fetchone()[0]
+                
+                lote = []
+                indices = []
+                repetidos = 0
+                for fila in filas:
+                    if fila[0] <= ultimo_id:
+                        repetidos += 1
+                        continue
+                    try:
+                        lote.append(self._tupla_medicion(fila[1:]))
+                        indices.append(fila[0])
+                    except (TypeError, ValueError) as e:
+                        errores.append({'indice': fila[0], 'error': str(e)})
+                
+                insertadas = []
+                insertados = 0
+                if lote:
+                    insertados = self._insertar_lote(cur, tabla, columnas, lote, indices, 'copy', errores, insertadas)
+                    self._procesar_spc(cur, categoria, insertadas)
+                
+                hasta = max((fila[0] for fila in filas), default=ultimo_id)
+                cur.execute('''
+                    UPDATE sincronizacion_estaciones
+                    SET ultimo_id = GREATEST(ultimo_id, %s), actualizado = CURRENT_TIMESTAMP
+                    WHERE estacion = %s AND categoria = %s
+                ''', (hasta, estacion, categoria))
+                conn.commit()
+                cur.close()
+                if insertados:
+                    self.cache.invalidar(tabla, conn)
+                
+                return {
+                    'success': True,
+                    'message': f'✓ {insertados} registros sincronizados',
+                    'insertados': insertados,
+                    'repetidos': repetidos,
+                    'errores': errores,
+                    'ultimo_id': max(hasta, ultimo_id)
+                }
+        except Exception as e:
+            return {'success': False, 'message': f'Error: {str(e)}', 'errores': errores}
+
+    def insertar_mediciones_lote(self, items, clave_idempotencia=None, huella=None):
+        """Insertar un lote de mediciones (dicts de la API) en una transacción con estado por elemento.
+        
+        Con clave_idempotencia, la respuesta se guarda en la misma transacción y un reintento
+        con la misma clave devuelve esa respuesta sin volver a insertar.
+        """
+        try:
+            with self.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión'}
+                
+                cur = conn.cursor()
+                if clave_idempotencia:
+                    guardada = self._reservar_clave(cur, clave_idempotencia, huella)
+                    if guardada is not None:
+                        conn.rollback()
+                        return guardada
+                
+                resultados = [None] * len(items)
+                por_categoria = {}
+                for indice, item in enumerate(items):
+                    try:
+                        categoria, fila = self._validar_item(item)
+                        self.catalogo.comprobar(categoria, *fila[:3])
+                        indices, filas = por_categoria.setdefault(categoria, ([], []))
+                        indices.append(indice)
+                        filas.append(fila)
+                    except (TypeError, ValueError) as e:
+                        resultados[indice] = {'indice': indice, 'success': False, 'error': str(e)}
+                
+                for categoria, (indices, filas) in por_categoria.items():
+                    ids = self._insertar_filas_con_id(cur, self._tabla(categoria), filas)
+                    insertadas = []
+                    ids_insertadas = []
+                    for indice, fila, id_o_error in zip(indices, filas, ids):
+                        if isinstance(id_o_error, int):
+                            resultados[indice] = {'indice': indice, 'success': True, 'id': id_o_error, 'categoria': categoria}
+                            insertadas.append(fila)
+                            ids_insertadas.append(id_o_error)
+                        else:
+                            resultados[indice] = {'indice': indice, 'success': False, 'error': id_o_error}
+                    self._procesar_spc(cur, categoria, insertadas, ids=ids_insertadas)
+                
+                insertados = sum(1 for r in resultados if r['success'])
+                respuesta = {
+                    'success': True,
+                    'message': f'✓ {insertados} de {len(items)} mediciones guardadas',
+                    'insertados': insertados,
+                    'errores': len(items) - insertados,
+                    'resultados': resultados
+                }
+                if clave_idempotencia:
+                    cur.execute(
+                        'UPDATE claves_idempotencia SET respuesta = %s WHERE clave = %s',
+                        (json.dumps(respuesta), clave_idempotencia)
+                    )
+                conn.commit()
+                cur.close()
+                for categoria in por_categoria:
+                    self.cache.invalidar(self._tabla(categoria), conn)
+                return respuesta
+        except Exception as e:
+            return {'success': False, 'message': f'Error: {str(e)}'}
+
+    @classmethod
+    def _procesar_spc(cls, cur, categoria, filas, ids=None, reemplazadas=()):
+        """Actualizar el estado SPC con las filas insertadas (en la misma transacción).
+
+        Las series (punto, parametro) con filas sustituidas se reconstruyen enteras: su
+        estado y sus eventos incluían los datos borrados.
+        """
+        if reemplazadas:
+            spc.recalcular(cur.connection, categoria, cls._tabla(categoria), series=reemplazadas)
+            filas = [fila for fila in filas if (fila[1], fila[2]) not in reemplazadas]
+        spc.procesar(cur, categoria, filas, ids=ids)
+
+    @staticmethod
+    def _reservar_clave(cur, clave, huella):
+        """Registrar la clave de idempotencia; si ya existía devuelve la respuesta guardada"""
+        cur.execute(
+            'DELETE FROM claves_idempotencia WHERE clave = %s AND creado < CURRENT_TIMESTAMP - make_interval(hours => %s)',
+            (clave, HORAS_IDEMPOTENCIA)
+        )
+        # Si otra petición con la misma clave está en curso, esta espera a que confirme
+        cur.execute(
+            "INSERT INTO claves_idempotencia (clave, huella, respuesta) VALUES (%s, %s, '{}') ON CONFLICT (clave) DO NOTHING",
+            (clave, huella)
+        )
+        if cur.rowcount:
+            return None
+        cur.execute('SELECT huella, respuesta FROM claves_idempotencia WHERE clave = %s', (clave,))
+        huella_guardada, respuesta = cur.fetchone()
+        if huella_guardada != huella:
+            return {
+                'success': False,
+                'conflicto': True,
+                'message': 'La Idempotency-Key ya se usó con un contenido distinto'
+            }
+        return dict(respuesta, repetida=True)
+
+    @staticmethod
+    def _validar_item(item):
+        """Validar una medición de la API; devuelve (categoria, tupla en el orden de COLUMNAS_MEDICION)"""
+        if not isinstance(item, dict):
+            raise ValueError('cada medición debe ser un objeto JSON')
+        faltan = [c for c in ('tipo', 'punto', 'parametro', 'fecha', 'dato') if item.get(c) in (None, '')]
+        if faltan:
+            raise ValueError(f'faltan campos: {", ".join(faltan)}')
+        
+        tipo, punto, parametro = normalizar(item['tipo'], item['punto'], item['parametro'])
+        # Misma regla que /api/guardar: vapor y agua son fisicoquímica, el resto microbiología
+        categoria = item.get('categoria') or ('fisicoquimica' if tipo in ('vapor', 'agua') else 'microbiologia')
+        if categoria not in CATEGORIAS:
+            raise ValueError(f'categoría no válida: {categoria}')
+        try:
+            fecha = date.fromisoformat(str(item['fecha'])[:10])
+        except ValueError:
+            raise ValueError(f"fecha inválida '{item['fecha']}'")
+        try:
+            dato = float(item['dato'])
+        except (TypeError, ValueError):
+            raise ValueError(f"dato no numérico '{item['dato']}'")
+        if not math.isfinite(dato):
+            raise ValueError(f"dato no numérico '{item['dato']}'")
+        
+        nota = item.get('nota')
+        return categoria, (
+            tipo,
+            punto,
+            parametro,
+            fecha,
+            dato,
+            None if nota in (None, '') else str(nota)
+        )
+
+    @staticmethod
+    def _insertar_filas_con_id(cur, tabla, filas):
+        """INSERT multi-fila con RETURNING id; si falla, fila a fila. Devuelve el id o el error de cada fila"""
+        columnas = ', '.join(COLUMNAS_MEDICION)
+        cur.execute('SAVEPOINT lote_api')
+        try:
+            ids = execute_values(
+                cur, f'INSERT INTO {tabla} ({columnas}) VALUES %s RETURNING id', filas,
+                page_size=len(filas), fetch=True
+            )
+            cur.execute('RELEASE SAVEPOINT lote_api')
+            return [fila[0] for fila in ids]
+        except (psycopg2.DataError, psycopg2.IntegrityError):
+            cur.execute('ROLLBACK TO SAVEPOINT lote_api')
+        
+        resultado = []
+        for fila in filas:
+            cur.execute('SAVEPOINT fila_api')
+            try:
+                cur.execute(f'INSERT INTO {tabla} ({columnas}) VALUES (%s, %s, %s, %s, %s, %s) RETURNING id', fila)
+                resultado.append(cur.fetchone()[0])
+                cur.execute('RELEASE SAVEPOINT fila_api')
+            except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+                cur.execute('ROLLBACK TO SAVEPOINT fila_api')
+                resultado.append(str(e).strip().splitlines()[0])
+        cur.execute('RELEASE SAVEPOINT lote_api')
+        return resultado
+
+    @staticmethod
+    def _tupla_medicion(fila):
+        """Normalizar una fila (dict o secuencia en el orden de COLUMNAS_MEDICION)"""
+        if isinstance(fila, dict):
+            fila = tuple(fila.get(col) for col in COLUMNAS_MEDICION)
+        tipo, punto, parametro, fecha, dato, nota = fila
+        return (tipo, punto, parametro, fecha, float(dato), nota)
+
+    @staticmethod
+    def _crear_tabla_carga(cur, tabla):
+        """Tabla temporal con las columnas y restricciones de `tabla`, para validar las filas antes de fusionarlas"""
+        cur.execute(f'CREATE TEMP TABLE carga_mediciones (LIKE {tabla} INCLUDING CONSTRAINTS) ON COMMIT DROP')
+        cur.execute('ALTER TABLE carga_mediciones DROP COLUMN id')
+        return 'carga_mediciones'
+
+    @staticmethod
+    def _fusionar_carga(cur, tabla, carga, modo, desde):
+        """Pasar las filas de la tabla de carga a `tabla` según el modo ('omitir' o 'sobrescribir').
+        
+        Devuelve (filas insertadas en el orden de COLUMNAS_MEDICION, cuántas sustituyen a
+        filas existentes, series (punto, parametro) con filas sustituidas). Las filas ya
+        archivadas en Parquet no se comparan.
+        """
+        columnas = ', '.join(COLUMNAS_MEDICION)
+        existe = f'''
+            SELECT 1 FROM {tabla} m
+            WHERE m.tipo = c.tipo AND m.punto = c.punto AND m.parametro = c.parametro
+              AND m.fecha = c.fecha AND m.timestamp < %s
+        '''
+        actualizados = 0
+        reemplazadas = set()
+        if modo == 'sobrescribir':
+            cur.execute(f'''
+                SELECT c.punto, c.parametro, COUNT(*) FROM {carga} c WHERE EXISTS ({existe})
+                GROUP BY c.punto, c.parametro
+            ''', (desde,))
+            for punto, parametro, n in cur.fetchall():
+                reemplazadas.add((punto, parametro))
+                actualizados += n
+            cur.execute(f'''
+                DELETE FROM {tabla}
+                WHERE (tipo, punto, parametro, fecha) IN (SELECT tipo, punto, parametro, fecha FROM {carga})
+                  AND timestamp < %s
+            ''', (desde,))
+            cur.execute(f'INSERT INTO {tabla} ({columnas}) SELECT {columnas} FROM {carga} RETURNING {columnas}')
+        else:
+            cur.execute(f'''
+                INSERT INTO {tabla} ({columnas})
+                SELECT {columnas} FROM {carga} c WHERE NOT EXISTS ({existe})
+                RETURNING {columnas}
+            ''', (desde,))
+        return [tuple(fila) for fila in cur.fetchall()], actualizados, reemplazadas
+
+    def _insertar_lote(self, cur, tabla, columnas, lote, indices, metodo, errores, insertadas):
+        """Insertar un lote dentro de un savepoint; si falla, aislar las filas erróneas.
+        
+        Las filas que quedan insertadas se añaden a `insertadas`.
+        """
+        cur.execute('SAVEPOINT lote_bulk')
+        try:
+            if metodo == 'copy':
+                buffer = io.StringIO()
+                writer = csv.writer(buffer, lineterminator='\n')
+                for fila in lote:
+                    writer.writerow(['' if v is None else v for v in fila])
+                buffer.seek(0)
+                cur.copy_expert(f'COPY {tabla} ({columnas}) FROM STDIN WITH (FORMAT csv)', buffer)
+            else:
+                execute_values(cur, f'INSERT INTO {tabla} ({columnas}) VALUES %s', lote, page_size=len(lote))
+            cur.execute('RELEASE SAVEPOINT lote_bulk')
+            insertadas.extend(lote)
+            return len(lote)
+        except (psycopg2.DataError, psycopg2.IntegrityError):
+            cur.execute('ROLLBACK TO SAVEPOINT lote_bulk')
+        
+        # Reintento fila a fila para conservar las válidas y reportar las erróneas
+        insertados = 0
+        for indice, fila in zip(indices, lote):
+            cur.execute('SAVEPOINT fila_bulk')
+            try:
+                cur.execute(f'INSERT INTO {tabla} ({columnas}) VALUES (%s, %s, %s, %s, %s, %s)', fila)
+                cur.execute('RELEASE SAVEPOINT fila_bulk')
+                insertadas.append(fila)
+                insertados += 1
+            except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+                cur.execute('ROLLBACK TO SAVEPOINT fila_bulk')
+                errores.append({'indice': indice, 'error': str(e).strip().splitlines()[0]})
+        cur.execute('RELEASE SAVEPOINT lote_bulk')
+        return insertados
+
+    def obtener_mediciones(self, categoria, filtros=None, limite=None, cursor=None, campos=None):
+        """Obtener mediciones con filtros opcionales (resultado cacheado hasta la próxima escritura)"""
+        return self.cache.consultar(
+            f'mediciones_{categoria}', 'mediciones', (filtros, limite, cursor, campos),
+            lambda: self._obtener_mediciones(categoria, filtros, limite, cursor, campos)
+        )
+
+    def _obtener_mediciones(self, categoria, filtros=None, limite=None, cursor=None, campos=None):
+        """Obtener mediciones con filtros opcionales, paginadas por clave (fecha, timestamp, id)"""
+        try:
+            consulta, params, extra = self._consulta_mediciones(categoria, filtros, campos, cursor)
+            if limite:
+                consulta += ' LIMIT %s'
+                params.append(int(limite) + 1)
             
-            # Índices
-            cur.execute('CREATE INDEX IF NOT EXISTS idx_fisico_fecha ON mediciones_fisicoquimica(fecha)')
-            cur.execute('CREATE INDEX IF NOT EXISTS idx_fisico_punto ON mediciones_fisicoquimica(punto)')
-            cur.execute('CREATE INDEX IF NOT EXISTS idx_fisico_parametro ON mediciones_fisicoquimica(parametro)')
-            cur.execute('CREATE INDEX IF NOT EXISTS idx_micro_fecha ON mediciones_microbiologia(fecha)')
+            with self.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión'}
+                
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+                cur.execute(consulta, params)
+                mediciones = cur.fetchall()
+                cur.close()
+                archivados = self._archivos(conn, categoria, filtros, cursor)
             
-            conn.commit()
-            cur.close()
-            conn.close()
-            print("✓ Base de datos inicializada correctamente")
-            return True
+            if archivados:
+                mediciones = self._combinar_archivo(mediciones, archivados, filtros, campos, extra, cursor, limite)
+            return self._pagina_mediciones(mediciones, limite, extra)
+        except ValueError as e:
+            return {'success': False, 'message': str(e)}
+        except Exception as e:
+            return {'success': False, 'message': f'Error: {str(e)}'}
+
+    def _pagina_mediciones(self, mediciones, limite, extra):
+        """Respuesta de una página: se pidió una fila de más para saber si hay siguiente"""
+        siguiente = None
+        if limite and len(mediciones) > int(limite):
+            mediciones = mediciones[:int(limite)]
+            ultima = mediciones[-1]
+            siguiente = codificar_cursor(ultima['fecha'], ultima['timestamp'], ultima['id'])
+        
+        return {
+            'success': True,
+            'data': [self._proyectar(m, extra) for m in mediciones],
+            'siguiente': siguiente
+        }
+
+    def iterar_mediciones(self, categoria, filtros=None, campos=None, cursor=None, tamano_lote=2000):
+        """Recorrer mediciones con un cursor de servidor, sin cargar el resultado en memoria"""
+        # La consulta se construye (y valida) al llamar, no al empezar a iterar
+        consulta, params, extra = self._consulta_mediciones(categoria, filtros, campos, cursor)
+        return self._iterar_consulta(consulta, params, extra, tamano_lote, categoria, filtros, campos, cursor)
+
+    def _iterar_consulta(self, consulta, params, extra, tamano_lote, categoria, filtros=None, campos=None, cursor=None):
+        """Ejecutar una consulta con cursor con nombre y producir las filas por lotes (mezcladas con el archivo)"""
+        with self.conexion() as conn:
+            if not conn:
+                raise ConnectionError('Error de conexión')
             
+            archivados = self._archivos(conn, categoria, filtros, cursor)
+            cur = conn.cursor(name=f'mediciones_{uuid.uuid4().hex}', cursor_factory=RealDictCursor)
+            cur.itersize = tamano_lote
+            try:
+                cur.execute(consulta, params)
+                filas = cur
+                if archivados:
+                    filas = heapq.merge(
+                        cur, self._filas_archivo(archivados, filtros, campos, extra, cursor),
+                        key=_clave_orden, reverse=True
+                    )
+                for medicion in filas:
+                    yield self._proyectar(medicion, extra)
+            finally:
+                cur.close()
+
+    def _consulta_mediciones(self, categoria, filtros=None, campos=None, cursor=None):
+        """Construir el SELECT de mediciones; devuelve (sql, params, columnas añadidas solo para paginar)"""
+        tabla = self._tabla(categoria)
+        
+        campos = list(campos) if campos else list(COLUMNAS_CONSULTA)
+        desconocidos = [c for c in campos if c not in COLUMNAS_CONSULTA]
+        if desconocidos:
+            raise ValueError(f'Campos no válidos: {", ".join(desconocidos)}')
+        extra = [c for c in COLUMNAS_CLAVE if c not in campos]
+        columnas = ', '.join(f'"{c}"' for c in campos + extra)
+        
+        query = f'SELECT {columnas} FROM {tabla}'
+        conditions = []
+        params = []
+        
+        if filtros:
+            for campo in ('tipo', 'punto', 'parametro'):
+                if filtros.get(campo):
+                    conditions.append(f'{campo} = %s')
+                    params.append(filtros[campo])
+            if filtros.get('fecha_inicio'):
+                conditions.append('fecha >= %s')
+                params.append(filtros['fecha_inicio'])
+            if filtros.get('fecha_fin'):
+                conditions.append('fecha <= %s')
+                params.append(filtros['fecha_fin'])
+        
+        if cursor:
+            conditions.append('(fecha, timestamp, id) < (%s, %s, %s)')
+            params.extend(decodificar_cursor(cursor))
+        
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        
+        query += ' ORDER BY fecha DESC, timestamp DESC, id DESC'
+        return query, params, extra
+
+    @staticmethod
+    def _proyectar(medicion, extra):
+        """Quitar de la fila las columnas que solo se pidieron para paginar"""
+        medicion = dict(medicion)
+        for columna in extra:
+            medicion.pop(columna, None)
+        return medicion
+
+    @staticmethod
+    def _tabla(categoria):
+        """Nombre de la tabla de una categoría (evita interpolar valores arbitrarios en el SQL)"""
+        if categoria not in CATEGORIAS:
+            raise ValueError(f'Categoría no válida: {categoria}')
+        return f'mediciones_{categoria}'
+
+    def obtener_estadisticas(self, categoria, punto=None, parametro=None, fecha_inicio=None, fecha_fin=None):
+        """Estadísticas de un punto/parámetro (resultado cacheado hasta la próxima escritura)"""
+        return self.cache.consultar(
+            f'mediciones_{categoria}', 'estadisticas', (punto, parametro, fecha_inicio, fecha_fin),
+            lambda: self._obtener_estadisticas(categoria, punto, parametro, fecha_inicio, fecha_fin)
+        )
+
+    def _obtener_estadisticas(self, categoria, punto=None, parametro=None, fecha_inicio=None, fecha_fin=None):
+        """Obtener estadísticas combinando los resúmenes diarios (sin recorrer las mediciones)"""
+        try:
+            query, params = self._consulta_estadisticas(categoria, punto, parametro, fecha_inicio, fecha_fin)
+            with self.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión'}
+                
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+                cur.execute(query, params)
+                stats = cur.fetchone()
+                cur.close()
+                
+                return {
+                    'success': True,
+                    'data': dict(stats)
+                }
         except Exception as e:
-            print(f"Error al inicializar la base de datos: {e}")
-            if conn:
-                conn.close()
-            return False
+            return {'success': False, 'message': f'Error: {str(e)}'}
 
-    def insertar_medicion(self, categoria, tipo, punto, parametro, fecha, dato, nota=None):
-        """Insertar una nueva medición"""
-        conn = self.get_connection()
-        if not conn:
-            return {'success': False, 'message': 'Error de conexión'}
+    def _consulta_estadisticas(self, categoria, punto=None, parametro=None, fecha_inicio=None, fecha_fin=None):
+        """Construir la consulta de estadísticas sobre los resúmenes diarios; devuelve (sql, params)"""
+        self._tabla(categoria)
+        tabla = f'resumen_diario_{categoria}'
+        
+        # Varianza muestral a partir de n, Σx y Σx² (mismo cálculo que STDDEV sobre NUMERIC)
+        query = f'''
+            SELECT 
+                COALESCE(SUM(n), 0)::bigint as total,
+                SUM(suma) / NULLIF(SUM(n), 0) as promedio,
+                MAX(maximo) as maximo,
+                MIN(minimo) as minimo,
+                CASE WHEN SUM(n) > 1 THEN
+                    SQRT(GREATEST((SUM(suma_cuadrados) - SUM(suma) * SUM(suma) / SUM(n)) / (SUM(n) - 1), 0))
+                END as desviacion_estandar
+            FROM {tabla}
+            WHERE 1=1
+        '''
+        params = []
         
+        if punto:
+            query += ' AND punto = %s'
+            params.append(punto)
+        if parametro:
+            query += ' AND parametro = %s'
+            params.append(parametro)
+        if fecha_inicio:
+            query += ' AND fecha >= %s'
+            params.append(fecha_inicio)
+        if fecha_fin:
+            query += ' AND fecha <= %s'
+            params.append(fecha_fin)
+        return query, params
+
+    def recalcular_resumenes(self, categoria=None):
+        """Reconstruir desde cero los resúmenes diarios (relleno inicial o reparación)"""
+        categorias = [categoria] if categoria else list(CATEGORIAS)
         try:
-            cur = conn.cursor(cursor_factory=RealDictCursor)
-            tabla = f'mediciones_{categoria}'
+            with self.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión'}
+                
+                cur = conn.cursor()
+                totales = {}
+                for cat in categorias:
+                    self._tabla(cat)
+                    totales[cat] = self._recalcular_resumen(cur, cat)
+                    self._sumar_archivo_al_resumen(conn, cur, cat)
+                conn.commit()
+                cur.close()
+                for cat in categorias:
+                    self.cache.invalidar(f'mediciones_{cat}', conn)
+                
+                return {
+                    'success': True,
+                    'message': '✓ Resúmenes recalculados',
+                    'data': totales
+                }
+        except Exception as e:
+            return {'success': False, 'message': f'Error: {str(e)}'}
+
+    @staticmethod
+    def _recalcular_resumen(cur, categoria):
+        """Vaciar y rellenar el resumen de una categoría; bloquea escrituras concurrentes mientras tanto"""
+        cur.execute(f'LOCK TABLE mediciones_{categoria} IN SHARE MODE')
+        cur.execute(f'TRUNCATE resumen_diario_{categoria}')
+        cur.execute(f'''
+            INSERT INTO resumen_diario_{categoria} (tipo, punto, parametro, fecha, n, suma, suma_cuadrados, minimo, maximo)
+            SELECT tipo, punto, parametro, fecha, COUNT(*), SUM(dato), SUM(dato * dato), MIN(dato), MAX(dato)
+            FROM mediciones_{categoria}
+            GROUP BY tipo, punto, parametro, fecha
+        ''')
+        return cur.rowcount
+
+    def _sumar_archivo_al_resumen(self, conn, cur, categoria):
+        """Añadir al resumen recién reconstruido los agregados diarios de las filas archivadas"""
+        filas = archivo.resumen_diario(self._archivos(conn, categoria))
+        if filas:
+            execute_values(cur, f'''
+                INSERT INTO resumen_diario_{categoria} AS r (tipo, punto, parametro, fecha, n, suma, suma_cuadrados, minimo, maximo)
+                VALUES %s
+                ON CONFLICT (punto, parametro, fecha, tipo) DO UPDATE SET
+                    n = r.n + EXCLUDED.n,
+                    suma = r.suma + EXCLUDED.suma,
+                    suma_cuadrados = r.suma_cuadrados + EXCLUDED.suma_cuadrados,
+                    minimo = LEAST(r.minimo, EXCLUDED.minimo),
+                    maximo = GREATEST(r.maximo, EXCLUDED.maximo)
+            ''', filas)
+        return len(filas)
+
+    def obtener_estadisticas_agrupadas(self, categoria, fecha_inicio=None, fecha_fin=None, tipo=None):
+        """Estadísticas de todos los grupos (resultado cacheado hasta la próxima escritura)"""
+        return self.cache.consultar(
+            f'mediciones_{categoria}', 'estadisticas_agrupadas', (fecha_inicio, fecha_fin, tipo),
+            lambda: self._obtener_estadisticas_agrupadas(categoria, fecha_inicio, fecha_fin, tipo)
+        )
+
+    def _obtener_estadisticas_agrupadas(self, categoria, fecha_inicio=None, fecha_fin=None, tipo=None):
+        """Estadísticas de todos los grupos (tipo, punto, parametro) en una sola consulta"""
+        try:
+            tabla = self._tabla(categoria)
+            condiciones = []
+            params = []
+            if tipo:
+                condiciones.append('tipo = %s')
+                params.append(tipo)
+            if fecha_inicio:
+                condiciones.append('fecha >= %s')
+                params.append(fecha_inicio)
+            if fecha_fin:
+                condiciones.append('fecha <= %s')
+                params.append(fecha_fin)
+            where = ('WHERE ' + ' AND '.join(condiciones)) if condiciones else ''
+            percentiles = ', '.join(str(p) for p in PERCENTILES)
             
-            cur.execute(f'''
-                INSERT INTO {tabla} (tipo, punto, parametro, fecha, dato, nota)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                RETURNING id, tipo, punto, parametro, fecha, dato, nota, timestamp
-            ''', (tipo, punto, parametro, fecha, float(dato), nota))
+            query = f'''
+                WITH filtradas AS (
+                    SELECT id, tipo, punto, parametro, fecha, dato, timestamp FROM {tabla} {where}
+                ),
+                ultimos AS (
+                    SELECT DISTINCT ON (tipo, punto, parametro)
+                        tipo, punto, parametro, dato AS ultimo_valor, fecha AS ultima_fecha
+                    FROM filtradas
+                    ORDER BY tipo, punto, parametro, fecha DESC, timestamp DESC, id DESC
+                )
+                SELECT
+                    f.tipo, f.punto, f.parametro,
+                    COUNT(*) as total,
+                    AVG(f.dato) as promedio,
+                    MAX(f.dato) as maximo,
+                    MIN(f.dato) as minimo,
+                    STDDEV(f.dato) as desviacion_estandar,
+                    percentile_cont(ARRAY[{percentiles}]) WITHIN GROUP (ORDER BY f.dato) as percentiles,
+                    u.ultimo_valor,
+                    u.ultima_fecha
+                FROM filtradas f
+                JOIN ultimos u USING (tipo, punto, parametro)
+                GROUP BY f.tipo, f.punto, f.parametro, u.ultimo_valor, u.ultima_fecha
+                ORDER BY f.tipo, f.punto, f.parametro
+            '''
             
-            nuevo_registro = cur.fetchone()
-            conn.commit()
-            cur.close()
-            conn.close()
+            with self.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión'}
+                
+                archivados = self._archivos(
+                    conn, categoria, {'tipo': tipo, 'fecha_inicio': fecha_inicio, 'fecha_fin': fecha_fin}
+                )
+                if archivados:
+                    # Tabla agregada en SQL y archivo agregado en pyarrow; se combinan grupo a grupo
+                    cur = conn.cursor()
+                    grupos = self._agregados_tabla(
+                        cur, tabla, ('tipo', 'punto', 'parametro'), where, params, percentiles=True
+                    )
+                    cur.close()
+                    for clave, agregados in archivo.agregados_grupos(
+                        archivados, {'tipo': tipo, 'fecha_inicio': fecha_inicio, 'fecha_fin': fecha_fin}
+                    ).items():
+                        grupos[clave] = _combinar_agregados(grupos[clave], agregados) if clave in grupos else agregados
+                    return {'success': True, 'data': [
+                        _estadisticas_agregados(*clave, grupos[clave]) for clave in sorted(grupos)
+                    ]}
+                
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+                cur.execute(query, params)
+                grupos = cur.fetchall()
+                cur.close()
             
-            return {
-                'success': True,
-                'message': '✓ Datos guardados correctamente',
-                'data': dict(nuevo_registro)
-            }
+            data = []
+            for grupo in grupos:
+                grupo = dict(grupo)
+                valores = grupo.pop('percentiles')
+                for percentil, valor in zip(PERCENTILES, valores):
+                    if percentil == 0.5:
+                        grupo['mediana'] = valor
+                    else:
+                        grupo[f'p{round(percentil * 100):02d}'] = valor
+                data.append(grupo)
+            
+            return {'success': True, 'data': data}
+        except ValueError as e:
+            return {'success': False, 'message': str(e)}
         except Exception as e:
-            if conn:
-                conn.close()
             return {'success': False, 'message': f'Error: {str(e)}'}
 
-    def obtener_mediciones(self, categoria, filtros=None):
-        """Obtener mediciones con filtros opcionales"""
-        conn = self.get_connection()
-        if not conn:
-            return {'success': False, 'message': 'Error de conexión'}
-        
+    @staticmethod
+    def _agrupar_estadisticas(filas):
+        """Estadísticas por grupo a partir de filas (tipo, punto, parametro, fecha, dato, ...) ordenadas
+        por grupo y en orden cronológico; mismas claves que la consulta agrupada de Postgres"""
+        data = []
+        for (tipo, punto, parametro), grupo in groupby(filas, key=lambda f: (f[0], f[1], f[2])):
+            grupo = list(grupo)
+            datos = np.array([float(f[4]) for f in grupo])
+            percentiles = np.percentile(datos, [p * 100 for p in PERCENTILES])
+            resultado = {
+                'tipo': tipo,
+                'punto': punto,
+                'parametro': parametro,
+                'total': len(grupo),
+                'promedio': float(datos.mean()),
+                'maximo': max(f[4] for f in grupo),
+                'minimo': min(f[4] for f in grupo),
+                'desviacion_estandar': float(datos.std(ddof=1)) if len(datos) > 1 else None,
+                'ultimo_valor': grupo[-1][4],
+                'ultima_fecha': grupo[-1][3],
+            }
+            for percentil, valor in zip(PERCENTILES, percentiles.tolist()):
+                if percentil == 0.5:
+                    resultado['mediana'] = valor
+                else:
+                    resultado[f'p{round(percentil * 100):02d}'] = valor
+            data.append(resultado)
+        return data
+
+    @staticmethod
+    def _agregados_tabla(cur, tabla, claves, where, params, percentiles=False):
+        """{clave: agregados} de las filas de la tabla agrupadas por `claves`, con las mismas claves
+        que archivo.agregados_grupos/agregados_celdas; con percentiles=True, la rejilla CUANTILES"""
+        grupo = ', '.join(claves)
+        columnas = ', '.join(dict.fromkeys(list(claves) + ['fecha', 'timestamp', 'id', 'dato']))
+        fila = lambda orden: ', '.join(
+            f'MAX({c}) FILTER (WHERE {orden} = 1)' for c in ('fecha', 'timestamp', 'id', 'dato')
+        )
+        rejilla = (
+            f", percentile_cont(ARRAY[{', '.join(str(q) for q in CUANTILES)}]) WITHIN GROUP (ORDER BY dato)"
+        ) if percentiles else ''
+        cur.execute(f'''
+            SELECT {grupo}, COUNT(*), SUM(dato), SUM(dato * dato), MIN(dato), MAX(dato),
+                {fila('primera')}, {fila('ultima')}{rejilla}
+            FROM (
+                SELECT {columnas},
+                    ROW_NUMBER() OVER (PARTITION BY {grupo} ORDER BY fecha, timestamp NULLS FIRST, id) AS primera,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY {grupo} ORDER BY fecha DESC, timestamp DESC NULLS LAST, id DESC
+                    ) AS ultima
+                FROM {tabla} {where}
+            ) m
+            GROUP BY {grupo}
+        ''', params)
+        resultado = {}
+        for valores in cur.fetchall():
+            clave, resto = valores[:len(claves)], valores[len(claves):]
+            agregados = {
+                'n': resto[0],
+                'suma': resto[1],
+                'suma_cuadrados': resto[2],
+                'minimo': resto[3],
+                'maximo': resto[4],
+                'primera': tuple(resto[5:9]),
+                'ultima': tuple(resto[9:13]),
+            }
+            if percentiles:
+                agregados['rejilla'] = resto[13]
+            resultado[tuple(clave)] = agregados
+        return resultado
+
+    def obtener_series(self, categoria, series, fecha_inicio=None, fecha_fin=None, max_puntos=600, metodo='lttb'):
+        """Series temporales reducidas a max_puntos cada una (resultado cacheado hasta la próxima escritura)"""
+        return self.cache.consultar(
+            f'mediciones_{categoria}', 'series', (series, fecha_inicio, fecha_fin, max_puntos, metodo),
+            lambda: self._obtener_series(categoria, series, fecha_inicio, fecha_fin, max_puntos, metodo)
+        )
+
+    def _obtener_series(self, categoria, series, fecha_inicio=None, fecha_fin=None, max_puntos=600, metodo='lttb'):
+        """Leer cada serie (punto, parametro y tipo opcional) del índice compuesto y reducirla en NumPy"""
         try:
-            cur = conn.cursor(cursor_factory=RealDictCursor)
-            tabla = f'mediciones_{categoria}'
-            query = f'SELECT * FROM {tabla}'
-            params = []
+            tabla = self._tabla(categoria)
+            if metodo not in METODOS_REDUCCION:
+                raise ValueError(f'Método de reducción no soportado: {metodo}')
             
-            if filtros:
-                conditions = []
-                if 'punto' in filtros:
-                    conditions.append('punto = %s')
-                    params.append(filtros['punto'])
-                if 'parametro' in filtros:
-                    conditions.append('parametro = %s')
-                    params.append(filtros['parametro'])
-                if 'fecha_inicio' in filtros:
-                    conditions.append('fecha >= %s')
-                    params.append(filtros['fecha_inicio'])
-                if 'fecha_fin' in filtros:
-                    conditions.append('fecha <= %s')
-                    params.append(filtros['fecha_fin'])
-                
-                if conditions:
-                    query += ' WHERE ' + ' AND '.join(conditions)
-            
-            query += ' ORDER BY fecha DESC, timestamp DESC'
-            cur.execute(query, params)
-            mediciones = cur.fetchall()
-            cur.close()
-            conn.close()
+            with self.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión'}
+                
+                cur = conn.cursor()
+                data = []
+                for serie in series:
+                    condiciones = ['punto = %s', 'parametro = %s']
+                    params = [serie['punto'], serie['parametro']]
+                    if serie.get('tipo'):
+                        condiciones.append('tipo = %s')
+                        params.append(serie['tipo'])
+                    if fecha_inicio:
+                        condiciones.append('fecha >= %s')
+                        params.append(fecha_inicio)
+                    if fecha_fin:
+                        condiciones.append('fecha <= %s')
+                        params.append(fecha_fin)
+                    
+                    # Solo columnas del índice (fecha como días desde 1970): index-only scan
+                    cur.execute(f"""
+                        SELECT {self.SQL_SERIE}
+                        FROM {tabla}
+                        WHERE {' AND '.join(condiciones)}
+                        ORDER BY fecha, timestamp, id
+                    """, params)
+                    valores = np.array(cur.fetchall(), dtype=np.float64).reshape(-1, 2)
+                    dias, datos = valores[:, 0], valores[:, 1]
+                    
+                    filtros = {
+                        'punto': serie['punto'], 'parametro': serie['parametro'], 'tipo': serie.get('tipo'),
+                        'fecha_inicio': fecha_inicio, 'fecha_fin': fecha_fin
+                    }
+                    archivados = self._archivos(conn, categoria, filtros)
+                    if archivados:
+                        # Archivo primero: en un mismo día el orden estable deja antes lo archivado
+                        dias_archivo, datos_archivo = archivo.leer_serie(archivados, filtros)
+                        dias = np.concatenate([dias_archivo, dias])
+                        datos = np.concatenate([datos_archivo, datos])
+                        orden = np.argsort(dias, kind='stable')
+                        dias, datos = dias[orden], datos[orden]
+                    indices = reducir(dias, datos, max_puntos, metodo)
+                    fechas = dias[indices].astype('datetime64[D]').astype(str)
+                    
+                    data.append({
+                        'punto': serie['punto'],
+                        'parametro': serie['parametro'],
+                        'tipo': serie.get('tipo'),
+                        'total': len(datos),
+                        'puntos': [[f, d] for f, d in zip(fechas.tolist(), datos[indices].tolist())]
+                    })
+                cur.close()
             
+            return {'success': True, 'metodo': metodo, 'data': data}
+        except ValueError as e:
+            return {'success': False, 'message': str(e)}
+        except Exception as e:
+            return {'success': False, 'message': f'Error: {str(e)}'}
+
+    def obtener_matriz(self, categoria, punto, tipo=None, parametros=None, fecha_inicio=None, fecha_fin=None,
+                       agregado='promedio'):
+        """Matriz fecha × parámetro de un punto (resultado cacheado hasta la próxima escritura).
+
+        Las columnas son `parametros` o, si no se indican, los del punto en el catálogo.
+        """
+        if not parametros:
+            parametros = self._parametros_catalogo(categoria, punto, tipo)
+        parametros = tuple(parametros) if parametros else None
+        return self.cache.consultar(
+            f'mediciones_{categoria}', 'matriz', (punto, tipo, parametros, fecha_inicio, fecha_fin, agregado),
+            lambda: self._obtener_matriz(categoria, punto, tipo, parametros, fecha_inicio, fecha_fin, agregado)
+        )
+
+    def _parametros_catalogo(self, categoria, punto, tipo=None):
+        """Parámetros de un punto en el orden del catálogo (None si el punto no está dado de alta)"""
+        estructura, _ = self.catalogo.estructura()
+        for tipo_catalogo, puntos in estructura.get(categoria, {}).items():
+            if (not tipo or tipo == tipo_catalogo) and punto in puntos:
+                return puntos[punto]
+        return None
+
+    def _obtener_matriz(self, categoria, punto, tipo=None, parametros=None, fecha_inicio=None, fecha_fin=None,
+                        agregado='promedio'):
+        """Pivotar en SQL con agregación condicional: una fila por fecha y una columna CASE por parámetro"""
+        try:
+            tabla = self._tabla(categoria)
+            if agregado not in AGREGADOS_MATRIZ:
+                raise ValueError(f'Agregado no soportado: {agregado}')
+            if not punto:
+                raise ValueError('Indique el punto de muestreo')
+            funcion, orden, _ = AGREGADOS_MATRIZ[agregado]
+            filtros = {'punto': punto, 'tipo': tipo, 'fecha_inicio': fecha_inicio, 'fecha_fin': fecha_fin}
+            condiciones = ['punto = %s']
+            params = [punto]
+            if tipo:
+                condiciones.append('tipo = %s')
+                params.append(tipo)
+            if fecha_inicio:
+                condiciones.append('fecha >= %s')
+                params.append(fecha_inicio)
+            if fecha_fin:
+                condiciones.append('fecha <= %s')
+                params.append(fecha_fin)
+
+            with self.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión'}
+
+                cur = conn.cursor()
+                if not parametros:
+                    # Punto fuera del catálogo: los parámetros medidos en el rango (el resumen incluye lo archivado)
+                    cur.execute(f"""
+                        SELECT parametro FROM resumen_diario_{categoria}
+                        WHERE {' AND '.join(condiciones)}
+                        GROUP BY parametro ORDER BY parametro
+                    """, params)
+                    parametros = [fila[0] for fila in cur.fetchall()]
+                parametros = list(parametros)
+
+                if not parametros:
+                    fechas, columnas = [], []
+                else:
+                    condiciones.append(f"parametro IN ({', '.join(['%s'] * len(parametros))})")
+                    params.extend(parametros)
+                    where = ' AND '.join(condiciones)
+                    archivados = self._archivos(conn, categoria, filtros)
+                    if archivados:
+                        # Tabla y archivo se agregan por día y parámetro y se combinan celda a celda
+                        celdas = self._agregados_tabla(cur, tabla, ('fecha', 'parametro'), f'WHERE {where}', params)
+                        for clave, agregados in archivo.agregados_celdas(archivados, filtros, parametros).items():
+                            celdas[clave] = _combinar_agregados(celdas[clave], agregados) if clave in celdas else agregados
+                        fechas, columnas = self._pivotar_matriz(celdas, parametros, agregado)
+                    else:
+                        # primero/ultimo: ROW_NUMBER marca la muestra que cuenta de cada día y parámetro
+                        numerar = (
+                            f', ROW_NUMBER() OVER (PARTITION BY fecha, parametro '
+                            f'ORDER BY timestamp {orden}, id {orden}) AS orden'
+                        ) if orden else ''
+                        muestra = ' AND orden = 1' if orden else ''
+                        celdas = ', '.join(
+                            f'{funcion}(CASE WHEN parametro = %s{muestra} THEN dato END)' for _ in parametros
+                        )
+                        cur.execute(f"""
+                            SELECT fecha, {celdas}
+                            FROM (SELECT fecha, parametro, dato{numerar} FROM {tabla} WHERE {where}) m
+                            GROUP BY fecha
+                            ORDER BY fecha
+                        """, parametros + params)
+                        filas = cur.fetchall()
+                        fechas = [fila[0] for fila in filas]
+                        columnas = [[fila[i] for fila in filas] for i in range(1, len(parametros) + 1)]
+                        if agregado != 'n':
+                            columnas = [[None if v is None else float(v) for v in columna] for columna in columnas]
+                cur.close()
+
             return {
                 'success': True,
-                'data': [dict(m) for m in mediciones]
+                'punto': punto,
+                'tipo': tipo,
+                'agregado': agregado,
+                'parametros': parametros,
+                'fechas': [f.isoformat() for f in fechas],
+                'columnas': dict(zip(parametros, columnas))
             }
+        except ValueError as e:
+            return {'success': False, 'message': str(e)}
         except Exception as e:
-            if conn:
-                conn.close()
             return {'success': False, 'message': f'Error: {str(e)}'}
 
-    def obtener_estadisticas(self, categoria, punto=None, parametro=None):
-        """Obtener estadísticas"""
-        conn = self.get_connection()
-        if not conn:
-            return {'success': False, 'message': 'Error de conexión'}
-        
+    @staticmethod
+    def _pivotar_matriz(celdas, parametros, agregado):
+        """(fechas, columnas) a partir de los agregados {(fecha, parametro): agregados} de cada celda;
+        mismo resultado que la consulta pivotada"""
+        _, _, valor = AGREGADOS_MATRIZ[agregado]
+        vacia = 0 if agregado == 'n' else None
+        fechas = sorted({fecha for fecha, _ in celdas})
+        columnas = [
+            [valor(celdas[(fecha, p)]) if (fecha, p) in celdas else vacia for fecha in fechas]
+            for p in parametros
+        ]
+        return fechas, columnas
+
+    def obtener_eventos_spc(self, categoria, punto=None, parametro=None, regla=None, antes_de=None, limite=100):
+        """Eventos fuera de control / fuera de especificación, del más reciente al más antiguo"""
         try:
-            cur = conn.cursor(cursor_factory=RealDictCursor)
-            tabla = f'mediciones_{categoria}'
+            self._tabla(categoria)
+            if regla and regla not in spc.REGLAS:
+                raise ValueError(f'Regla no válida: {regla}')
+            condiciones = ['categoria = %s']
+            params = [categoria]
+            for campo, valor in (('punto', punto), ('parametro', parametro), ('regla', regla)):
+                if valor:
+                    condiciones.append(f'{campo} = %s')
+                    params.append(valor)
+            if antes_de:
+                condiciones.append('id < %s')
+                params.append(int(antes_de))
+            params.append(int(limite) + 1)
             
-            query = f'''
-                SELECT 
-                    COUNT(*) as total,
-                    AVG(dato) as promedio,
-                    MAX(dato) as maximo,
-                    MIN(dato) as minimo,
-                    STDDEV(dato) as desviacion_estandar
-                FROM {tabla}
-                WHERE 1=1
-            '''
-            params = []
+            with self.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión'}
+                
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+                cur.execute(f'''
+                    SELECT id, tipo, punto, parametro, medicion_id, fecha, dato, regla, valor, limite, creado
+                    FROM spc_eventos
+                    WHERE {' AND '.join(condiciones)}
+                    ORDER BY id DESC
+                    LIMIT %s
+                ''', params)
+                eventos = [dict(e, descripcion=spc.REGLAS[e['regla']]) for e in cur.fetchall()]
+                cur.close()
             
+            siguiente = None
+            if len(eventos) > int(limite):
+                eventos = eventos[:int(limite)]
+                siguiente = eventos[-1]['id']
+            return {'success': True, 'data': eventos, 'siguiente': siguiente}
+        except ValueError as e:
+            return {'success': False, 'message': str(e)}
+        except Exception as e:
+            return {'success': False, 'message': f'Error: {str(e)}'}
+
+    def obtener_estado_spc(self, categoria, punto=None, parametro=None):
+        """Estado SPC de las series con sus límites de control y de especificación"""
+        try:
+            self._tabla(categoria)
+            condiciones = ['e.categoria = %s']
+            params = [categoria]
             if punto:
-                query += ' AND punto = %s'
+                condiciones.append('e.punto = %s')
                 params.append(punto)
             if parametro:
-                query += ' AND parametro = %s'
+                condiciones.append('e.parametro = %s')
                 params.append(parametro)
             
-            cur.execute(query, params)
-            stats = cur.fetchone()
-            cur.close()
-            conn.close()
+            with self.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión'}
+                
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+                cur.execute(f'''
+                    SELECT e.punto, e.parametro, {', '.join('e.' + c for c in spc.COLUMNAS_ESTADO)},
+                           l.limite_inferior, l.limite_superior
+                    FROM spc_estado e
+                    LEFT JOIN limites_especificacion l USING (categoria, punto, parametro)
+                    WHERE {' AND '.join(condiciones)}
+                    ORDER BY e.punto, e.parametro
+                ''', params)
+                series = cur.fetchall()
+                cur.close()
             
-            return {
-                'success': True,
-                'data': dict(stats)
-            }
+            data = []
+            for serie in series:
+                serie = dict(serie)
+                serie['control'] = spc.limites_control(serie)
+                serie.pop('m2')
+                data.append(serie)
+            return {'success': True, 'data': data}
+        except ValueError as e:
+            return {'success': False, 'message': str(e)}
         except Exception as e:
-            if conn:
-                conn.close()
             return {'success': False, 'message': f'Error: {str(e)}'}
 
-    def eliminar_medicion(self, categoria, id):
-        """Eliminar una medición por ID"""
-        conn = self.get_connection()
-        if not conn:
-            return {'success': False, 'message': 'Error de conexión'}
-        
+    def guardar_limites_especificacion(self, categoria, punto, parametro, limite_inferior=None, limite_superior=None):
+        """Crear o actualizar los límites de especificación de una serie"""
         try:
-            cur = conn.cursor()
-            tabla = f'mediciones_{categoria}'
-            cur.execute(f'DELETE FROM {tabla} WHERE id = %s', (id,))
-            conn.commit()
+            self._tabla(categoria)
+            if limite_inferior is None and limite_superior is None:
+                raise ValueError('Indique limite_inferior, limite_superior o ambos')
+            if None not in (limite_inferior, limite_superior) and float(limite_inferior) > float(limite_superior):
+                raise ValueError('limite_inferior no puede ser mayor que limite_superior')
             
-            eliminados = cur.rowcount
-            cur.close()
-            conn.close()
+            with self.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión'}
+                
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+                cur.execute('''
+                    INSERT INTO limites_especificacion (categoria, punto, parametro, limite_inferior, limite_superior)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (categoria, punto, parametro) DO UPDATE SET
+                        limite_inferior = EXCLUDED.limite_inferior,
+                        limite_superior = EXCLUDED.limite_superior,
+                        actualizado = CURRENT_TIMESTAMP
+                    RETURNING punto, parametro, limite_inferior, limite_superior, actualizado
+                ''', (categoria, punto, parametro,
+                      None if limite_inferior is None else float(limite_inferior),
+                      None if limite_superior is None else float(limite_superior)))
+                limites = dict(cur.fetchone())
+                conn.commit()
+                cur.close()
             
-            if eliminados > 0:
-                return {'success': True, 'message': 'Registro eliminado'}
-            else:
-                return {'success': False, 'message': 'Registro no encontrado'}
+            return {'success': True, 'message': '✓ Límites guardados', 'data': limites}
+        except ValueError as e:
+            return {'success': False, 'message': str(e)}
+        except Exception as e:
+            return {'success': False, 'message': f'Error: {str(e)}'}
+
+    def recalcular_spc(self, categoria=None):
+        """Reconstruir el estado SPC recorriendo el histórico (tras borrados o importaciones desordenadas)"""
+        try:
+            categorias = [categoria] if categoria else list(CATEGORIAS)
+            with self.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión'}
+                
+                totales = {}
+                for cat in categorias:
+                    totales[cat] = spc.recalcular(conn, cat, self._tabla(cat))
+                conn.commit()
+                
+                return {
+                    'success': True,
+                    'message': '✓ Estado SPC recalculado',
+                    'data': totales
+                }
         except Exception as e:
-            if conn:
-                conn.close()
-            return {'success': False, 'message': f'Error: {str(e)}'}
\ No newline at end of file
+            return {'success': False, 'message': f'Error: {str(e)}'}
+
+    def version_catalogo(self):
+        """Versión actual del catálogo (None si no se puede leer)"""
+        try:
+            with self.conexion() as conn:
+                if not conn:
+                    return None
+                cur = conn.cursor()
+                cur.execute('SELECT version FROM catalogo_version')
+                fila = cur.fetchone()
+                cur.close()
+                return fila[0] if fila else None
+        except Exception as e:
+            print(f"Error al leer la versión del catálogo: {e}")
+            return None
+
+    def filas_catalogo(self):
+        """(categoria, tipo, punto, parametro) del catálogo en el orden de presentación"""
+        try:
+            with self.conexion() as conn:
+                if not conn:
+                    return None
+                cur = conn.cursor()
+                cur.execute('''
+                    SELECT categoria, tipo, punto, parametro FROM catalogo
+                    ORDER BY categoria, tipo, punto, orden, parametro
+                ''')
+                filas = [tuple(fila) for fila in cur.fetchall()]
+                cur.close()
+                return filas
+        except Exception as e:
+            print(f"Error al leer el catálogo: {e}")
+            return None
+
+    def guardar_catalogo(self, entradas):
+        """Dar de alta puntos y parámetros: dicts con categoria, tipo, punto y parametros (lista)"""
+        return self._modificar_catalogo(entradas, alta=True)
+
+    def eliminar_catalogo(self, entradas):
+        """Dar de baja parámetros (o el punto entero si no se indican parámetros)"""
+        return self._modificar_catalogo(entradas, alta=False)
+
+    def _modificar_catalogo(self, entradas, alta):
+        try:
+            filas = [self._entrada_catalogo(entrada, alta) for entrada in entradas]
+        except (TypeError, ValueError) as e:
+            return {'success': False, 'message': str(e)}
+        
+        try:
+            with self.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión'}
+                
+                cur = conn.cursor()
+                cambios = 0
+                for categoria, tipo, punto, parametros in filas:
+                    if alta:
+                        cur.execute(
+                            'SELECT COALESCE(MAX(orden) + 1, 0) FROM catalogo WHERE categoria = %s AND tipo = %s AND punto = %s',
+                            (categoria, tipo, punto)
+                        )
+                        orden = cur.fetchone()[0]
+                        for parametro in parametros:
+                            cur.execute('''
+                                INSERT INTO catalogo (categoria, tipo, punto, parametro, orden) VALUES (%s, %s, %s, %s, %s)
+                                ON CONFLICT (categoria, tipo, punto, parametro) DO NOTHING
+                            ''', (categoria, tipo, punto, parametro, orden))
+                            cambios += cur.rowcount
+                            orden += cur.rowcount
+                    elif parametros:
+                        for parametro in parametros:
+                            cur.execute(
+                                'DELETE FROM catalogo WHERE categoria = %s AND tipo = %s AND punto = %s AND parametro = %s',
+                                (categoria, tipo, punto, parametro)
+                            )
+                            cambios += cur.rowcount
+                    else:
+                        cur.execute(
+                            'DELETE FROM catalogo WHERE categoria = %s AND tipo = %s AND punto = %s',
+                            (categoria, tipo, punto)
+                        )
+                        cambios += cur.rowcount
+                if cambios:
+                    cur.execute('UPDATE catalogo_version SET version = version + 1')
+                conn.commit()
+                cur.close()
+            
+            self.catalogo.refrescar(forzar=True)
+            accion = 'añadidos al' if alta else 'eliminados del'
+            return {'success': True, 'message': f'✓ {cambios} parámetros {accion} catálogo', 'cambios': cambios}
+        except Exception as e:
+            return {'success': False, 'message': f'Error: {str(e)}'}
+
+    @staticmethod
+    def _entrada_catalogo(entrada, alta):
+        """Validar una entrada de catálogo; devuelve (categoria, tipo, punto, parámetros)"""
+        if not isinstance(entrada, dict):
+            raise ValueError('cada entrada del catálogo debe ser un objeto JSON')
+        faltan = [c for c in ('categoria', 'tipo', 'punto') if not str(entrada.get(c) or '').strip()]
+        if faltan:
+            raise ValueError(f'faltan campos: {", ".join(faltan)}')
+        if entrada['categoria'] not in CATEGORIAS:
+            raise ValueError(f"categoría no válida: {entrada['categoria']}")
+        parametros = entrada.get('parametros') or ([entrada['parametro']] if entrada.get('parametro') else [])
+        if not isinstance(parametros, list):
+            raise ValueError('parametros debe ser una lista')
+        tipo, punto, _ = normalizar(entrada['tipo'], entrada['punto'], None)
+        parametros = [normalizar(None, None, p)[2] for p in parametros if str(p).strip()]
+        if alta and not parametros:
+            raise ValueError(f'indique los parámetros de {punto}')
+        return entrada['categoria'], tipo, punto, parametros
+
+    def eliminar_medicion(self, categoria, id):
+        """Eliminar una medición por ID"""
+        try:
+            with self.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión'}
+                
+                cur = conn.cursor()
+                tabla = self._tabla(categoria)
+                cur.execute(f'DELETE FROM {tabla} WHERE id = %s', (id,))
+                conn.commit()
+                
+                eliminados = cur.rowcount
+                cur.close()
+                if eliminados > 0:
+                    self.cache.invalidar(tabla, conn)
+                
+                if eliminados > 0:
+                    return {'success': True, 'message': 'Registro eliminado'}
+                else:
+                    return {'success': False, 'message': 'Registro no encontrado'}
+        except Exception as e:
+            return {'success': False, 'message': f'Error: {str(e)}'}
+
+
+# Latencia, errores y filas de cada operación pública (conexion y los getters de estado se llaman demasiado a menudo)
+metricas.instrumentar(DatabaseManager, excluir=('conexion', 'get_connection', 'estadisticas_pool', 'estadisticas_cache'))
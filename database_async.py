@@ -0,0 +1,122 @@
+"""Acceso asíncrono a la base de datos para el modo ASGI (asgi.py).
+
+Las lecturas usan un pool asíncrono de psycopg 3 y reutilizan la construcción de
+SQL, la caché y el formato de respuesta de DatabaseManager, así que devuelven
+exactamente lo mismo que la versión síncrona. Las escrituras (que actualizan el
+estado SPC con psycopg2) se delegan al DatabaseManager síncrono en un hilo para
+no bloquear el bucle de eventos.
+"""
+import asyncio
+import os
+
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+import archivo
+import metricas
+from database import decodificar_cursor
+
+
+class DatabaseManagerAsync:
+    """Contraparte asíncrona de DatabaseManager para obtener_mediciones, obtener_estadisticas e insertar_medicion"""
+
+    def __init__(self, database_manager):
+        self.db = database_manager
+        self._pool = None
+        self._bloqueo = asyncio.Lock()
+
+    async def abrir(self):
+        """Abrir el pool asíncrono (en el arranque del servidor ASGI o en la primera petición)"""
+        if self._pool is not None:
+            return
+        async with self._bloqueo:
+            if self._pool is not None:
+                return
+            # psycopg2 acepta 'database'; libpq (psycopg 3) solo 'dbname'
+            parametros = dict(self.db._parametros)
+            if 'database' in parametros:
+                parametros['dbname'] = parametros.pop('database')
+            pool = AsyncConnectionPool(
+                make_conninfo(**parametros),
+                min_size=int(os.environ.get('DB_POOL_MIN', 1)),
+                max_size=int(os.environ.get('DB_POOL_ASYNC_MAX', 20)),
+                timeout=float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+                max_idle=float(os.environ.get('DB_POOL_VERIFICAR_TRAS', 30)) * 10,
+                kwargs={'row_factory': dict_row},
+                open=False
+            )
+            await pool.open()
+            self._pool = pool
+
+    async def cerrar(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    def estadisticas_pool(self):
+        return self._pool.get_stats() if self._pool else {}
+
+    async def _consultar(self, sql, params, una=False):
+        async with self._pool.connection() as conn:
+            cur = await conn.execute(sql, params)
+            return await (cur.fetchone() if una else cur.fetchall())
+
+    async def _clave(self, tabla, operacion, argumentos):
+        # Refrescar las versiones es una consulta síncrona (cache_versiones): a un hilo, solo
+        # cuando la copia local ha caducado
+        if self.db.cache.clave_bloquea():
+            return await asyncio.to_thread(self.db.cache.clave, tabla, operacion, argumentos)
+        return self.db.cache.clave(tabla, operacion, argumentos)
+
+    async def obtener_mediciones(self, categoria, filtros=None, limite=None, cursor=None, campos=None):
+        """Igual que DatabaseManager.obtener_mediciones (misma caché y mismo formato)"""
+        clave = await self._clave(f'mediciones_{categoria}', 'mediciones', (filtros, limite, cursor, campos))
+        cacheado = self.db.cache.obtener(clave)
+        if cacheado is not None:
+            return cacheado
+        try:
+            consulta, params, extra = self.db._consulta_mediciones(categoria, filtros, campos, cursor)
+            if limite:
+                consulta += ' LIMIT %s'
+                params.append(int(limite) + 1)
+            mediciones = await self._consultar(consulta, params)
+            archivados = await self._consultar(
+                *archivo.consulta_archivos(categoria, filtros, decodificar_cursor(cursor) if cursor else None)
+            )
+            if archivados:
+                # La lectura del Parquet es bloqueante: a un hilo
+                mediciones = await asyncio.to_thread(
+                    self.db._combinar_archivo, mediciones, [(a['anio'], a['ruta']) for a in archivados],
+                    filtros, campos, extra, cursor, limite
+                )
+            resultado = self.db._pagina_mediciones(mediciones, limite, extra)
+        except ValueError as e:
+            return {'success': False, 'message': str(e)}
+        except Exception as e:
+            return {'success': False, 'message': f'Error: {str(e)}'}
+        self.db.cache.guardar(clave, resultado)
+        return resultado
+
+    async def obtener_estadisticas(self, categoria, punto=None, parametro=None, fecha_inicio=None, fecha_fin=None):
+        """Igual que DatabaseManager.obtener_estadisticas (misma caché y mismo formato)"""
+        clave = await self._clave(f'mediciones_{categoria}', 'estadisticas', (punto, parametro, fecha_inicio, fecha_fin))
+        cacheado = self.db.cache.obtener(clave)
+        if cacheado is not None:
+            return cacheado
+        try:
+            query, params = self.db._consulta_estadisticas(categoria, punto, parametro, fecha_inicio, fecha_fin)
+            resultado = {'success': True, 'data': dict(await self._consultar(query, params, una=True))}
+        except Exception as e:
+            return {'success': False, 'message': f'Error: {str(e)}'}
+        self.db.cache.guardar(clave, resultado)
+        return resultado
+
+    async def insertar_medicion(self, categoria, tipo, punto, parametro, fecha, dato, nota=None):
+        """Insertar en un hilo con el DatabaseManager síncrono (SPC, resúmenes y caché incluidos)"""
+        return await asyncio.to_thread(
+            self.db.insertar_medicion, categoria, tipo, punto, parametro, fecha, dato, nota
+        )
+
+
+metricas.instrumentar(DatabaseManagerAsync, excluir=('abrir', 'cerrar', 'estadisticas_pool'), prefijo='async_')
@@ -0,0 +1,525 @@
+"""Base de datos embebida (SQLite) para estaciones de laboratorio sin conexión.
+
+    DATABASE_URL=sqlite:///datos/laboratorio.db python app.py
+
+DatabaseManagerSqlite reutiliza las consultas de DatabaseManager a través de un
+adaptador de conexión/cursor con la misma interfaz que psycopg2 (%s, RealDictCursor,
+commit/rollback), así que las respuestas tienen la misma forma en los dos backends.
+El esquema equivalente está en migraciones_sqlite/.
+
+La base se abre en modo WAL con synchronous=NORMAL: las lecturas no bloquean a la
+escritura y cada commit solo sincroniza el WAL en los checkpoints. Cada hilo usa
+su propia conexión. Las escrituras abren la transacción con BEGIN IMMEDIATE para
+esperar (busy_timeout) en lugar de fallar si otro proceso está escribiendo.
+
+Las mediciones se envían al Postgres central con sincronizar(): por lotes, en orden
+de id, y el servidor guarda el último id recibido de cada estación en la misma
+transacción que la inserción, así que un envío interrumpido se puede repetir sin
+duplicar filas. El control estadístico, las particiones y la cola de importaciones
+quedan en el servidor central.
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+
+import esquema
+import metricas
+from cache import VersionesBaseDatos, crear_cache
+from catalogo import IndiceCatalogo
+from database import CATEGORIAS, COLUMNAS_MEDICION, HORAS_IDEMPOTENCIA, DatabaseManager
+
+CARPETA_MIGRACIONES_SQLITE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migraciones_sqlite')
+
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    f"PRAGMA busy_timeout = {int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))}",
+    f"PRAGMA cache_size = -{int(os.environ.get('SQLITE_CACHE_KB', 64000))}",
+    'PRAGMA temp_store = MEMORY',
+    f"PRAGMA mmap_size = {int(os.environ.get('SQLITE_MMAP_BYTES', 268435456))}",
+    'PRAGMA foreign_keys = ON',
+)
+CUATRO_DECIMALES = Decimal('0.0001')
+
+
+# Mismo texto que el DEFAULT strftime('%Y-%m-%d %H:%M:%f', 'now') de las tablas, para que
+# las comparaciones de la paginación por clave sean entre cadenas con el mismo formato
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, lambda v: f'{v:%Y-%m-%d %H:%M:%S}.{v.microsecond // 1000:03d}')
+sqlite3.register_adapter(Decimal, float)
+sqlite3.register_converter('DATE', lambda v: date.fromisoformat(v.decode()))
+sqlite3.register_converter('TIMESTAMP', lambda v: datetime.fromisoformat(v.decode()))
+# DECIMAL(10, 4) como en Postgres; NUMERIC (sumas y agregados) sin redondear
+sqlite3.register_converter('DECIMAL', lambda v: Decimal(v.decode()).quantize(CUATRO_DECIMALES))
+sqlite3.register_converter('NUMERIC', lambda v: Decimal(v.decode()))
+
+
+def _filas_dict(cursor, fila):
+    return {columna[0]: valor for columna, valor in zip(cursor.description, fila)}
+
+
+class CursorSqlite:
+    """Cursor con la interfaz de psycopg2 que usa DatabaseManager (%s como marcador)"""
+
+    def __init__(self, conexion, diccionario=False):
+        self._conexion = conexion
+        self._cursor = conexion.sqlite.cursor()
+        if diccionario:
+            self._cursor.row_factory = _filas_dict
+        self.itersize = None  # los cursores de SQLite ya recorren el resultado sin cargarlo entero
+
+    def execute(self, consulta, params=()):
+        self._conexion.iniciar(consulta)
+        self._cursor.execute(consulta.replace('%s', '?'), tuple(params or ()))
+        return self
+
+    def executemany(self, consulta, filas):
+        self._conexion.iniciar(consulta)
+        self._cursor.executemany(consulta.replace('%s', '?'), filas)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+
+class ConexionSqlite:
+    """Conexión con commit/rollback explícitos al estilo psycopg2.
+
+    Las lecturas sueltas se ejecutan en autocommit; la primera escritura abre
+    BEGIN IMMEDIATE y la transacción dura hasta commit() o rollback().
+    """
+
+    def __init__(self, ruta):
+        self.sqlite = sqlite3.connect(
+            ruta,
+            detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        for pragma in PRAGMAS:
+            self.sqlite.execute(pragma)
+        self.sqlite.create_function('SQRT', 1, lambda x: None if x is None or x < 0 else x ** 0.5, deterministic=True)
+        self.pid = os.getpid()
+        self.en_uso = False
+
+    def iniciar(self, consulta):
+        if self.sqlite.in_transaction:
+            return
+        if consulta.lstrip().split(None, 1)[0].upper() not in ('SELECT', 'WITH', 'PRAGMA'):
+            self.sqlite.execute('BEGIN IMMEDIATE')
+
+    def cursor(self, cursor_factory=None, name=None):
+        return CursorSqlite(self, diccionario=cursor_factory is not None)
+
+    def commit(self):
+        if self.sqlite.in_transaction:
+            self.sqlite.execute('COMMIT')
+
+    def rollback(self):
+        if self.sqlite.in_transaction:
+            self.sqlite.execute('ROLLBACK')
+
+    def close(self):
+        self.sqlite.close()
+
+
+def _sentencias(script):
+    """Separar un script SQL en sentencias completas (respeta los BEGIN ... END de los triggers)"""
+    sentencias = []
+    actual = ''
+    for linea in script.splitlines(keepends=True):
+        actual += linea
+        if sqlite3.complete_statement(actual):
+            sentencias.append(actual.strip())
+            actual = ''
+    if actual.strip() and not all(l.strip().startswith('--') for l in actual.strip().splitlines()):
+        sentencias.append(actual.strip())
+    return sentencias
+
+
+class DatabaseManagerSqlite(DatabaseManager):
+    """DatabaseManager sobre un archivo SQLite local"""
+
+    embebida = True
+    SQL_SERIE = 'julianday(fecha) - 2440587.5, dato'
+    SQL_AHORA = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+    def __init__(self, database_url=None):
+        self.database_url = database_url or os.environ.get('DATABASE_URL')
+        # sqlite:///relativa.db o sqlite:////ruta/absoluta.db
+        self.ruta = self.database_url.split(':///', 1)[1] if ':///' in self.database_url else 'laboratorio.db'
+        carpeta = os.path.dirname(os.path.abspath(self.ruta))
+        os.makedirs(carpeta, exist_ok=True)
+        self._locales = threading.local()
+        self.cache = crear_cache(VersionesBaseDatos(self.conexion))
+        self.catalogo = IndiceCatalogo(self)
+
+    def get_connection(self):
+        """Crear una conexión nueva al archivo (sin reutilizar la del hilo)"""
+        try:
+            return ConexionSqlite(self.ruta)
+        except Exception as e:
+            print(f"Error de conexión: {e}")
+            return None
+
+    @property
+    def pool(self):
+        raise AttributeError('La base embebida no usa pool de conexiones')
+
+    @contextmanager
+    def conexion(self):
+        """Conexión de este hilo (una nueva si ya está prestada o si el proceso se ha bifurcado)"""
+        conn = getattr(self._locales, 'conexion', None)
+        if conn is None or conn.pid != os.getpid():
+            conn = self._locales.conexion = self.get_connection()
+        temporal = conn is None or conn.en_uso
+        if temporal:
+            conn = self.get_connection()
+        if conn is not None:
+            conn.en_uso = True
+        try:
+            yield conn
+        finally:
+            if conn is not None:
+                conn.rollback()
+                conn.en_uso = False
+                if temporal:
+                    conn.close()
+
+    def estadisticas_pool(self):
+        return {'backend': 'sqlite', 'ruta': os.path.abspath(self.ruta)}
+
+    def migrar(self, hasta=None):
+        """Aplicar las migraciones de migraciones_sqlite/ (BEGIN IMMEDIATE hace de lock entre procesos)"""
+        try:
+            with self.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión'}
+
+                aplicadas = []
+                for migracion in esquema.cargar_migraciones(CARPETA_MIGRACIONES_SQLITE):
+                    if hasta is not None and migracion.version > hasta:
+                        break
+                    conn.sqlite.execute('BEGIN IMMEDIATE')
+                    try:
+                        conn.sqlite.execute(esquema.SQL_SCHEMA_VERSION)
+                        # Leído con el lock tomado: si otro proceso acaba de migrar, aquí ya se ve
+                        if conn.sqlite.execute(
+                            'SELECT 1 FROM schema_version WHERE version = ?', (migracion.version,)
+                        ).fetchone():
+                            conn.commit()
+                            continue
+                        inicio = time.perf_counter()
+                        if migracion.extension == 'sql':
+                            for sentencia in _sentencias(migracion.contenido):
+                                conn.sqlite.execute(sentencia)
+                        else:
+                            migracion.aplicar(conn, conn.cursor())
+                        duracion = int((time.perf_counter() - inicio) * 1000)
+                        conn.sqlite.execute(
+                            'INSERT INTO schema_version (version, nombre, huella, duracion_ms) VALUES (?, ?, ?, ?)',
+                            (migracion.version, migracion.nombre, migracion.huella, duracion)
+                        )
+                        conn.commit()
+                    except Exception as e:
+                        conn.rollback()
+                        raise RuntimeError(f'Migración {migracion.archivo} fallida: {e}') from e
+                    print(f"✓ Migración {migracion.archivo} aplicada ({duracion} ms)")
+                    aplicadas.append({'version': migracion.version, 'nombre': migracion.nombre, 'duracion_ms': duracion})
+
+                return {
+                    'success': True,
+                    'message': f'✓ {len(aplicadas)} migraciones aplicadas',
+                    'data': aplicadas
+                }
+        except Exception as e:
+            return {'success': False, 'message': f'Error: {str(e)}'}
+
+    def estado_esquema(self):
+        """Versión del esquema frente a las migraciones de migraciones_sqlite/"""
+        try:
+            with self.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión'}
+
+                hechas = {}
+                if conn.sqlite.execute("SELECT 1 FROM sqlite_master WHERE name = 'schema_version'").fetchone():
+                    hechas = dict(conn.sqlite.execute('SELECT version, huella FROM schema_version').fetchall())
+                migraciones = esquema.cargar_migraciones(CARPETA_MIGRACIONES_SQLITE)
+                data = {
+                    'version': max(hechas, default=0),
+                    'ultima': migraciones[-1].version if migraciones else 0,
+                    'pendientes': [m.archivo for m in migraciones if m.version not in hechas],
+                    'modificadas': [m.archivo for m in migraciones if m.version in hechas and m.modificada(hechas[m.version])],
+                }
+                pendientes = len(data['pendientes'])
+                return {
+                    'success': True,
+                    'message': f'{pendientes} migraciones pendientes' if pendientes else '✓ Esquema al día',
+                    'data': data
+                }
+        except Exception as e:
+            return {'success': False, 'message': f'Error: {str(e)}'}
+
+    def crear_particiones(self, anios_futuros=None):
+        return {'success': False, 'message': 'La base embebida no usa particiones'}
+
+    def archivar(self, meses=None, categoria=None):
+        return {'success': False, 'message': 'El archivo histórico solo está disponible en el servidor central'}
+
+    def _archivos(self, conn, categoria, filtros=None, cursor=None):
+        return []
+
+    @staticmethod
+    def _procesar_spc(cur, categoria, filas, ids=None, reemplazadas=()):
+        """El control estadístico se calcula en el servidor central al recibir la sincronización"""
+
+    @staticmethod
+    def _reservar_clave(cur, clave, huella):
+        """Registrar la clave de idempotencia; si ya existía devuelve la respuesta guardada"""
+        cur.execute(
+            "DELETE FROM claves_idempotencia WHERE clave = %s AND creado < strftime('%Y-%m-%d %H:%M:%f', 'now', %s)",
+            (clave, f'-{HORAS_IDEMPOTENCIA} hours')
+        )
+        cur.execute(
+            "INSERT OR IGNORE INTO claves_idempotencia (clave, huella, respuesta) VALUES (%s, %s, '{}')",
+            (clave, huella)
+        )
+        if cur.rowcount:
+            return None
+        cur.execute('SELECT huella, respuesta FROM claves_idempotencia WHERE clave = %s', (clave,))
+        huella_guardada, respuesta = cur.fetchone()
+        if huella_guardada != huella:
+            return {
+                'success': False,
+                'conflicto': True,
+                'message': 'La Idempotency-Key ya se usó con un contenido distinto'
+            }
+        return dict(json.loads(respuesta), repetida=True)
+
+    @staticmethod
+    def _insertar_filas_con_id(cur, tabla, filas):
+        """INSERT ... RETURNING id fila a fila (sin ida y vuelta de red, es igual de rápido que multi-fila)"""
+        columnas = ', '.join(COLUMNAS_MEDICION)
+        resultado = []
+        for fila in filas:
+            cur.execute('SAVEPOINT fila_api')
+            try:
+                cur.execute(f'INSERT INTO {tabla} ({columnas}) VALUES (%s, %s, %s, %s, %s, %s) RETURNING id', fila)
+                resultado.append(cur.fetchone()[0])
+                cur.execute('RELEASE SAVEPOINT fila_api')
+            except (sqlite3.IntegrityError, sqlite3.InterfaceError) as e:
+                cur.execute('ROLLBACK TO SAVEPOINT fila_api')
+                cur.execute('RELEASE SAVEPOINT fila_api')
+                resultado.append(str(e).strip().splitlines()[0])
+        return resultado
+
+    @staticmethod
+    def _crear_tabla_carga(cur, tabla):
+        """Copia temporal de la definición de `tabla` (SQLite no tiene CREATE TABLE ... LIKE)"""
+        cur.execute('DROP TABLE IF EXISTS temp.carga_mediciones')
+        cur.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = %s", (tabla,))
+        definicion = cur.fetchone()[0]
+        cur.execute('CREATE TEMP TABLE carga_mediciones' + definicion[definicion.index('('):])
+        return 'carga_mediciones'
+
+    def _insertar_lote(self, cur, tabla, columnas, lote, indices, metodo, errores, insertadas):
+        """executemany dentro de un savepoint (COPY no existe en SQLite); si falla, fila a fila"""
+        sql = f'INSERT INTO {tabla} ({columnas}) VALUES (%s, %s, %s, %s, %s, %s)'
+        cur.execute('SAVEPOINT lote_bulk')
+        try:
+            cur.executemany(sql, lote)
+            cur.execute('RELEASE SAVEPOINT lote_bulk')
+            insertadas.extend(lote)
+            return len(lote)
+        except (sqlite3.IntegrityError, sqlite3.InterfaceError):
+            cur.execute('ROLLBACK TO SAVEPOINT lote_bulk')
+
+        insertados = 0
+        for indice, fila in zip(indices, lote):
+            cur.execute('SAVEPOINT fila_bulk')
+            try:
+                cur.execute(sql, fila)
+                cur.execute('RELEASE SAVEPOINT fila_bulk')
+                insertadas.append(fila)
+                insertados += 1
+            except (sqlite3.IntegrityError, sqlite3.InterfaceError) as e:
+                cur.execute('ROLLBACK TO SAVEPOINT fila_bulk')
+                cur.execute('RELEASE SAVEPOINT fila_bulk')
+                errores.append({'indice': indice, 'error': str(e).strip().splitlines()[0]})
+        cur.execute('RELEASE SAVEPOINT lote_bulk')
+        return insertados
+
+    def _consulta_estadisticas(self, categoria, punto=None, parametro=None, fecha_inicio=None, fecha_fin=None):
+        """Misma consulta que en Postgres; los alias [TIPO] aplican los conversores a los agregados"""
+        query, params = super()._consulta_estadisticas(categoria, punto, parametro, fecha_inicio, fecha_fin)
+        query = (query
+                 .replace('COALESCE(SUM(n), 0)::bigint as total', 'COALESCE(SUM(n), 0) as total')
+                 .replace('as promedio', 'as "promedio [NUMERIC]"')
+                 .replace('as maximo', 'as "maximo [DECIMAL]"')
+                 .replace('as minimo', 'as "minimo [DECIMAL]"')
+                 .replace('GREATEST(', 'MAX(')
+                 .replace('as desviacion_estandar', 'as "desviacion_estandar [NUMERIC]"'))
+        return query, params
+
+    @staticmethod
+    def _recalcular_resumen(cur, categoria):
+        """Vaciar y rellenar el resumen de una categoría (BEGIN IMMEDIATE ya excluye a otros escritores)"""
+        cur.execute(f'DELETE FROM resumen_diario_{categoria}')
+        cur.execute(f'''
+            INSERT INTO resumen_diario_{categoria} (tipo, punto, parametro, fecha, n, suma, suma_cuadrados, minimo, maximo)
+            SELECT tipo, punto, parametro, fecha, COUNT(*), SUM(dato), SUM(dato * dato), MIN(dato), MAX(dato)
+            FROM mediciones_{categoria}
+            GROUP BY tipo, punto, parametro, fecha
+        ''')
+        return cur.rowcount
+
+    def _obtener_estadisticas_agrupadas(self, categoria, fecha_inicio=None, fecha_fin=None, tipo=None):
+        """Estadísticas por grupo calculadas en NumPy (SQLite no tiene percentile_cont ni STDDEV)"""
+        try:
+            tabla = self._tabla(categoria)
+            condiciones = []
+            params = []
+            if tipo:
+                condiciones.append('tipo = %s')
+                params.append(tipo)
+            if fecha_inicio:
+                condiciones.append('fecha >= %s')
+                params.append(fecha_inicio)
+            if fecha_fin:
+                condiciones.append('fecha <= %s')
+                params.append(fecha_fin)
+            where = ('WHERE ' + ' AND '.join(condiciones)) if condiciones else ''
+
+            with self.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión'}
+
+                cur = conn.cursor()
+                cur.execute(f'''
+                    SELECT tipo, punto, parametro, fecha, dato FROM {tabla} {where}
+                    ORDER BY tipo, punto, parametro, fecha, timestamp, id
+                ''', params)
+                filas = cur.fetchall()
+                cur.close()
+
+            return {'success': True, 'data': self._agrupar_estadisticas(filas)}
+        except ValueError as e:
+            return {'success': False, 'message': str(e)}
+        except Exception as e:
+            return {'success': False, 'message': f'Error: {str(e)}'}
+
+    def obtener_eventos_spc(self, categoria, punto=None, parametro=None, regla=None, antes_de=None, limite=100):
+        return {'success': False, 'message': 'El control estadístico solo está disponible en el servidor central'}
+
+    def obtener_estado_spc(self, categoria, punto=None, parametro=None):
+        return {'success': False, 'message': 'El control estadístico solo está disponible en el servidor central'}
+
+    def guardar_limites_especificacion(self, categoria, punto, parametro, limite_inferior=None, limite_superior=None):
+        return {'success': False, 'message': 'El control estadístico solo está disponible en el servidor central'}
+
+    def recalcular_spc(self, categoria=None):
+        return {'success': False, 'message': 'El control estadístico solo está disponible en el servidor central'}
+
+    def sincronizar(self, database_url_central=None, tamano_lote=5000, estacion=None):
+        """Enviar al Postgres central las mediciones nuevas de cada categoría, en lotes y en orden de id.
+
+        El servidor ignora los ids ya recibidos de esta estación, así que si el envío se
+        corta a mitad basta con volver a lanzarlo.
+        """
+        database_url_central = database_url_central or os.environ.get('DATABASE_URL_CENTRAL')
+        if not database_url_central:
+            return {'success': False, 'message': 'Falta DATABASE_URL_CENTRAL'}
+        estacion = estacion or os.environ.get('ESTACION_ID') or socket.gethostname()
+        central = DatabaseManager(database_url_central)
+        columnas = ', '.join(('id',) + COLUMNAS_MEDICION)
+        totales = {}
+
+        try:
+            for categoria in CATEGORIAS:
+                tabla = self._tabla(categoria)
+                total = {'enviados': 0, 'insertados': 0, 'repetidos': 0, 'errores': []}
+                while True:
+                    with self.conexion() as conn:
+                        if not conn:
+                            return {'success': False, 'message': 'Error de conexión'}
+                        cur = conn.cursor()
+                        cur.execute('SELECT ultimo_id FROM sincronizacion WHERE categoria = %s', (categoria,))
+                        marca = cur.fetchone()
+                        ultimo_id = marca[0] if marca else 0
+                        cur.execute(
+                            f'SELECT {columnas} FROM {tabla} WHERE id > %s ORDER BY id LIMIT %s',
+                            (ultimo_id, tamano_lote)
+                        )
+                        filas = cur.fetchall()
+                        cur.close()
+                    if not filas:
+                        break
+
+                    resultado = central.recibir_sincronizacion(estacion, categoria, filas)
+                    if not resultado['success']:
+                        return {
+                            'success': False,
+                            'message': f"Error al sincronizar {categoria}: {resultado['message']}",
+                            'data': totales
+                        }
+
+                    with self.conexion() as conn:
+                        cur = conn.cursor()
+                        cur.execute('''
+                            INSERT INTO sincronizacion (categoria, ultimo_id, actualizado)
+                            VALUES (%s, %s, CURRENT_TIMESTAMP)
+                            ON CONFLICT (categoria) DO UPDATE SET
+                                ultimo_id = MAX(ultimo_id, excluded.ultimo_id),
+                                actualizado = excluded.actualizado
+                        ''', (categoria, resultado['ultimo_id']))
+                        conn.commit()
+                        cur.close()
+
+                    total['enviados'] += len(filas)
+                    total['insertados'] += resultado['insertados']
+                    total['repetidos'] += resultado['repetidos']
+                    total['errores'].extend(resultado['errores'])
+                    if len(filas) < tamano_lote:
+                        break
+                totales[categoria] = total
+
+            insertados = sum(t['insertados'] for t in totales.values())
+            return {
+                'success': True,
+                'message': f'✓ {insertados} registros sincronizados con el servidor central',
+                'insertados': insertados,
+                'data': totales
+            }
+        except Exception as e:
+            return {'success': False, 'message': f'Error: {str(e)}', 'data': totales}
+        finally:
+            if central._pool is not None:
+                central.pool.cerrar()
+
+
+# Mismas métricas que DatabaseManager (los métodos heredados ya están instrumentados)
+metricas.instrumentar(DatabaseManagerSqlite, excluir=('conexion', 'get_connection', 'estadisticas_pool'))
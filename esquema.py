@@ -0,0 +1,161 @@
+"""Migraciones versionadas del esquema de la base de datos.
+
+Cada migración es un archivo de migraciones/ con el formato NNNN_descripcion.sql
+(se ejecuta tal cual) o NNNN_descripcion.py (define aplicar(conn, cur)). Se
+aplican en orden, cada una en su propia transacción, y se anotan en la tabla
+schema_version. Un advisory lock de Postgres garantiza que solo un proceso migra
+a la vez: el resto espera y, al entrar, ya no encuentra nada pendiente.
+
+Las migraciones se lanzan una vez por despliegue (python gestion.py migrar); al
+arrancar, la aplicación solo compara la versión de la base con la última
+migración disponible.
+
+Una migración aplicada no se edita: los cambios de esquema van en migraciones
+nuevas y las .py no importan código de la aplicación (llevan su propia copia del
+SQL). Si hay que reescribir una sin cambiar su efecto, las huellas de sus
+versiones anteriores se declaran en HUELLAS_ANTERIORES para que estado() no la
+marque como modificada.
+"""
+import ast
+import hashlib
+import importlib.util
+import os
+import re
+import time
+
+CARPETA_MIGRACIONES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migraciones')
+
+# Clave del advisory lock (cualquier bigint fijo y exclusivo de esta aplicación)
+LLAVE_MIGRACIONES = 7_310_251_017
+
+SQL_SCHEMA_VERSION = '''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        nombre TEXT NOT NULL,
+        huella CHAR(64) NOT NULL,
+        duracion_ms INTEGER,
+        aplicada TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+
+class Migracion:
+    """Un archivo de migraciones/"""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.archivo = os.path.basename(ruta)
+        m = re.match(r'^(\d+)_(.+)\.(sql|py)$', self.archivo)
+        self.version = int(m.group(1))
+        self.nombre = m.group(2)
+        self.extension = m.group(3)
+        with open(ruta, 'rb') as f:
+            contenido = f.read()
+        self.huella = hashlib.sha256(contenido).hexdigest()
+        self.contenido = contenido.decode('utf-8')
+        self.huellas_anteriores = self._huellas_anteriores() if self.extension == 'py' else ()
+
+    def _huellas_anteriores(self):
+        """HUELLAS_ANTERIORES de una migración .py, leída sin ejecutarla"""
+        for nodo in ast.parse(self.contenido).body:
+            if isinstance(nodo, ast.Assign) and any(
+                isinstance(destino, ast.Name) and destino.id == 'HUELLAS_ANTERIORES' for destino in nodo.targets
+            ):
+                return tuple(ast.literal_eval(nodo.value))
+        return ()
+
+    def modificada(self, huella):
+        """Si la huella anotada al aplicarla no corresponde a ninguna versión de este archivo"""
+        return huella != self.huella and huella not in self.huellas_anteriores
+
+    def aplicar(self, conn, cur):
+        if self.extension == 'sql':
+            cur.execute(self.contenido)
+            return
+        spec = importlib.util.spec_from_file_location(f'migracion_{self.version:04d}', self.ruta)
+        modulo = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(modulo)
+        modulo.aplicar(conn, cur)
+
+
+def cargar_migraciones(carpeta=CARPETA_MIGRACIONES):
+    """Migraciones disponibles ordenadas por versión (falla si hay versiones repetidas)"""
+    migraciones = [
+        Migracion(os.path.join(carpeta, archivo))
+        for archivo in sorted(os.listdir(carpeta))
+        if re.match(r'^\d+_.+\.(sql|py)$', archivo)
+    ]
+    versiones = [m.version for m in migraciones]
+    repetidas = sorted({v for v in versiones if versiones.count(v) > 1})
+    if repetidas:
+        raise ValueError(f'Versiones de migración repetidas: {repetidas}')
+    return sorted(migraciones, key=lambda m: m.version)
+
+
+def version_actual(cur):
+    """Última versión aplicada (0 si la base nunca se ha migrado)"""
+    cur.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        return 0
+    cur.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+    return cur.fetchone()[0]
+
+
+def aplicadas(cur):
+    """{version: huella} de las migraciones ya aplicadas"""
+    cur.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        return {}
+    cur.execute('SELECT version, huella FROM schema_version')
+    return dict(cur.fetchall())
+
+
+def migrar(conn, hasta=None, migraciones=None):
+    """Aplicar las migraciones pendientes (hasta la versión indicada) bajo el advisory lock.
+
+    Devuelve la lista de (version, nombre, duracion_ms) aplicadas en esta llamada.
+    """
+    migraciones = cargar_migraciones() if migraciones is None else migraciones
+    cur = conn.cursor()
+    conn.commit()
+    cur.execute('SELECT pg_advisory_lock(%s)', (LLAVE_MIGRACIONES,))
+    try:
+        cur.execute(SQL_SCHEMA_VERSION)
+        conn.commit()
+        # Leído con el lock tomado: si otro proceso acaba de migrar, aquí ya se ve
+        hechas = aplicadas(cur)
+        resultado = []
+        for migracion in migraciones:
+            if migracion.version in hechas or (hasta is not None and migracion.version > hasta):
+                continue
+            inicio = time.perf_counter()
+            try:
+                migracion.aplicar(conn, cur)
+                duracion = int((time.perf_counter() - inicio) * 1000)
+                cur.execute(
+                    'INSERT INTO schema_version (version, nombre, huella, duracion_ms) VALUES (%s, %s, %s, %s)',
+                    (migracion.version, migracion.nombre, migracion.huella, duracion)
+                )
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                raise RuntimeError(f'Migración {migracion.archivo} fallida: {e}') from e
+            print(f"✓ Migración {migracion.archivo} aplicada ({duracion} ms)")
+            resultado.append((migracion.version, migracion.nombre, duracion))
+        return resultado
+    finally:
+        cur.execute('SELECT pg_advisory_unlock(%s)', (LLAVE_MIGRACIONES,))
+        conn.commit()
+        cur.close()
+
+
+def estado(cur, migraciones=None):
+    """Versión de la base, última disponible, pendientes y migraciones editadas tras aplicarse"""
+    migraciones = cargar_migraciones() if migraciones is None else migraciones
+    hechas = aplicadas(cur)
+    return {
+        'version': max(hechas, default=0),
+        'ultima': migraciones[-1].version if migraciones else 0,
+        'pendientes': [m.archivo for m in migraciones if m.version not in hechas],
+        'modificadas': [m.archivo for m in migraciones if m.version in hechas and m.modificada(hechas[m.version])],
+    }
@@ -0,0 +1,127 @@
+"""Recursos estáticos del dashboard precomprimidos en memoria.
+
+Al arrancar se leen los archivos de static/, se comprimen una sola vez (gzip y,
+si está instalado el paquete brotli, br) y se calcula un ETag fuerte por
+contenido. Las referencias entre recursos (/static/dashboard.css en el HTML) se
+reescriben con ?v=<hash> para poder cachearlas como inmutables.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se sirve gzip
+    brotli = None
+
+CARPETA_ESTATICOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+TIPOS_TEXTO = ('.html', '.css', '.js', '.svg', '.json')
+CACHE_INMUTABLE = 'public, max-age=31536000, immutable'
+CACHE_REVALIDAR = 'no-cache'
+TAMANO_MINIMO_COMPRIMIR = 512
+
+
+class Recurso:
+    """Un archivo estático con sus variantes comprimidas"""
+
+    def __init__(self, nombre, contenido):
+        self.nombre = nombre
+        self.content_type = mimetypes.guess_type(nombre)[0] or 'application/octet-stream'
+        if nombre.endswith(TIPOS_TEXTO):
+            self.content_type += '; charset=utf-8'
+        self.huella = hashlib.sha256(contenido).hexdigest()[:16]
+        self.variantes = {'identity': contenido}
+        if nombre.endswith(TIPOS_TEXTO) and len(contenido) >= TAMANO_MINIMO_COMPRIMIR:
+            self.variantes['gzip'] = gzip.compress(contenido, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.variantes['br'] = brotli.compress(contenido, quality=11)
+
+    def etag(self, codificacion):
+        # Cada codificación es una representación distinta: ETag fuerte distinto
+        return self.huella if codificacion == 'identity' else f'{self.huella}-{codificacion}'
+
+
+class RecursosEstaticos:
+    """Catálogo de recursos estáticos construido una vez al arrancar"""
+
+    def __init__(self, carpeta=CARPETA_ESTATICOS):
+        self.carpeta = carpeta
+        self.recursos = {}
+        self.construir()
+
+    def construir(self):
+        """Leer la carpeta, reescribir referencias a recursos versionados y comprimir"""
+        archivos = {}
+        for raiz, _, nombres in os.walk(self.carpeta):
+            for nombre in nombres:
+                ruta = os.path.join(raiz, nombre)
+                relativo = os.path.relpath(ruta, self.carpeta).replace(os.sep, '/')
+                with open(ruta, 'rb') as f:
+                    archivos[relativo] = f.read()
+
+        # Primero los recursos referenciados (CSS, JS...), después los que los referencian
+        recursos = {n: Recurso(n, c) for n, c in archivos.items() if not n.endswith('.html')}
+        for nombre, contenido in archivos.items():
+            if nombre.endswith('.html'):
+                recursos[nombre] = Recurso(nombre, self._versionar(contenido, recursos))
+        self.recursos = recursos
+
+    @staticmethod
+    def _versionar(contenido, recursos):
+        def sustituir(m):
+            recurso = recursos.get(m.group(2))
+            return m.group(0) if recurso is None else f'{m.group(1)}/static/{m.group(2)}?v={recurso.huella}{m.group(3)}'
+        texto = contenido.decode('utf-8')
+        return re.sub(r'''(["'])/static/([^"'?#]+)(["'])''', sustituir, texto).encode('utf-8')
+
+    def url(self, nombre):
+        """URL versionada de un recurso"""
+        return f'/static/{nombre}?v={self.recursos[nombre].huella}'
+
+    def respuesta(self, nombre, peticion, inmutable=None):
+        """Respuesta HTTP para un recurso: negocia la compresión y atiende If-None-Match con 304"""
+        recurso = self.recursos.get(nombre)
+        if recurso is None:
+            return None
+
+        codificacion = self._elegir_codificacion(recurso, peticion.headers.get('Accept-Encoding', ''))
+        etag = recurso.etag(codificacion)
+        if inmutable is None:
+            inmutable = peticion.args.get('v') == recurso.huella
+
+        cabeceras = {
+            'ETag': f'"{etag}"',
+            'Cache-Control': CACHE_INMUTABLE if inmutable else CACHE_REVALIDAR,
+            'Vary': 'Accept-Encoding',
+        }
+        # Comparación débil (RFC 9110): cualquier variante del mismo contenido vale
+        candidatos = {e.strip().removeprefix('W/').strip('"') for e in peticion.headers.get('If-None-Match', '').split(',')}
+        if '*' in candidatos or candidatos & {recurso.etag(c) for c in recurso.variantes}:
+            return Response(status=304, headers=cabeceras)
+
+        if codificacion != 'identity':
+            cabeceras['Content-Encoding'] = codificacion
+        return Response(recurso.variantes[codificacion], content_type=recurso.content_type, headers=cabeceras)
+
+    @staticmethod
+    def _elegir_codificacion(recurso, cabecera):
+        """Elegir br > gzip > identity según Accept-Encoding (respetando q=0)"""
+        aceptadas = {}
+        for parte in cabecera.lower().split(','):
+            codificacion, _, parametros = parte.strip().partition(';')
+            calidad = 1.0
+            if parametros.strip().startswith('q='):
+                try:
+                    calidad = float(parametros.strip()[2:])
+                except ValueError:
+                    calidad = 0.0
+            aceptadas[codificacion.strip()] = calidad
+        for codificacion in ('br', 'gzip'):
+            calidad = aceptadas.get(codificacion, aceptadas.get('*', 0.0))
+            if codificacion in recurso.variantes and calidad > 0:
+                return codificacion
+        return 'identity'
@@ -0,0 +1,156 @@
+import csv
+import io
+import os
+import tempfile
+import zlib
+from decimal import Decimal
+
+from openpyxl import Workbook
+
+from database import COLUMNAS_CONSULTA
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet es opcional
+    pa = pq = None
+
+FORMATOS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+FILAS_POR_LOTE = int(os.environ.get('EXPORT_FILAS_LOTE', 5000))
+MAX_FILAS_HOJA = 1048576 - 1  # límite de filas de Excel menos la cabecera
+TAMANO_BLOQUE = 256 * 1024
+
+
+class _SumideroStreaming(io.RawIOBase):
+    """Destino de escritura que acumula bytes hasta que se recogen, con tell() absoluto"""
+
+    def __init__(self):
+        self._partes = []
+        self._posicion = 0
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        datos = bytes(datos)
+        self._partes.append(datos)
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self._posicion
+
+    def recoger(self):
+        datos = b''.join(self._partes)
+        self._partes = []
+        return datos
+
+
+class ExportadorDatos:
+    """Clase para exportar mediciones en streaming (CSV, XLSX, Parquet)"""
+
+    def __init__(self, database_manager):
+        self.db = database_manager
+
+    def exportar(self, categoria, formato, filtros=None, campos=None, comprimir=False):
+        """Generador de bytes del archivo exportado; nunca mantiene el archivo completo en memoria"""
+        if formato not in FORMATOS:
+            raise ValueError(f'Formato no soportado: {formato}')
+        if formato == 'parquet' and pa is None:
+            raise ValueError('La exportación a Parquet requiere el paquete pyarrow')
+        campos = list(campos) if campos else list(COLUMNAS_CONSULTA)
+
+        # La consulta se valida aquí, antes de empezar a responder
+        filas = self.db.iterar_mediciones(categoria, filtros, campos, tamano_lote=FILAS_POR_LOTE)
+        generador = getattr(self, f'_{formato}')(filas, campos)
+        return self._gzip(generador) if comprimir else generador
+
+    def matriz_csv(self, matriz):
+        """CSV de una matriz de obtener_matriz: una fila por fecha y una columna por parámetro"""
+        parametros = matriz['parametros']
+        columnas = [matriz['columnas'][p] for p in parametros]
+        filas = (
+            dict(zip(['fecha'] + parametros, [fecha] + [columna[i] for columna in columnas]))
+            for i, fecha in enumerate(matriz['fechas'])
+        )
+        return self._csv(filas, ['fecha'] + parametros)
+
+    def _csv(self, filas, campos):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(campos)
+        for i, fila in enumerate(filas, 1):
+            writer.writerow([fila[c] for c in campos])
+            if i % FILAS_POR_LOTE == 0:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode('utf-8')
+
+    def _xlsx(self, filas, campos):
+        # El modo write-only escribe cada hoja en un temporal; el .xlsx final también va a disco
+        libro = Workbook(write_only=True)
+        hoja = None
+        filas_hoja = MAX_FILAS_HOJA
+        for fila in filas:
+            if filas_hoja >= MAX_FILAS_HOJA:
+                hoja = libro.create_sheet(f'mediciones_{len(libro.worksheets) + 1}')
+                hoja.append(campos)
+                filas_hoja = 0
+            hoja.append([self._valor_excel(fila[c]) for c in campos])
+            filas_hoja += 1
+        if hoja is None:
+            libro.create_sheet('mediciones_1').append(campos)
+
+        with tempfile.TemporaryFile() as temporal:
+            libro.save(temporal)
+            temporal.seek(0)
+            while True:
+                bloque = temporal.read(TAMANO_BLOQUE)
+                if not bloque:
+                    break
+                yield bloque
+
+    @staticmethod
+    def _valor_excel(valor):
+        return float(valor) if isinstance(valor, Decimal) else valor
+
+    def _parquet(self, filas, campos):
+        tipos = {
+            'id': pa.int64(),
+            'tipo': pa.string(),
+            'punto': pa.string(),
+            'parametro': pa.string(),
+            'fecha': pa.date32(),
+            'dato': pa.decimal128(10, 4),
+            'nota': pa.string(),
+            'timestamp': pa.timestamp('us'),
+        }
+        esquema = pa.schema([(c, tipos[c]) for c in campos])
+        sumidero = _SumideroStreaming()
+
+        with pq.ParquetWriter(sumidero, esquema, compression='zstd') as writer:
+            lote = []
+            for fila in filas:
+                lote.append(fila)
+                if len(lote) >= FILAS_POR_LOTE:
+                    writer.write_table(pa.Table.from_pylist(lote, schema=esquema))
+                    lote = []
+                    yield sumidero.recoger()
+            if lote:
+                writer.write_table(pa.Table.from_pylist(lote, schema=esquema))
+        # Al cerrar el writer se escribe el pie con los metadatos
+        yield sumidero.recoger()
+
+    @staticmethod
+    def _gzip(generador):
+        compresor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for bloque in generador:
+            comprimido = compresor.compress(bloque)
+            if comprimido:
+                yield comprimido
+        yield compresor.flush()
@@ -0,0 +1,124 @@
+"""Tareas de mantenimiento de la base de datos desde la línea de comandos.
+
+Uso:
+    python gestion.py migrar [--hasta 2]
+    python gestion.py estado-migraciones
+    python gestion.py recalcular-resumenes [--categoria fisicoquimica]
+    python gestion.py crear-particiones [--anios-futuros 2]
+    python gestion.py recalcular-spc [--categoria fisicoquimica]
+    python gestion.py sincronizar [--central postgresql://...] [--lote 5000]
+    python gestion.py archivar [--meses 24] [--categoria fisicoquimica]
+    python gestion.py procesar-importaciones [--hilos 2]
+
+Con DATABASE_URL=sqlite:///... las tareas se ejecutan sobre la base embebida de la
+estación; sincronizar envía sus mediciones nuevas al Postgres central.
+"""
+import argparse
+import signal
+import sys
+
+from database import CATEGORIAS, crear_database_manager
+
+
+def migrar(db, args):
+    """Aplicar las migraciones pendientes (fase release del despliegue)"""
+    return db.migrar(args.hasta)
+
+
+def estado_migraciones(db, args):
+    """Versión del esquema y migraciones pendientes o modificadas"""
+    return db.estado_esquema()
+
+
+def recalcular_resumenes(db, args):
+    """Rellenar o reparar los resúmenes diarios de estadísticas"""
+    return db.recalcular_resumenes(args.categoria)
+
+
+def crear_particiones(db, args):
+    """Crear las particiones anuales que falten (pensado para ejecutarse desde cron)"""
+    return db.crear_particiones(args.anios_futuros)
+
+
+def recalcular_spc(db, args):
+    """Reconstruir el estado y los eventos SPC de todas las series desde el histórico"""
+    return db.recalcular_spc(args.categoria)
+
+
+def archivar(db, args):
+    """Mover a Parquet las mediciones antiguas (pensado para ejecutarse desde cron)"""
+    return db.archivar(args.meses, args.categoria)
+
+
+def procesar_importaciones(db, args):
+    """Procesar la cola de importaciones en primer plano hasta recibir SIGTERM (proceso worker)"""
+    if db.embebida:
+        return {'success': False, 'message': 'La cola de importaciones solo está disponible con Postgres'}
+    from importador import ImportadorDatos
+    from importaciones import GestorImportaciones
+
+    gestor = GestorImportaciones(db, ImportadorDatos(db), hilos=args.hilos)
+    signal.signal(signal.SIGTERM, lambda *_: gestor.detener())
+    gestor.iniciar()
+    try:
+        gestor.esperar()
+    except KeyboardInterrupt:
+        gestor.detener()
+        gestor.esperar()
+    return {'success': True, 'message': '✓ Cola de importaciones detenida'}
+
+
+def sincronizar(db, args):
+    """Enviar al Postgres central las mediciones nuevas de la base embebida"""
+    if not db.embebida:
+        return {'success': False, 'message': 'sincronizar solo se usa con DATABASE_URL=sqlite:///...'}
+    return db.sincronizar(args.central, args.lote)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mantenimiento de la base de datos del laboratorio')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    migrar_parser = subparsers.add_parser('migrar', help='Aplicar las migraciones pendientes del esquema')
+    migrar_parser.add_argument('--hasta', type=int, default=None, help='Última versión a aplicar')
+    migrar_parser.set_defaults(funcion=migrar)
+
+    estado = subparsers.add_parser('estado-migraciones', help='Mostrar la versión del esquema')
+    estado.set_defaults(funcion=estado_migraciones)
+
+    recalcular = subparsers.add_parser('recalcular-resumenes', help='Reconstruir los resúmenes diarios')
+    recalcular.add_argument('--categoria', choices=CATEGORIAS)
+    recalcular.set_defaults(funcion=recalcular_resumenes)
+
+    crear = subparsers.add_parser('crear-particiones', help='Crear particiones de años futuros y vaciar DEFAULT')
+    crear.add_argument('--anios-futuros', type=int, default=None)
+    crear.set_defaults(funcion=crear_particiones)
+
+    spc = subparsers.add_parser('recalcular-spc', help='Reconstruir el estado y los eventos del control estadístico')
+    spc.add_argument('--categoria', choices=CATEGORIAS)
+    spc.set_defaults(funcion=recalcular_spc)
+
+    archivar_parser = subparsers.add_parser('archivar', help='Mover las mediciones antiguas al archivo Parquet')
+    archivar_parser.add_argument('--meses', type=int, default=None, help='Antigüedad mínima (por defecto ARCHIVO_MESES)')
+    archivar_parser.add_argument('--categoria', choices=CATEGORIAS)
+    archivar_parser.set_defaults(funcion=archivar)
+
+    procesar = subparsers.add_parser('procesar-importaciones', help='Procesar la cola de importaciones en segundo plano')
+    procesar.add_argument('--hilos', type=int, default=None, help='Importaciones simultáneas (por defecto IMPORT_HILOS)')
+    procesar.set_defaults(funcion=procesar_importaciones)
+
+    sincronizar_parser = subparsers.add_parser('sincronizar', help='Enviar las mediciones de la estación al servidor central')
+    sincronizar_parser.add_argument('--central', default=None, help='URL del Postgres central (por defecto DATABASE_URL_CENTRAL)')
+    sincronizar_parser.add_argument('--lote', type=int, default=5000, help='Filas por envío')
+    sincronizar_parser.set_defaults(funcion=sincronizar)
+
+    args = parser.parse_args(argv)
+    resultado = args.funcion(crear_database_manager(), args)
+    print(resultado['message'])
+    if resultado.get('data'):
+        print(resultado['data'])
+    return 0 if resultado['success'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
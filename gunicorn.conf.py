@@ -0,0 +1,23 @@
+"""Configuración de gunicorn (se carga sola al arrancar desde este directorio).
+
+Activa el modo multiproceso de prometheus_client: los workers escriben sus
+métricas en PROMETHEUS_MULTIPROC_DIR y /metrics las agrega. La carpeta se vacía
+al arrancar el maestro y los gauges de un worker que termina se descartan.
+"""
+import os
+import shutil
+import tempfile
+
+carpeta_metricas = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'pharma_metricas')
+)
+
+
+def on_starting(server):
+    shutil.rmtree(carpeta_metricas, ignore_errors=True)
+    os.makedirs(carpeta_metricas, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,463 @@
+import hashlib
+import json
+import os
+import socket
+import tempfile
+import threading
+import uuid
+
+from psycopg2.extras import RealDictCursor
+
+ESTADOS_FINALES = ('completado', 'error', 'cancelado')
+TAMANO_BLOQUE_ARCHIVO = 1024 * 1024
+
+
+class GestorImportaciones:
+    """Cola de importaciones en segundo plano con el estado persistido en PostgreSQL"""
+
+    def __init__(self, database_manager, importador, hilos=None):
+        self.db = database_manager
+        self.importador = importador
+        self.hilos = hilos or int(os.environ.get('IMPORT_HILOS', 2))
+        self.sondeo = float(os.environ.get('IMPORT_SONDEO', 5))
+        self.caducidad_latido = int(os.environ.get('IMPORT_LATIDO_CADUCA', 120))
+        self.max_intentos = int(os.environ.get('IMPORT_MAX_INTENTOS', 3))
+        self.intervalo_particiones = float(os.environ.get('IMPORT_PARTICIONES_CADA', 3600))
+        self.trabajador = f'{socket.gethostname()}:{os.getpid()}'
+
+        self._despertar = threading.Event()
+        self._detener = threading.Event()
+        self._en_curso = set()
+        self._lock = threading.Lock()
+        self._hilos = []
+        self._pid = None
+
+    def iniciar(self):
+        """Arrancar los hilos de trabajo de este proceso (idempotente y seguro tras fork)"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.trabajador = f'{socket.gethostname()}:{os.getpid()}'
+            self._hilos = [
+                threading.Thread(target=self._bucle_trabajo, name=f'importacion-{i}', daemon=True)
+                for i in range(self.hilos)
+            ]
+            self._hilos.append(threading.Thread(target=self._bucle_latido, name='importacion-latido', daemon=True))
+            self._hilos.append(
+                threading.Thread(target=self._bucle_particiones, name='importacion-particiones', daemon=True)
+            )
+        for hilo in self._hilos:
+            hilo.start()
+
+    def detener(self):
+        """Pedir a los hilos que terminen tras el trabajo en curso"""
+        self._detener.set()
+        self._despertar.set()
+
+    def esperar(self, intervalo=1.0):
+        """Esperar a que terminen los hilos de trabajo (tras detener())"""
+        for hilo in self._hilos:
+            # join con intervalo para que las señales (SIGTERM) se atiendan mientras tanto
+            while hilo.is_alive():
+                hilo.join(intervalo)
+
+    def encolar(self, archivo, categoria, formato, nombre_archivo=None, modo='omitir'):
+        """Guardar el archivo en la base de datos y crear el trabajo; devuelve su id al momento.
+        
+        Si el mismo contenido ya se importó en la categoría (y el modo no es 'duplicar') no se
+        crea ningún trabajo y la respuesta lo indica con omitido=True.
+        """
+        flujo = getattr(archivo, 'stream', archivo)
+        id_trabajo = uuid.uuid4()
+        try:
+            with self.db.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión'}
+
+                # El archivo va a un large object para poder leerlo en streaming al procesarlo;
+                # la huella se calcula en la misma pasada
+                huella = hashlib.sha256()
+                lobject = conn.lobject(0, 'wb')
+                while True:
+                    bloque = flujo.read(TAMANO_BLOQUE_ARCHIVO)
+                    if not bloque:
+                        break
+                    huella.update(bloque)
+                    lobject.write(bloque)
+                oid = lobject.oid
+                lobject.close()
+                huella = huella.hexdigest()
+
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+                previo = None
+                if modo != 'duplicar':
+                    cur.execute(
+                        'SELECT importacion, filas, creado FROM archivos_importados WHERE categoria = %s AND huella = %s',
+                        (categoria, huella)
+                    )
+                    previo = cur.fetchone()
+                if previo:
+                    # El rollback descarta también el large object
+                    conn.rollback()
+                    cur.close()
+                    return {
+                        'success': True,
+                        'omitido': True,
+                        'message': f"Archivo ya importado el {previo['creado']:%Y-%m-%d %H:%M} "
+                                   f"({previo['filas']} filas): no se vuelve a importar",
+                        'id': str(previo['importacion']) if previo['importacion'] else None,
+                        'huella': huella
+                    }
+                cur.execute('''
+                    INSERT INTO importaciones (id, categoria, formato, nombre_archivo, archivo_oid, modo, huella)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ''', (str(id_trabajo), categoria, formato, nombre_archivo, oid, modo, huella))
+                conn.commit()
+                cur.close()
+        except Exception as e:
+            return {'success': False, 'message': f'Error: {str(e)}'}
+
+        self._despertar.set()
+        return {
+            'success': True,
+            'message': 'Importación en cola',
+            'id': str(id_trabajo),
+            'estado': 'en_cola',
+            'huella': huella
+        }
+
+    def obtener(self, id_trabajo):
+        """Estado, progreso, velocidad y errores de un trabajo"""
+        try:
+            uuid.UUID(str(id_trabajo))
+        except ValueError:
+            return {'success': False, 'message': 'Importación no encontrada'}
+
+        try:
+            with self.db.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión'}
+
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+                cur.execute('SELECT * FROM importaciones WHERE id = %s', (str(id_trabajo),))
+                trabajo = cur.fetchone()
+                cur.close()
+
+            if not trabajo:
+                return {'success': False, 'message': 'Importación no encontrada'}
+            return {'success': True, 'data': self._serializar(trabajo)}
+        except Exception as e:
+            return {'success': False, 'message': f'Error: {str(e)}'}
+
+    def listar(self, limite=50):
+        """Últimos trabajos de importación"""
+        try:
+            with self.db.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión'}
+
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+                cur.execute('SELECT * FROM importaciones ORDER BY creado DESC LIMIT %s', (limite,))
+                trabajos = cur.fetchall()
+                cur.close()
+
+            return {'success': True, 'data': [self._serializar(t) for t in trabajos]}
+        except Exception as e:
+            return {'success': False, 'message': f'Error: {str(e)}'}
+
+    def cancelar(self, id_trabajo):
+        """Cancelar un trabajo: en cola se cancela al momento, en curso tras el bloque actual"""
+        try:
+            uuid.UUID(str(id_trabajo))
+        except ValueError:
+            return {'success': False, 'message': 'Importación no encontrada'}
+
+        try:
+            with self.db.conexion() as conn:
+                if not conn:
+                    return {'success': False, 'message': 'Error de conexión'}
+
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+                cur.execute('SELECT estado FROM importaciones WHERE id = %s FOR UPDATE', (str(id_trabajo),))
+                trabajo = cur.fetchone()
+                if trabajo and trabajo['estado'] not in ESTADOS_FINALES:
+                    cur.execute('''
+                        UPDATE importaciones
+                        SET cancelar = TRUE,
+                            estado = CASE WHEN estado = 'en_cola' THEN 'cancelado' ELSE estado END,
+                            finalizado = CASE WHEN estado = 'en_cola' THEN CURRENT_TIMESTAMP ELSE finalizado END
+                        WHERE id = %s
+                        RETURNING estado, archivo_oid
+                    ''', (str(id_trabajo),))
+                    actualizado = cur.fetchone()
+                    if actualizado['estado'] == 'cancelado':
+                        self._liberar_archivo(conn, cur, str(id_trabajo), actualizado['archivo_oid'])
+                conn.commit()
+                cur.close()
+
+            if not trabajo:
+                return {'success': False, 'message': 'Importación no encontrada'}
+            if trabajo['estado'] in ESTADOS_FINALES:
+                return {'success': False, 'message': f"La importación ya ha finalizado ({trabajo['estado']})"}
+            trabajo = actualizado
+            return {'success': True, 'message': 'Cancelación solicitada', 'estado': trabajo['estado']}
+        except Exception as e:
+            return {'success': False, 'message': f'Error: {str(e)}'}
+
+    @staticmethod
+    def _serializar(trabajo):
+        """Convertir una fila de importaciones en la respuesta de la API"""
+        inicio = trabajo['iniciado']
+        fin = trabajo['finalizado'] or trabajo['latido']
+        velocidad = None
+        if inicio and fin and fin > inicio:
+            velocidad = round(trabajo['filas_procesadas'] / (fin - inicio).total_seconds(), 1)
+
+        return {
+            'id': str(trabajo['id']),
+            'categoria': trabajo['categoria'],
+            'formato': trabajo['formato'],
+            'nombre_archivo': trabajo['nombre_archivo'],
+            'modo': trabajo['modo'],
+            'estado': trabajo['estado'],
+            'cancelacion_solicitada': trabajo['cancelar'],
+            'filas_procesadas': trabajo['filas_procesadas'],
+            'insertados': trabajo['insertados'],
+            'actualizados': trabajo['actualizados'],
+            'omitidos': trabajo['omitidos'],
+            'total_errores': trabajo['total_errores'],
+            'errores': trabajo['errores'][:10],
+            'filas_por_segundo': velocidad,
+            'mensaje': trabajo['mensaje'],
+            'intentos': trabajo['intentos'],
+            'creado': trabajo['creado'],
+            'iniciado': trabajo['iniciado'],
+            'finalizado': trabajo['finalizado']
+        }
+
+    def _bucle_trabajo(self):
+        """Tomar trabajos de la cola hasta que se pida detener"""
+        while not self._detener.is_set():
+            try:
+                trabajo = self._reclamar()
+            except Exception as e:
+                print(f"Error al reclamar importación: {e}")
+                trabajo = None
+
+            if trabajo is None:
+                self._despertar.wait(self.sondeo)
+                self._despertar.clear()
+                continue
+
+            with self._lock:
+                self._en_curso.add(str(trabajo['id']))
+            try:
+                self._ejecutar(trabajo)
+            except Exception as e:
+                try:
+                    self._finalizar(trabajo, 'error', f'Error: {str(e)}')
+                except Exception as e_finalizar:
+                    # Sin base de datos el trabajo sigue 'procesando': al caducar el latido vuelve a la cola
+                    print(f"Error al finalizar la importación {trabajo['id']}: {e_finalizar} (tras: {e})")
+            finally:
+                with self._lock:
+                    self._en_curso.discard(str(trabajo['id']))
+
+    def _bucle_latido(self):
+        """Marcar como vivos los trabajos de este proceso para que nadie los reclame"""
+        intervalo = max(1, self.caducidad_latido // 4)
+        while not self._detener.wait(intervalo):
+            with self._lock:
+                en_curso = list(self._en_curso)
+            if not en_curso:
+                continue
+            try:
+                with self.db.conexion() as conn:
+                    if not conn:
+                        continue
+                    cur = conn.cursor()
+                    cur.execute('''
+                        UPDATE importaciones SET latido = CURRENT_TIMESTAMP
+                        WHERE id = ANY(%s::uuid[]) AND trabajador = %s
+                    ''', (en_curso, self.trabajador))
+                    conn.commit()
+                    cur.close()
+            except Exception as e:
+                print(f"Error al actualizar latido de importaciones: {e}")
+
+    def _bucle_particiones(self):
+        """Crear al arrancar y después periódicamente las particiones del año actual y los siguientes.
+
+        Así las filas de un año nuevo no caen en DEFAULT aunque no haya cron de crear-particiones.
+        """
+        while True:
+            resultado = self.db.crear_particiones()
+            if not resultado['success']:
+                print(f"Error al crear particiones: {resultado['message']}")
+            elif any(resultado['data'].values()):
+                print(f"Particiones creadas: {resultado['data']}")
+            if self._detener.wait(self.intervalo_particiones):
+                return
+
+    def _reclamar(self):
+        """Reclamar el trabajo más antiguo en cola (y recuperar los de procesos caídos)"""
+        with self.db.conexion() as conn:
+            if not conn:
+                return None
+
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            # Trabajos de un worker reiniciado: sin latido reciente vuelven a la cola
+            cur.execute('''
+                UPDATE importaciones SET estado = 'en_cola', trabajador = NULL
+                WHERE estado = 'procesando'
+                  AND latido < CURRENT_TIMESTAMP - make_interval(secs => %s)
+            ''', (self.caducidad_latido,))
+            cur.execute('''
+                UPDATE importaciones
+                SET estado = 'procesando',
+                    trabajador = %s,
+                    latido = CURRENT_TIMESTAMP,
+                    iniciado = COALESCE(iniciado, CURRENT_TIMESTAMP),
+                    intentos = intentos + 1
+                WHERE id = (
+                    SELECT id FROM importaciones
+                    WHERE estado = 'en_cola'
+                    ORDER BY creado
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING *
+            ''', (self.trabajador,))
+            trabajo = cur.fetchone()
+            conn.commit()
+            cur.close()
+            return trabajo
+
+    def _ejecutar(self, trabajo):
+        """Procesar un trabajo reclamado, retomándolo donde quedó si ya se había empezado"""
+        if trabajo['cancelar']:
+            self._finalizar(trabajo, 'cancelado', 'Importación cancelada')
+            return
+        if trabajo['intentos'] > self.max_intentos:
+            self._finalizar(trabajo, 'error', f"Abandonada tras {trabajo['intentos'] - 1} intentos")
+            return
+        if trabajo['archivo_oid'] is None:
+            self._finalizar(trabajo, 'error', 'El archivo de la importación ya no existe')
+            return
+        # Dos subidas del mismo archivo encoladas a la vez: solo se procesa la primera
+        if trabajo['modo'] != 'duplicar' and trabajo['huella'] and not trabajo['filas_procesadas']:
+            previo = self.db.buscar_archivo_importado(trabajo['categoria'], trabajo['huella'])
+            if previo:
+                self._finalizar(trabajo, 'completado', 'Archivo ya importado: no se vuelve a importar')
+                return
+
+        previos = {
+            'filas': trabajo['filas_procesadas'],
+            'insertados': trabajo['insertados'],
+            'errores': trabajo['total_errores'],
+            'actualizados': trabajo['actualizados'],
+            'omitidos': trabajo['omitidos']
+        }
+        # Las filas que insertó este trabajo antes de un reinicio no cuentan como existentes
+        opciones = {'modo': trabajo['modo'], 'desde': trabajo['iniciado']}
+
+        def progreso(filas, insertados, errores, actualizados=0, omitidos=0):
+            return self._actualizar_progreso(
+                trabajo['id'], filas, previos['insertados'] + insertados, previos['errores'] + errores,
+                previos['actualizados'] + actualizados, previos['omitidos'] + omitidos
+            )
+
+        # El archivo se copia a un temporal en una transacción corta: la importación no ocupa
+        # una conexión del pool ni deja una sesión abierta en transacción mientras dura.
+        # openpyxl, además, lee el .xlsx como zip y necesita seek.
+        with tempfile.TemporaryFile() as temporal:
+            self._copiar_archivo(trabajo['archivo_oid'], temporal)
+            temporal.seek(0)
+            if trabajo['formato'] == 'excel':
+                resultado = self.importador.procesar_excel(
+                    temporal, trabajo['categoria'], progreso=progreso, saltar_filas=previos['filas'], **opciones
+                )
+            else:
+                resultado = self.importador.procesar_txt(
+                    temporal, trabajo['categoria'], progreso=progreso, saltar_filas=previos['filas'], **opciones
+                )
+
+        mensaje = resultado['message']
+        if resultado.get('cancelado'):
+            estado = 'cancelado'
+        elif resultado['success']:
+            estado = 'completado'
+        elif resultado.get('completo') and previos['insertados']:
+            # Retomada sin nada válido pendiente: lo importado antes del reinicio es el resultado
+            estado = 'completado'
+            mensaje = f"✓ {previos['insertados']} registros importados"
+        else:
+            estado = 'error'
+            if previos['insertados']:
+                mensaje += f" ({previos['insertados']} registros importados antes de retomar)"
+        self._finalizar(trabajo, estado, mensaje, resultado.get('errores', []))
+
+    def _copiar_archivo(self, oid, destino):
+        """Copiar el large object de un trabajo a un archivo local"""
+        with self.db.conexion() as conn:
+            if not conn:
+                raise RuntimeError('Error de conexión')
+            lobject = conn.lobject(oid, 'rb')
+            try:
+                while True:
+                    bloque = lobject.read(TAMANO_BLOQUE_ARCHIVO)
+                    if not bloque:
+                        break
+                    destino.write(bloque)
+            finally:
+                lobject.close()
+                conn.commit()
+
+    def _actualizar_progreso(self, id_trabajo, filas, insertados, errores, actualizados=0, omitidos=0):
+        """Guardar el progreso tras cada bloque confirmado; devuelve False si se pidió cancelar"""
+        with self.db.conexion() as conn:
+            if not conn:
+                return True
+            cur = conn.cursor()
+            cur.execute('''
+                UPDATE importaciones
+                SET filas_procesadas = %s, insertados = %s, total_errores = %s,
+                    actualizados = %s, omitidos = %s, latido = CURRENT_TIMESTAMP
+                WHERE id = %s
+                RETURNING cancelar
+            ''', (filas, insertados, errores, actualizados, omitidos, str(id_trabajo)))
+            fila = cur.fetchone()
+            conn.commit()
+            cur.close()
+        return not (fila and fila[0])
+
+    def _finalizar(self, trabajo, estado, mensaje, errores=None):
+        """Cerrar el trabajo y liberar el archivo almacenado"""
+        with self.db.conexion() as conn:
+            if not conn:
+                return
+            cur = conn.cursor()
+            cur.execute('''
+                UPDATE importaciones
+                SET estado = %s, mensaje = %s, errores = %s, finalizado = CURRENT_TIMESTAMP, trabajador = NULL
+                WHERE id = %s
+            ''', (estado, mensaje, json.dumps(errores or []), str(trabajo['id'])))
+            if estado == 'completado':
+                # Archivo leído hasta el final: registrar la huella para reconocerlo si se vuelve a subir
+                cur.execute('''
+                    INSERT INTO archivos_importados (categoria, huella, nombre_archivo, importacion, filas)
+                    SELECT categoria, huella, nombre_archivo, id, filas_procesadas
+                    FROM importaciones WHERE id = %s AND huella IS NOT NULL
+                    ON CONFLICT (categoria, huella) DO NOTHING
+                ''', (str(trabajo['id']),))
+            self._liberar_archivo(conn, cur, str(trabajo['id']), trabajo['archivo_oid'])
+            conn.commit()
+            cur.close()
+
+    @staticmethod
+    def _liberar_archivo(conn, cur, id_trabajo, oid):
+        if oid is None:
+            return
+        conn.lobject(oid, 'rb').unlink()
+        cur.execute('UPDATE importaciones SET archivo_oid = NULL WHERE id = %s', (id_trabajo,))
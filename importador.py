@@ -1,30 +1,231 @@
 import pandas as pd
+import numpy as np
+import codecs
+import csv
+import hashlib
 import io
+import os
+import warnings
 from datetime import datetime
 
+from openpyxl import load_workbook
+
+import metricas
+from catalogo import normalizar_columnas
+
+TAMANO_CHUNK = int(os.environ.get('IMPORT_CHUNK_FILAS', 20000))
+TAMANO_MUESTRA = 64 * 1024
+MAX_ERRORES = 100
+SEPARADORES = ',;\t|'
+COLUMNAS_REQUERIDAS = ['fecha', 'punto', 'parametro', 'dato']
+
+
+def detectar_codificacion(muestra):
+    """Detectar la codificación a partir de los primeros bytes del archivo"""
+    if muestra.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if muestra.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    try:
+        # final=False: un carácter multibyte cortado al final de la muestra no es un error
+        codecs.getincrementaldecoder('utf-8')().decode(muestra, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    try:
+        muestra.decode('cp1252')
+        return 'cp1252'
+    except UnicodeDecodeError:
+        return 'latin-1'
+
+
+def detectar_separador(muestra, codificacion):
+    """Detectar el separador de columnas a partir de las primeras líneas"""
+    texto = codecs.getincrementaldecoder(codificacion)(errors='ignore').decode(muestra, final=False)
+    lineas = [l for l in texto.splitlines()[:50] if l.strip()]
+    if len(lineas) > 1 and not muestra.endswith((b'\n', b'\r')) and len(muestra) >= TAMANO_MUESTRA:
+        lineas = lineas[:-1]  # la última línea puede estar incompleta
+    try:
+        return csv.Sniffer().sniff('\n'.join(lineas), delimiters=SEPARADORES).delimiter
+    except csv.Error:
+        # Sin patrón claro: el separador más frecuente en la cabecera
+        cabecera = lineas[0] if lineas else ''
+        return max(SEPARADORES, key=cabecera.count) if any(c in cabecera for c in SEPARADORES) else ','
+
+
+def huella_archivo(flujo):
+    """SHA-256 del contenido de un flujo binario con seek; lo deja otra vez al principio"""
+    huella = hashlib.sha256()
+    flujo.seek(0)
+    for bloque in iter(lambda: flujo.read(1024 * 1024), b''):
+        huella.update(bloque)
+    flujo.seek(0)
+    return huella.hexdigest()
+
+
+class _FlujoConPrefijo(io.RawIOBase):
+    """Flujo binario que devuelve primero los bytes ya leídos y después el resto del original"""
+    
+    def __init__(self, prefijo, flujo):
+        self._prefijo = memoryview(prefijo)
+        self._flujo = flujo
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, buffer):
+        if self._prefijo:
+            n = min(len(buffer), len(self._prefijo))
+            buffer[:n] = self._prefijo[:n]
+            self._prefijo = self._prefijo[n:]
+            return n
+        datos = self._flujo.read(len(buffer))
+        n = len(datos)
+        buffer[:n] = datos
+        return n
+
+
+def _saltar_filas(chunks, saltar_filas):
+    """Descartar las primeras filas de datos ya procesadas.
+
+    Se cuentan filas de read_csv, como filas_procesadas, y no líneas del archivo: las
+    líneas en blanco y los campos entre comillas con saltos de línea no las desplazan.
+    """
+    for df in chunks:
+        if saltar_filas >= len(df):
+            saltar_filas -= len(df)
+            continue
+        if saltar_filas:
+            df = df.iloc[saltar_filas:].reset_index(drop=True)
+            saltar_filas = 0
+        yield df
+
+
+def _nombre_columna(valor, posicion):
+    """Cabecera normalizada de una columna de Excel (las celdas vacías reciben un nombre propio)"""
+    if valor is None or str(valor).strip() == '':
+        return f'columna_{posicion + 1}'
+    return str(valor).strip().lower()
+
+
+def bloques_excel(archivo, tamano_chunk=None, saltar_filas=0):
+    """Recorrer todas las hojas de un libro en modo solo lectura y producir DataFrames de tamaño acotado.
+
+    Cada bloque lleva en df.attrs la hoja y el número de fila de Excel de su primera
+    fila. Si la hoja no tiene columna punto, se toma el nombre de la hoja (el LIMS
+    exporta una hoja por punto de muestreo). Las hojas sin las columnas fecha,
+    parametro y dato (instrucciones, portadas...) se saltan. saltar_filas cuenta
+    filas de datos de todas las hojas en orden, como al reanudar una importación.
+    """
+    tamano_chunk = tamano_chunk or TAMANO_CHUNK
+    libro = load_workbook(archivo, read_only=True, data_only=True)
+    faltan = None
+    try:
+        for hoja in libro.worksheets:
+            # Algunos exportadores escriben mal las dimensiones de la hoja: se leen todas las filas
+            hoja.reset_dimensions()
+            filas = hoja.iter_rows(values_only=True)
+            cabecera = next(filas, None)
+            if not cabecera:
+                continue
+            columnas = [_nombre_columna(valor, i) for i, valor in enumerate(cabecera)]
+            ausentes = [c for c in COLUMNAS_REQUERIDAS if c != 'punto' and c not in columnas]
+            if ausentes:
+                faltan = ausentes if faltan is None else faltan
+                continue
+            faltan = []
+            punto_hoja = None if 'punto' in columnas else hoja.title.strip()
+            bloque = []
+            fila_bloque = 2
+            for numero_fila, fila in _filas_hoja(filas, len(columnas)):
+                if saltar_filas:
+                    saltar_filas -= 1
+                    continue
+                if not bloque:
+                    fila_bloque = numero_fila
+                bloque.append(fila)
+                if len(bloque) >= tamano_chunk:
+                    yield _dataframe_hoja(bloque, columnas, hoja.title, fila_bloque, punto_hoja)
+                    bloque = []
+            if bloque:
+                yield _dataframe_hoja(bloque, columnas, hoja.title, fila_bloque, punto_hoja)
+        if faltan:
+            raise ValueError(f'Faltan columnas: {", ".join(faltan)}')
+    finally:
+        libro.close()
+
+
+def _filas_hoja(filas, ancho):
+    """(número de fila de Excel, valores) de las filas de datos con el ancho de la cabecera.
+
+    Las filas vacías intermedias se conservan (cuentan como error, igual que con
+    read_excel) y las del final de la hoja se descartan.
+    """
+    vacias = []
+    for numero_fila, fila in enumerate(filas, start=2):
+        fila = tuple(fila[:ancho]) + (None,) * (ancho - len(fila))
+        if all(v is None or (isinstance(v, str) and not v.strip()) for v in fila):
+            vacias.append((numero_fila, fila))
+            continue
+        yield from vacias
+        vacias = []
+        yield numero_fila, fila
+
+
+def _dataframe_hoja(filas, columnas, hoja, fila_inicial, punto=None):
+    df = pd.DataFrame.from_records(filas, columns=columnas)
+    if punto is not None:
+        df['punto'] = punto
+    df.attrs['hoja'] = hoja
+    df.attrs['fila_inicial'] = fila_inicial
+    return df
+
+
 class ImportadorDatos:
     """Clase para importar datos desde diferentes formatos"""
     
     def __init__(self, database_manager):
         self.db = database_manager
     
-    def procesar_excel(self, archivo, categoria):
-        """Importar datos desde archivo Excel"""
+    def procesar_excel(self, archivo, categoria, progreso=None, saltar_filas=0, tamano_chunk=None,
+                       modo='omitir', desde=None):
+        """Importar datos desde archivo Excel: todas las hojas, leídas fila a fila por bloques"""
         try:
-            df = pd.read_excel(archivo)
-            return self._procesar_dataframe(df, categoria)
+            flujo = getattr(archivo, 'stream', archivo)
+            chunks = bloques_excel(flujo, tamano_chunk, saltar_filas)
+            return self._procesar_chunks(chunks, categoria, progreso, fila_inicial=2 + saltar_filas,
+                                         modo=modo, desde=desde)
         except Exception as e:
             return {
                 'success': False,
                 'message': f'Error al leer Excel: {str(e)}'
             }
     
-    def procesar_txt(self, archivo, categoria, separador=','):
-        """Importar datos desde archivo TXT/CSV"""
+    def procesar_txt(self, archivo, categoria, separador=None, codificacion=None, tamano_chunk=None,
+                     progreso=None, saltar_filas=0, modo='omitir', desde=None):
+        """Importar datos desde archivo TXT/CSV leyendo el flujo por bloques"""
         try:
-            content = archivo.read().decode('utf-8')
-            df = pd.read_csv(io.StringIO(content), sep=separador)
-            return self._procesar_dataframe(df, categoria)
+            flujo = getattr(archivo, 'stream', archivo)
+            muestra = flujo.read(TAMANO_MUESTRA)
+            codificacion = codificacion or detectar_codificacion(muestra)
+            separador = separador or detectar_separador(muestra, codificacion)
+            
+            texto = io.TextIOWrapper(
+                io.BufferedReader(_FlujoConPrefijo(muestra, flujo)),
+                encoding=codificacion,
+                newline=''
+            )
+            chunks = pd.read_csv(
+                texto,
+                sep=separador,
+                dtype=str,
+                skipinitialspace=True,
+                chunksize=tamano_chunk or TAMANO_CHUNK
+            )
+            if saltar_filas:
+                chunks = _saltar_filas(chunks, saltar_filas)
+            return self._procesar_chunks(chunks, categoria, progreso, fila_inicial=2 + saltar_filas,
+                                         modo=modo, desde=desde)
         except Exception as e:
             return {
                 'success': False,
@@ -33,67 +234,98 @@ class ImportadorDatos:
     
     def _procesar_dataframe(self, df, categoria):
         """Procesar un DataFrame y guardarlo en la base de datos"""
+        return self._procesar_chunks([df], categoria)
+    
+    def _procesar_chunks(self, chunks, categoria, progreso=None, fila_inicial=2, modo='omitir', desde=None):
+        """Validar e insertar bloque a bloque; la memoria depende del tamaño del bloque, no del archivo.
+        
+        modo ('omitir', 'sobrescribir' o 'duplicar') decide qué pasa con las filas cuya clave
+        tipo, punto, parametro, fecha ya estaba en la base antes de empezar (desde).
+        Si se indica, progreso(filas_procesadas, insertados, errores, actualizados, omitidos)
+        se llama tras cada bloque confirmado; si devuelve False la importación se detiene.
+        """
         try:
-            df.columns = df.columns.str.lower().str.strip()
-            
-            required_cols = ['fecha', 'punto', 'parametro', 'dato']
-            missing_cols = [col for col in required_cols if col not in df.columns]
-            
-            if missing_cols:
-                return {
-                    'success': False,
-                    'message': f'Faltan columnas: {", ".join(missing_cols)}'
-                }
-            
-            datos_validos = []
+            insertados = actualizados = omitidos = 0
+            total_errores = 0
             errores = []
+            procesadas = fila_inicial - 2
             
-            for idx, row in df.iterrows():
-                try:
-                    fecha = pd.to_datetime(row['fecha']).date()
-                    dato = float(str(row['dato']).replace(',', '.'))
-                    punto = str(row['punto']).strip()
-                    parametro = str(row['parametro']).strip().upper()
-                    tipo = row.get('tipo', 'agua')
-                    nota = str(row['nota']) if 'nota' in row and pd.notna(row['nota']) else None
-                    
-                    datos_validos.append({
-                        'tipo': tipo,
-                        'punto': punto,
-                        'parametro': parametro,
-                        'fecha': fecha,
-                        'dato': dato,
-                        'nota': nota
-                    })
-                    
-                except Exception as e:
-                    errores.append(f"Fila {idx + 2}: {str(e)}")
-                    continue
+            # Etapas medidas: leer (parseo de cada bloque), validar e insertar
+            for df in metricas.medir_bloques(chunks):
+                df.columns = df.columns.str.lower().str.strip()
+                # Los bloques de Excel traen su hoja y su fila de inicio
+                hoja = df.attrs.get('hoja')
+                if hoja is not None:
+                    fila_inicial = df.attrs['fila_inicial']
+                
+                missing_cols = [col for col in COLUMNAS_REQUERIDAS if col not in df.columns]
+                
+                if missing_cols:
+                    return {
+                        'success': False,
+                        'message': f'Faltan columnas: {", ".join(missing_cols)}'
+                    }
+                
+                with metricas.etapa_importacion('validar', len(df)):
+                    datos_validos, filas, errores_chunk = self._validar_dataframe(df, fila_inicial, categoria)
+                fila_inicial += len(df)
+                procesadas += len(df)
+                
+                if datos_validos:
+                    with metricas.etapa_importacion('insertar') as etapa:
+                        resultado = self.db.insertar_mediciones_bulk(categoria, datos_validos, modo=modo, desde=desde)
+                        etapa.filas = resultado.get('insertados', 0) + resultado.get('actualizados', 0)
+                    if not resultado['success']:
+                        return {
+                            'success': False,
+                            'message': resultado['message'],
+                            'insertados': insertados,
+                            'errores': errores[:10]
+                        }
+                    insertados += resultado['insertados']
+                    actualizados += resultado['actualizados']
+                    omitidos += resultado['omitidos']
+                    desde = resultado['desde']
+                    for error in resultado['errores']:
+                        errores_chunk.append(f"Fila {filas[error['indice']]}: {error['error']}")
+                if hoja is not None:
+                    errores_chunk = [f'Hoja {hoja}, {error[0].lower()}{error[1:]}' for error in errores_chunk]
+                
+                total_errores += len(errores_chunk)
+                errores.extend(errores_chunk[:MAX_ERRORES - len(errores)])
+                
+                if progreso and progreso(procesadas, insertados, total_errores, actualizados, omitidos) is False:
+                    return {
+                        'success': False,
+                        'cancelado': True,
+                        'message': f'Importación cancelada ({insertados} registros importados)',
+                        'insertados': insertados,
+                        'actualizados': actualizados,
+                        'omitidos': omitidos,
+                        'errores': errores[:10]
+                    }
             
-            if not datos_validos:
+            if not (insertados or actualizados or omitidos):
+                # Archivo leído hasta el final (una importación retomada puede no tener nada pendiente)
                 return {
                     'success': False,
+                    'completo': True,
                     'message': 'No se encontraron datos válidos',
                     'errores': errores
                 }
             
-            insertados = 0
-            for dato in datos_validos:
-                resultado = self.db.insertar_medicion(
-                    categoria=categoria,
-                    **dato
-                )
-                if resultado['success']:
-                    insertados += 1
-            
             mensaje = f"✓ {insertados} registros importados"
-            if errores:
-                mensaje += f" ({len(errores)} errores)"
+            detalles = [f'{n} {texto}' for n, texto in
+                        ((actualizados, 'actualizados'), (omitidos, 'omitidos'), (total_errores, 'errores')) if n]
+            if detalles:
+                mensaje += f" ({', '.join(detalles)})"
             
             return {
                 'success': True,
                 'message': mensaje,
                 'insertados': insertados,
+                'actualizados': actualizados,
+                'omitidos': omitidos,
                 'errores': errores[:10]
             }
                 
@@ -102,3 +334,85 @@ class ImportadorDatos:
                 'success': False,
                 'message': f'Error al procesar: {str(e)}'
             }
+
+    def _validar_dataframe(self, df, fila_inicial=2, categoria=None):
+        """Validar y normalizar un DataFrame por columnas; devuelve (filas válidas, números de fila, errores).
+        
+        Con categoria, tipo/punto/parametro se comprueban contra el índice en memoria del catálogo.
+        """
+        fechas = self._convertir_fechas(df['fecha'])
+        datos = self._convertir_datos(df['dato'])
+        if 'tipo' in df.columns:
+            tipos = df['tipo'].astype('string')
+        else:
+            tipos = pd.Series('agua', index=df.index, dtype='string')
+        tipos, puntos, parametros = normalizar_columnas(
+            tipos, df['punto'].astype('string'), df['parametro'].astype('string')
+        )
+        tipos = tipos.fillna('agua')
+        
+        notas = pd.Series(np.full(len(df), None, dtype=object), index=df.index)
+        if 'nota' in df.columns:
+            con_nota = df['nota'].notna().to_numpy()
+            notas[con_nota] = df['nota'][con_nota].astype(str)
+        
+        fecha_ok = fechas.notna().to_numpy()
+        dato_ok = np.isfinite(datos.to_numpy(dtype=float, na_value=np.nan))
+        punto_ok = puntos.fillna('').str.len().to_numpy() > 0
+        parametro_ok = parametros.fillna('').str.len().to_numpy() > 0
+        validas = fecha_ok & dato_ok & punto_ok & parametro_ok
+        catalogo_ok = np.ones(len(df), dtype=bool)
+        if categoria is not None and validas.any():
+            catalogo_ok[validas] = self.db.catalogo.filtro(
+                categoria, tipos[validas].tolist(), puntos[validas].tolist(), parametros[validas].tolist()
+            )
+            validas &= catalogo_ok
+        
+        numeros_fila = np.arange(len(df)) + fila_inicial
+        errores = []
+        for pos in np.flatnonzero(~validas):
+            if not fecha_ok[pos]:
+                valor = df['fecha'].iat[pos]
+                motivo = 'fecha vacía' if pd.isna(valor) else f"fecha inválida '{valor}'"
+            elif not dato_ok[pos]:
+                valor = df['dato'].iat[pos]
+                motivo = 'dato vacío' if pd.isna(valor) else f"dato no numérico '{valor}'"
+            elif not punto_ok[pos]:
+                motivo = 'punto vacío'
+            elif not parametro_ok[pos]:
+                motivo = 'parametro vacío'
+            else:
+                motivo = f'{tipos.iat[pos]} {puntos.iat[pos]} {parametros.iat[pos]} no está en el catálogo'
+            errores.append(f"Fila {numeros_fila[pos]}: {motivo}")
+        
+        datos_validos = list(zip(
+            tipos[validas].astype(object),
+            puntos[validas].astype(object),
+            parametros[validas].astype(object),
+            fechas[validas].dt.date,
+            datos[validas].astype(float),
+            notas[validas]
+        ))
+        return datos_validos, numeros_fila[validas].tolist(), errores
+    
+    @staticmethod
+    def _convertir_fechas(serie):
+        """Convertir una columna a fechas; NaT donde no se pueda interpretar"""
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            return serie
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            # Primero con el formato inferido de la primera fila (rápido), después fila a fila lo que quede
+            fechas = pd.to_datetime(serie, errors='coerce')
+            pendientes = fechas.isna() & serie.notna()
+            if pendientes.any():
+                fechas[pendientes] = pd.to_datetime(serie[pendientes], errors='coerce', format='mixed')
+        return fechas
+    
+    @staticmethod
+    def _convertir_datos(serie):
+        """Convertir una columna a float aceptando coma decimal; NaN si no es numérica"""
+        if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+            return serie.astype(float)
+        texto = serie.astype('string').str.strip().str.replace(',', '.', regex=False)
+        return pd.to_numeric(texto, errors='coerce')
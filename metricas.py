@@ -0,0 +1,289 @@
+"""Métricas Prometheus de la aplicación (/metrics).
+
+Con gunicorn, gunicorn.conf.py define PROMETHEUS_MULTIPROC_DIR antes de arrancar
+los workers: cada proceso escribe sus valores en archivos mmap de esa carpeta y
+/metrics los agrega, de modo que cualquier worker que atienda la petición
+devuelve el total. Sin esa variable (python app.py) se usa el registro del
+propio proceso.
+
+El estado del pool de conexiones se lee al generar /metrics (ColectorPool); en
+multiproceso cada worker lo copia además periódicamente a sus archivos.
+
+Registrar un valor cuesta unos microsegundos (las etiquetas de los métodos
+instrumentados se resuelven una sola vez), así que la instrumentación queda
+siempre activa.
+"""
+import functools
+import inspect
+import os
+import threading
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+CARPETA_MULTIPROCESO = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+if CARPETA_MULTIPROCESO:
+    os.makedirs(CARPETA_MULTIPROCESO, exist_ok=True)
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+DB_SEGUNDOS = Histogram(
+    'pharma_db_operacion_segundos', 'Duración de las operaciones de DatabaseManager', ['operacion'], buckets=BUCKETS
+)
+DB_ERRORES = Counter(
+    'pharma_db_operacion_errores', 'Operaciones de DatabaseManager fallidas (excepción o success=False)', ['operacion']
+)
+DB_FILAS = Counter(
+    'pharma_db_filas', 'Filas devueltas o insertadas por las operaciones de DatabaseManager', ['operacion']
+)
+HTTP_SEGUNDOS = Histogram(
+    'pharma_http_peticion_segundos', 'Duración de las peticiones HTTP por ruta', ['ruta', 'metodo'], buckets=BUCKETS
+)
+HTTP_PETICIONES = Counter(
+    'pharma_http_peticiones', 'Peticiones HTTP por ruta y código de estado', ['ruta', 'metodo', 'estado']
+)
+IMPORTACION_SEGUNDOS = Histogram(
+    'pharma_importacion_etapa_segundos', 'Duración de cada etapa por bloque importado', ['etapa'], buckets=BUCKETS
+)
+IMPORTACION_FILAS = Counter(
+    'pharma_importacion_filas', 'Filas que pasan por cada etapa de la importación', ['etapa']
+)
+AYUDA_POOL_CONEXIONES = 'Conexiones del pool por estado (suma de los workers vivos)'
+AYUDA_POOL_EVENTOS = 'Eventos del pool de conexiones (préstamos, timeouts, reconexiones...)'
+# En multiproceso el pool de cada worker se copia a los archivos mmap; sin él lo lee
+# ColectorPool al generar /metrics, así que estas dos no se registran en REGISTRY
+POOL_CONEXIONES = Gauge(
+    'pharma_db_pool_conexiones', AYUDA_POOL_CONEXIONES, ['estado'], multiprocess_mode='livesum', registry=None
+)
+POOL_EVENTOS = Counter('pharma_db_pool_eventos', AYUDA_POOL_EVENTOS, ['evento'], registry=None)
+
+ESTADOS_POOL = ('abiertas', 'en_uso', 'libres', 'esperando')
+EVENTOS_POOL = ('prestamos', 'creadas', 'descartadas', 'reconexiones', 'timeouts', 'errores_conexion')
+INTERVALO_POOL = float(os.environ.get('METRICAS_POOL_INTERVALO', 15))
+_ultimos_eventos_pool = {}
+_fuente_pool = None
+_hilo_pool_pid = None
+_lock_pool = threading.Lock()
+
+
+def _contar_filas(resultado):
+    """Filas de un resultado {'success', 'data'|'insertados', ...} (None si no aplica)"""
+    if not isinstance(resultado, dict):
+        return None
+    if isinstance(resultado.get('insertados'), int):
+        return resultado['insertados']
+    if isinstance(resultado.get('data'), list):
+        return len(resultado['data'])
+    return None
+
+
+def _iterar_medido(generador, histograma, errores, filas):
+    """Medir un generador completo (streaming): tiempo hasta agotarlo y filas producidas"""
+    inicio = time.perf_counter()
+    total = 0
+    try:
+        for fila in generador:
+            total += 1
+            yield fila
+    except Exception:
+        errores.inc()
+        raise
+    finally:
+        histograma.observe(time.perf_counter() - inicio)
+        filas.inc(total)
+
+
+def medir_operacion(funcion, operacion):
+    """Envolver una función con el histograma, los errores y las filas de la operación"""
+    histograma = DB_SEGUNDOS.labels(operacion)
+    errores = DB_ERRORES.labels(operacion)
+    filas = DB_FILAS.labels(operacion)
+
+    def registrar(resultado, inicio):
+        histograma.observe(time.perf_counter() - inicio)
+        if isinstance(resultado, dict) and resultado.get('success') is False:
+            errores.inc()
+        cantidad = _contar_filas(resultado)
+        if cantidad:
+            filas.inc(cantidad)
+
+    if inspect.iscoroutinefunction(funcion):
+        @functools.wraps(funcion)
+        async def envoltorio_async(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                resultado = await funcion(*args, **kwargs)
+            except Exception:
+                errores.inc()
+                raise
+            registrar(resultado, inicio)
+            return resultado
+        return envoltorio_async
+
+    @functools.wraps(funcion)
+    def envoltorio(*args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            resultado = funcion(*args, **kwargs)
+        except Exception:
+            errores.inc()
+            histograma.observe(time.perf_counter() - inicio)
+            raise
+        if inspect.isgenerator(resultado):
+            return _iterar_medido(resultado, histograma, errores, filas)
+        registrar(resultado, inicio)
+        return resultado
+    return envoltorio
+
+
+def instrumentar(clase, excluir=(), prefijo=''):
+    """Medir todos los métodos públicos de una clase (operacion = prefijo + nombre del método)"""
+    for nombre, valor in list(vars(clase).items()):
+        if nombre.startswith('_') or nombre in excluir:
+            continue
+        if isinstance(valor, staticmethod):
+            setattr(clase, nombre, staticmethod(medir_operacion(valor.__func__, prefijo + nombre)))
+        elif inspect.isfunction(valor):
+            setattr(clase, nombre, medir_operacion(valor, prefijo + nombre))
+    return clase
+
+
+class etapa_importacion:
+    """Context manager que mide una etapa del importador: with etapa_importacion('validar', filas):"""
+
+    def __init__(self, nombre, filas=0):
+        self.histograma = IMPORTACION_SEGUNDOS.labels(nombre)
+        self.contador = IMPORTACION_FILAS.labels(nombre)
+        self.filas = filas
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histograma.observe(time.perf_counter() - self.inicio)
+        if self.filas:
+            self.contador.inc(self.filas)
+        return False
+
+
+def medir_bloques(bloques, etapa='leer'):
+    """Medir la lectura/parseo de cada bloque (DataFrame) de un iterable"""
+    histograma = IMPORTACION_SEGUNDOS.labels(etapa)
+    contador = IMPORTACION_FILAS.labels(etapa)
+    iterador = iter(bloques)
+    while True:
+        inicio = time.perf_counter()
+        try:
+            bloque = next(iterador)
+        except StopIteration:
+            return
+        histograma.observe(time.perf_counter() - inicio)
+        contador.inc(len(bloque))
+        yield bloque
+
+
+def registrar_peticion(ruta, metodo, estado, segundos):
+    HTTP_SEGUNDOS.labels(ruta, metodo).observe(segundos)
+    HTTP_PETICIONES.labels(ruta, metodo, str(estado)).inc()
+
+
+class ColectorPool:
+    """Estado del pool leído en el momento de generar /metrics (modo de un solo proceso)"""
+
+    def collect(self):
+        estadisticas = _estadisticas_pool()
+        conexiones = GaugeMetricFamily('pharma_db_pool_conexiones', AYUDA_POOL_CONEXIONES, labels=['estado'])
+        eventos = CounterMetricFamily('pharma_db_pool_eventos', AYUDA_POOL_EVENTOS, labels=['evento'])
+        if estadisticas:
+            for estado in ESTADOS_POOL:
+                conexiones.add_metric([estado], estadisticas.get(estado, 0))
+            for evento in EVENTOS_POOL:
+                eventos.add_metric([evento], estadisticas.get(evento, 0))
+        yield conexiones
+        yield eventos
+
+
+def _estadisticas_pool():
+    try:
+        return _fuente_pool() if _fuente_pool else None
+    except Exception as e:
+        print(f"Error al leer el estado del pool: {e}")
+        return None
+
+
+if not CARPETA_MULTIPROCESO:
+    REGISTRY.register(ColectorPool())
+
+
+def registrar_pool(estadisticas):
+    """Registrar la función que da el estado del pool de este proceso (DatabaseManager.estadisticas_pool).
+
+    Sin multiproceso ColectorPool la llama en cada lectura de /metrics. En multiproceso
+    cada worker copia su estado a los archivos mmap al atender /metrics, tras cada
+    petición y, desde un hilo, cada INTERVALO_POOL segundos: así los workers ociosos
+    tampoco quedan desfasados.
+    """
+    global _fuente_pool
+    _fuente_pool = estadisticas
+    if CARPETA_MULTIPROCESO:
+        _arrancar_hilo_pool()
+
+
+def _arrancar_hilo_pool():
+    global _hilo_pool_pid
+    with _lock_pool:
+        if _hilo_pool_pid == os.getpid():
+            return
+        _hilo_pool_pid = os.getpid()
+    threading.Thread(target=_bucle_pool, name='metricas-pool', daemon=True).start()
+
+
+def _bucle_pool():
+    pid = os.getpid()
+    while _hilo_pool_pid == pid:
+        actualizar_pool()
+        time.sleep(INTERVALO_POOL)
+
+
+def _tras_fork():
+    # En el hijo solo existe el hilo que bifurcó: el lock pudo quedar tomado y el hilo del pool no existe
+    global _lock_pool
+    _lock_pool = threading.Lock()
+    if _fuente_pool and CARPETA_MULTIPROCESO:
+        _arrancar_hilo_pool()
+
+
+os.register_at_fork(after_in_child=_tras_fork)
+
+
+def actualizar_pool(estadisticas=None):
+    """Copiar el estado del pool de este proceso a los gauges y contadores (modo multiproceso)"""
+    if not CARPETA_MULTIPROCESO:
+        return
+    estadisticas = estadisticas or _estadisticas_pool()
+    if not estadisticas:
+        return
+    with _lock_pool:
+        for estado in ESTADOS_POOL:
+            POOL_CONEXIONES.labels(estado).set(estadisticas.get(estado, 0))
+        # Los contadores del pool son acumulados por proceso: se suma solo la diferencia
+        for evento in EVENTOS_POOL:
+            actual = estadisticas.get(evento, 0)
+            anterior = _ultimos_eventos_pool.get(evento, 0)
+            if actual > anterior:
+                POOL_EVENTOS.labels(evento).inc(actual - anterior)
+            _ultimos_eventos_pool[evento] = actual
+
+
+def exponer():
+    """Texto Prometheus con las métricas (de todos los workers en modo multiproceso)"""
+    if CARPETA_MULTIPROCESO:
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+        return generate_latest(registro)
+    return generate_latest(REGISTRY)
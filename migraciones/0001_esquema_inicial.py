@@ -0,0 +1,402 @@
+"""Esquema base: lo que hacía init_database al arrancar.
+
+Todo es idempotente (IF NOT EXISTS, migración de tablas sin particionar,
+resúmenes solo si no existían), así que sirve tanto para bases nuevas como para
+adoptar bases creadas antes de existir schema_version.
+
+El SQL y las funciones de particionado son copias congeladas de las del código
+de la aplicación cuando se creó la migración: los cambios posteriores van en
+migraciones nuevas y esta se comporta siempre igual.
+"""
+import os
+from datetime import date
+
+# Versiones anteriores de este archivo, con el mismo efecto en las bases que ya las aplicaron
+HUELLAS_ANTERIORES = ('9e3edcc3b75c51a307d0a54fede44579e13c71782013ea7377bef8e9a43869a6',)
+
+CATEGORIAS = ('fisicoquimica', 'microbiologia')
+PARTICIONES_FUTURAS = int(os.environ.get('DB_PARTICIONES_FUTURAS', 1))
+RESTRICCION_TIPO = 'mediciones_fisicoquimica_tipo_check'
+
+INDICES_MEDICIONES = {
+    'punto_parametro_fecha': '(punto, parametro, fecha DESC, timestamp DESC, id DESC) INCLUDE (tipo, dato)',
+    'fecha': '(fecha DESC, timestamp DESC, id DESC)',
+    'tipo': '(tipo)',
+}
+
+SQL_TABLA_PARTICIONADA = '''
+    CREATE TABLE IF NOT EXISTS {tabla} (
+        id {tipo_id},
+        tipo VARCHAR({largo_tipo}) NOT NULL,
+        punto VARCHAR({largo_punto}) NOT NULL,
+        parametro VARCHAR(50) NOT NULL,
+        fecha DATE NOT NULL,
+        dato DECIMAL(10, 4) NOT NULL,
+        nota TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (id, fecha)
+    ) PARTITION BY RANGE (fecha)
+'''
+
+LARGOS = {
+    'fisicoquimica': {'largo_tipo': 20, 'largo_punto': 20},
+    'microbiologia': {'largo_tipo': 50, 'largo_punto': 50},
+}
+
+SQL_RESUMEN_DIARIO = '''
+    CREATE TABLE IF NOT EXISTS resumen_diario_{categoria} (
+        tipo VARCHAR(50) NOT NULL,
+        punto VARCHAR(50) NOT NULL,
+        parametro VARCHAR(50) NOT NULL,
+        fecha DATE NOT NULL,
+        n BIGINT NOT NULL,
+        suma NUMERIC NOT NULL,
+        suma_cuadrados NUMERIC NOT NULL,
+        minimo DECIMAL(10, 4) NOT NULL,
+        maximo DECIMAL(10, 4) NOT NULL,
+        PRIMARY KEY (punto, parametro, fecha, tipo)
+    );
+
+    CREATE OR REPLACE FUNCTION resumen_diario_{categoria}_sumar() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO resumen_diario_{categoria} AS r (tipo, punto, parametro, fecha, n, suma, suma_cuadrados, minimo, maximo)
+        SELECT tipo, punto, parametro, fecha, COUNT(*), SUM(dato), SUM(dato * dato), MIN(dato), MAX(dato)
+        FROM nuevas
+        GROUP BY tipo, punto, parametro, fecha
+        ON CONFLICT (punto, parametro, fecha, tipo) DO UPDATE SET
+            n = r.n + EXCLUDED.n,
+            suma = r.suma + EXCLUDED.suma,
+            suma_cuadrados = r.suma_cuadrados + EXCLUDED.suma_cuadrados,
+            minimo = LEAST(r.minimo, EXCLUDED.minimo),
+            maximo = GREATEST(r.maximo, EXCLUDED.maximo);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION resumen_diario_{categoria}_recalcular() RETURNS trigger AS $$
+    BEGIN
+        CREATE TEMP TABLE IF NOT EXISTS _resumen_afectados (
+            tipo VARCHAR(50), punto VARCHAR(50), parametro VARCHAR(50), fecha DATE
+        ) ON COMMIT DROP;
+        TRUNCATE _resumen_afectados;
+
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            INSERT INTO _resumen_afectados SELECT DISTINCT tipo, punto, parametro, fecha FROM anteriores;
+        END IF;
+        IF TG_OP = 'UPDATE' THEN
+            INSERT INTO _resumen_afectados SELECT DISTINCT tipo, punto, parametro, fecha FROM nuevas;
+        END IF;
+
+        DELETE FROM resumen_diario_{categoria} r
+        USING _resumen_afectados a
+        WHERE r.tipo = a.tipo AND r.punto = a.punto AND r.parametro = a.parametro AND r.fecha = a.fecha;
+
+        INSERT INTO resumen_diario_{categoria} (tipo, punto, parametro, fecha, n, suma, suma_cuadrados, minimo, maximo)
+        SELECT m.tipo, m.punto, m.parametro, m.fecha, COUNT(*), SUM(m.dato), SUM(m.dato * m.dato), MIN(m.dato), MAX(m.dato)
+        FROM mediciones_{categoria} m
+        JOIN (SELECT DISTINCT tipo, punto, parametro, fecha FROM _resumen_afectados) a
+          ON m.tipo = a.tipo AND m.punto = a.punto AND m.parametro = a.parametro AND m.fecha = a.fecha
+        GROUP BY m.tipo, m.punto, m.parametro, m.fecha;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS resumen_diario_insert ON mediciones_{categoria};
+    CREATE TRIGGER resumen_diario_insert
+        AFTER INSERT ON mediciones_{categoria}
+        REFERENCING NEW TABLE AS nuevas
+        FOR EACH STATEMENT EXECUTE FUNCTION resumen_diario_{categoria}_sumar();
+
+    DROP TRIGGER IF EXISTS resumen_diario_delete ON mediciones_{categoria};
+    CREATE TRIGGER resumen_diario_delete
+        AFTER DELETE ON mediciones_{categoria}
+        REFERENCING OLD TABLE AS anteriores
+        FOR EACH STATEMENT EXECUTE FUNCTION resumen_diario_{categoria}_recalcular();
+
+    DROP TRIGGER IF EXISTS resumen_diario_update ON mediciones_{categoria};
+    CREATE TRIGGER resumen_diario_update
+        AFTER UPDATE ON mediciones_{categoria}
+        REFERENCING OLD TABLE AS anteriores NEW TABLE AS nuevas
+        FOR EACH STATEMENT EXECUTE FUNCTION resumen_diario_{categoria}_recalcular();
+'''
+
+SQL_SPC = '''
+    CREATE TABLE IF NOT EXISTS spc_estado (
+        categoria VARCHAR(50) NOT NULL,
+        punto VARCHAR(50) NOT NULL,
+        parametro VARCHAR(50) NOT NULL,
+        n BIGINT NOT NULL DEFAULT 0,
+        media DOUBLE PRECISION NOT NULL DEFAULT 0,
+        m2 DOUBLE PRECISION NOT NULL DEFAULT 0,
+        ewma DOUBLE PRECISION,
+        cusum_pos DOUBLE PRECISION NOT NULL DEFAULT 0,
+        cusum_neg DOUBLE PRECISION NOT NULL DEFAULT 0,
+        ultimos_z DOUBLE PRECISION[] NOT NULL DEFAULT '{}',
+        racha INTEGER NOT NULL DEFAULT 0,
+        ultima_fecha DATE,
+        actualizado TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (categoria, punto, parametro)
+    );
+
+    CREATE TABLE IF NOT EXISTS spc_eventos (
+        id BIGSERIAL PRIMARY KEY,
+        categoria VARCHAR(50) NOT NULL,
+        tipo VARCHAR(50),
+        punto VARCHAR(50) NOT NULL,
+        parametro VARCHAR(50) NOT NULL,
+        medicion_id INTEGER,
+        fecha DATE NOT NULL,
+        dato DOUBLE PRECISION NOT NULL,
+        regla VARCHAR(20) NOT NULL,
+        valor DOUBLE PRECISION,
+        limite DOUBLE PRECISION,
+        creado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_spc_eventos_serie ON spc_eventos(categoria, punto, parametro, id DESC);
+    CREATE INDEX IF NOT EXISTS idx_spc_eventos_id ON spc_eventos(categoria, id DESC);
+
+    CREATE TABLE IF NOT EXISTS limites_especificacion (
+        categoria VARCHAR(50) NOT NULL,
+        punto VARCHAR(50) NOT NULL,
+        parametro VARCHAR(50) NOT NULL,
+        limite_inferior DOUBLE PRECISION,
+        limite_superior DOUBLE PRECISION,
+        actualizado TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (categoria, punto, parametro)
+    );
+'''
+
+
+def aplicar(conn, cur):
+    # Tablas de mediciones particionadas por año de fecha (migra las tablas antiguas)
+    for categoria in CATEGORIAS:
+        _crear_tabla(cur, categoria)
+        anio_actual = date.today().year
+        anios = set(range(anio_actual - 1, anio_actual + PARTICIONES_FUTURAS + 1))
+        anios.update(_anios_en_default(cur, categoria))
+        _asegurar_particiones(cur, categoria, anios)
+
+    # El importador antiguo guardaba tipo tal cual venía del archivo ('Agua', ' vapor', NaN...):
+    # se normaliza como el importador actual para que 0002 pueda añadir la restricción CHECK.
+    # Si aun así quedan valores fuera de ('vapor', 'agua') la restricción se añade aquí NOT
+    # VALID (0002 la encuentra y no la repite): protege las filas nuevas y se valida con
+    # ALTER TABLE ... VALIDATE CONSTRAINT cuando se hayan corregido.
+    _normalizar_tipo(cur)
+
+    # Trabajos de importación en segundo plano
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS importaciones (
+            id UUID PRIMARY KEY,
+            categoria VARCHAR(50) NOT NULL,
+            formato VARCHAR(10) NOT NULL,
+            nombre_archivo TEXT,
+            archivo_oid OID,
+            estado VARCHAR(20) NOT NULL DEFAULT 'en_cola',
+            cancelar BOOLEAN NOT NULL DEFAULT FALSE,
+            filas_procesadas INTEGER NOT NULL DEFAULT 0,
+            insertados INTEGER NOT NULL DEFAULT 0,
+            total_errores INTEGER NOT NULL DEFAULT 0,
+            errores JSONB NOT NULL DEFAULT '[]',
+            mensaje TEXT,
+            intentos INTEGER NOT NULL DEFAULT 0,
+            trabajador TEXT,
+            latido TIMESTAMP,
+            creado TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            iniciado TIMESTAMP,
+            finalizado TIMESTAMP
+        )
+    ''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_importaciones_estado ON importaciones(estado, creado)')
+
+    # Resúmenes diarios para estadísticas sin recorrer las tablas de mediciones
+    pendientes = []
+    for categoria in CATEGORIAS:
+        cur.execute("SELECT to_regclass(%s) IS NULL", (f'resumen_diario_{categoria}',))
+        if cur.fetchone()[0]:
+            pendientes.append(categoria)
+        cur.execute(SQL_RESUMEN_DIARIO.format(categoria=categoria))
+    for categoria in pendientes:
+        cur.execute(f'LOCK TABLE mediciones_{categoria} IN SHARE MODE')
+        cur.execute(f'''
+            INSERT INTO resumen_diario_{categoria} (tipo, punto, parametro, fecha, n, suma, suma_cuadrados, minimo, maximo)
+            SELECT tipo, punto, parametro, fecha, COUNT(*), SUM(dato), SUM(dato * dato), MIN(dato), MAX(dato)
+            FROM mediciones_{categoria}
+            GROUP BY tipo, punto, parametro, fecha
+        ''')
+
+    # Respuestas de /api/guardar/lote por Idempotency-Key (reintentos sin duplicar)
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS claves_idempotencia (
+            clave VARCHAR(255) PRIMARY KEY,
+            huella CHAR(64) NOT NULL,
+            respuesta JSONB NOT NULL,
+            creado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Estado y eventos del control estadístico de procesos. El estado de las series con
+    # histórico lo reconstruye DatabaseManager.migrar al terminar (es un dato derivado).
+    cur.execute(SQL_SPC)
+
+
+def _normalizar_tipo(cur):
+    """Normalizar tipo en mediciones_fisicoquimica antes de la restricción CHECK de 0002"""
+    cur.execute('''
+        SELECT 1 FROM pg_constraint
+        WHERE conrelid = 'mediciones_fisicoquimica'::regclass AND conname = %s
+    ''', (RESTRICCION_TIPO,))
+    if cur.fetchone() is not None:
+        return
+
+    cur.execute('''
+        UPDATE mediciones_fisicoquimica
+        SET tipo = CASE
+            WHEN tipo IS NULL OR lower(trim(tipo)) IN ('', 'nan', 'none') THEN 'agua'
+            ELSE lower(trim(tipo))
+        END
+        WHERE tipo IS NULL OR tipo NOT IN ('vapor', 'agua')
+    ''')
+    if cur.rowcount:
+        print(f'  tipo normalizado en {cur.rowcount} filas de mediciones_fisicoquimica')
+
+    cur.execute("SELECT tipo, COUNT(*) FROM mediciones_fisicoquimica WHERE tipo NOT IN ('vapor', 'agua') GROUP BY tipo")
+    invalidas = cur.fetchall()
+    if invalidas:
+        cur.execute(f'''
+            ALTER TABLE mediciones_fisicoquimica
+                ADD CONSTRAINT {RESTRICCION_TIPO} CHECK (tipo IN ('vapor', 'agua')) NOT VALID
+        ''')
+        detalle = ', '.join(f'{tipo!r}: {n}' for tipo, n in invalidas)
+        print(
+            f'  ⚠ {RESTRICCION_TIPO} añadida NOT VALID: quedan filas con tipo no válido ({detalle}); '
+            f'corríjalas y ejecute ALTER TABLE mediciones_fisicoquimica VALIDATE CONSTRAINT {RESTRICCION_TIPO}'
+        )
+
+
+def _tipo_tabla(cur, tabla):
+    """'p' si la tabla está particionada, 'r' si es una tabla normal, None si no existe"""
+    cur.execute('SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)', (tabla,))
+    fila = cur.fetchone()
+    return fila[0] if fila else None
+
+
+def _crear_tabla(cur, categoria):
+    """Crear (o migrar desde una tabla sin particionar) la tabla de mediciones de una categoría"""
+    tabla = f'mediciones_{categoria}'
+    actual = _tipo_tabla(cur, tabla)
+
+    if actual == 'r':
+        _migrar_tabla(cur, categoria)
+    elif actual is None:
+        cur.execute(SQL_TABLA_PARTICIONADA.format(tabla=tabla, tipo_id='SERIAL', **LARGOS[categoria]))
+
+    cur.execute(f'CREATE TABLE IF NOT EXISTS {tabla}_default PARTITION OF {tabla} DEFAULT')
+    for nombre, columnas in INDICES_MEDICIONES.items():
+        _crear_indice(cur, f'idx_{categoria}_{nombre}', tabla, columnas)
+
+
+def _crear_indice(cur, indice, tabla, columnas):
+    """Crear un índice; si existe con otra definición (guardada como comentario) se reconstruye"""
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL, obj_description(to_regclass(%s), 'pg_class')", (indice, indice))
+    existe, definicion = cur.fetchone()
+    if existe and definicion == columnas:
+        return False
+    if existe:
+        print(f"Reconstruyendo índice {indice}...")
+        cur.execute(f'DROP INDEX {indice}')
+    cur.execute(f'CREATE INDEX {indice} ON {tabla} {columnas}')
+    cur.execute(f'COMMENT ON INDEX {indice} IS %s', (columnas,))
+    return True
+
+
+def _migrar_tabla(cur, categoria):
+    """Convertir una tabla sin particionar en particionada conservando datos, ids y secuencia"""
+    tabla = f'mediciones_{categoria}'
+    antigua = f'{tabla}_sin_particionar'
+    print(f"Migrando {tabla} a tabla particionada por fecha...")
+
+    cur.execute(f'LOCK TABLE {tabla} IN ACCESS EXCLUSIVE MODE')
+    cur.execute("SELECT pg_get_serial_sequence(%s, 'id')", (tabla,))
+    secuencia = cur.fetchone()[0]
+
+    cur.execute(f'ALTER TABLE {tabla} RENAME TO {antigua}')
+    # Los triggers de resúmenes se van con la tabla antigua: la copia no vuelve a sumar
+    cur.execute(SQL_TABLA_PARTICIONADA.format(
+        tabla=tabla,
+        tipo_id=f"INTEGER NOT NULL DEFAULT nextval('{secuencia}')",
+        **LARGOS[categoria]
+    ))
+    cur.execute(f'CREATE TABLE {tabla}_default PARTITION OF {tabla} DEFAULT')
+
+    cur.execute(f'SELECT EXTRACT(YEAR FROM MIN(fecha))::int, EXTRACT(YEAR FROM MAX(fecha))::int FROM {antigua}')
+    desde, hasta = cur.fetchone()
+    if desde is not None:
+        for anio in range(desde, hasta + 1):
+            _crear_particion(cur, categoria, anio)
+
+    cur.execute(f'''
+        INSERT INTO {tabla} (id, tipo, punto, parametro, fecha, dato, nota, timestamp)
+        SELECT id, tipo, punto, parametro, fecha, dato, nota, timestamp FROM {antigua}
+    ''')
+    copiadas = cur.rowcount
+    cur.execute(f'ALTER SEQUENCE {secuencia} OWNED BY {tabla}.id')
+    cur.execute(f'DROP TABLE {antigua}')
+    cur.execute(f'ANALYZE {tabla}')
+    print(f"✓ {tabla} migrada ({copiadas} filas)")
+
+
+def _particiones_existentes(cur, categoria):
+    """Años que ya tienen partición propia"""
+    cur.execute('''
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+    ''', (f'mediciones_{categoria}',))
+    prefijo = f'mediciones_{categoria}_'
+    anios = set()
+    for (nombre,) in cur.fetchall():
+        sufijo = nombre[len(prefijo):]
+        if sufijo.isdigit():
+            anios.add(int(sufijo))
+    return anios
+
+
+def _crear_particion(cur, categoria, anio):
+    """Crear la partición de un año moviendo antes las filas que estuvieran en DEFAULT"""
+    tabla = f'mediciones_{categoria}'
+    particion = f'{tabla}_{anio}'
+    if _tipo_tabla(cur, particion) is not None:
+        return False
+
+    desde = date(anio, 1, 1)
+    hasta = date(anio + 1, 1, 1)
+    cur.execute(f'CREATE TABLE {particion} (LIKE {tabla} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    # Mover las filas directamente entre particiones no dispara los triggers de la tabla padre
+    cur.execute(f'''
+        WITH movidas AS (
+            DELETE FROM {tabla}_default WHERE fecha >= %s AND fecha < %s RETURNING *
+        )
+        INSERT INTO {particion} SELECT * FROM movidas
+    ''', (desde, hasta))
+    cur.execute(f'''
+        ALTER TABLE {tabla} ATTACH PARTITION {particion}
+        FOR VALUES FROM (%s) TO (%s)
+    ''', (desde, hasta))
+    return True
+
+
+def _asegurar_particiones(cur, categoria, anios):
+    """Crear las particiones de los años indicados que falten; devuelve los años creados"""
+    existentes = _particiones_existentes(cur, categoria)
+    creadas = []
+    for anio in sorted(set(anios) - existentes):
+        if _crear_particion(cur, categoria, anio):
+            creadas.append(anio)
+    return creadas
+
+
+def _anios_en_default(cur, categoria):
+    """Años con filas en la partición DEFAULT (candidatos a tener partición propia)"""
+    cur.execute(f'SELECT DISTINCT EXTRACT(YEAR FROM fecha)::int FROM mediciones_{categoria}_default')
+    return [fila[0] for fila in cur.fetchall()]
@@ -0,0 +1,24 @@
+-- Alinear el esquema con templates_sql/create_tables.sql.
+-- init_database nunca creó la restricción CHECK sobre tipo (y la migración a tablas
+-- particionadas la perdió en las bases creadas con el script), y las bases creadas
+-- con el script antiguo conservan índices de una sola columna que ya cubren los
+-- índices compuestos idx_<categoria>_*.
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint
+        WHERE conrelid = 'mediciones_fisicoquimica'::regclass
+          AND conname = 'mediciones_fisicoquimica_tipo_check'
+    ) THEN
+        ALTER TABLE mediciones_fisicoquimica
+            ADD CONSTRAINT mediciones_fisicoquimica_tipo_check CHECK (tipo IN ('vapor', 'agua'));
+    END IF;
+END $$;
+
+DROP INDEX IF EXISTS idx_fisico_fecha;
+DROP INDEX IF EXISTS idx_fisico_punto;
+DROP INDEX IF EXISTS idx_fisico_parametro;
+DROP INDEX IF EXISTS idx_fisico_tipo;
+DROP INDEX IF EXISTS idx_micro_fecha;
+DROP INDEX IF EXISTS idx_micro_tipo;
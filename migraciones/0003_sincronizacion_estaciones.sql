@@ -0,0 +1,9 @@
+-- Marca de agua por estación embebida (SQLite) y categoría: último id local recibido.
+-- recibir_sincronizacion la actualiza en la misma transacción que inserta las mediciones.
+CREATE TABLE IF NOT EXISTS sincronizacion_estaciones (
+    estacion VARCHAR(100) NOT NULL,
+    categoria VARCHAR(50) NOT NULL,
+    ultimo_id BIGINT NOT NULL DEFAULT 0,
+    actualizado TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (estacion, categoria)
+);
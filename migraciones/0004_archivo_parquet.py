@@ -0,0 +1,120 @@
+"""Archivo histórico en Parquet: manifiesto de archivos y triggers de resumen que
+no descuentan las filas borradas al archivar (pharma.archivando = 'on').
+
+El SQL es una copia congelada del de archivo.py y database.py cuando se creó la
+migración."""
+
+# Versiones anteriores de este archivo, con el mismo efecto en las bases que ya las aplicaron
+HUELLAS_ANTERIORES = ('e7f59b0e09caafb4c0344aa796b2a6f1be6e6e5667255aca42b89cb948516f4c',)
+
+CATEGORIAS = ('fisicoquimica', 'microbiologia')
+
+SQL_MANIFIESTO = '''
+    CREATE TABLE IF NOT EXISTS archivo_manifiesto (
+        id SERIAL PRIMARY KEY,
+        categoria VARCHAR(50) NOT NULL,
+        tipo VARCHAR(50) NOT NULL,
+        punto VARCHAR(50) NOT NULL,
+        anio INTEGER NOT NULL,
+        ruta TEXT NOT NULL UNIQUE,
+        filas INTEGER NOT NULL,
+        fecha_min DATE NOT NULL,
+        fecha_max DATE NOT NULL,
+        bytes BIGINT NOT NULL,
+        creado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_archivo_manifiesto_categoria_fecha
+        ON archivo_manifiesto (categoria, fecha_max, fecha_min);
+'''
+
+# Resumen diario por (tipo, punto, parametro, fecha), mantenido con triggers de sentencia.
+# Las altas suman sobre el resumen; bajas y modificaciones recalculan solo los días afectados
+# (salvo los borrados del archivado, que siguen contando).
+SQL_RESUMEN_DIARIO = '''
+    CREATE TABLE IF NOT EXISTS resumen_diario_{categoria} (
+        tipo VARCHAR(50) NOT NULL,
+        punto VARCHAR(50) NOT NULL,
+        parametro VARCHAR(50) NOT NULL,
+        fecha DATE NOT NULL,
+        n BIGINT NOT NULL,
+        suma NUMERIC NOT NULL,
+        suma_cuadrados NUMERIC NOT NULL,
+        minimo DECIMAL(10, 4) NOT NULL,
+        maximo DECIMAL(10, 4) NOT NULL,
+        PRIMARY KEY (punto, parametro, fecha, tipo)
+    );
+
+    CREATE OR REPLACE FUNCTION resumen_diario_{categoria}_sumar() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO resumen_diario_{categoria} AS r (tipo, punto, parametro, fecha, n, suma, suma_cuadrados, minimo, maximo)
+        SELECT tipo, punto, parametro, fecha, COUNT(*), SUM(dato), SUM(dato * dato), MIN(dato), MAX(dato)
+        FROM nuevas
+        GROUP BY tipo, punto, parametro, fecha
+        ON CONFLICT (punto, parametro, fecha, tipo) DO UPDATE SET
+            n = r.n + EXCLUDED.n,
+            suma = r.suma + EXCLUDED.suma,
+            suma_cuadrados = r.suma_cuadrados + EXCLUDED.suma_cuadrados,
+            minimo = LEAST(r.minimo, EXCLUDED.minimo),
+            maximo = GREATEST(r.maximo, EXCLUDED.maximo);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION resumen_diario_{categoria}_recalcular() RETURNS trigger AS $$
+    BEGIN
+        -- archivo.archivar borra filas que pasan a Parquet: siguen contando en el resumen
+        IF current_setting('pharma.archivando', true) = 'on' THEN
+            RETURN NULL;
+        END IF;
+
+        CREATE TEMP TABLE IF NOT EXISTS _resumen_afectados (
+            tipo VARCHAR(50), punto VARCHAR(50), parametro VARCHAR(50), fecha DATE
+        ) ON COMMIT DROP;
+        TRUNCATE _resumen_afectados;
+
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            INSERT INTO _resumen_afectados SELECT DISTINCT tipo, punto, parametro, fecha FROM anteriores;
+        END IF;
+        IF TG_OP = 'UPDATE' THEN
+            INSERT INTO _resumen_afectados SELECT DISTINCT tipo, punto, parametro, fecha FROM nuevas;
+        END IF;
+
+        DELETE FROM resumen_diario_{categoria} r
+        USING _resumen_afectados a
+        WHERE r.tipo = a.tipo AND r.punto = a.punto AND r.parametro = a.parametro AND r.fecha = a.fecha;
+
+        INSERT INTO resumen_diario_{categoria} (tipo, punto, parametro, fecha, n, suma, suma_cuadrados, minimo, maximo)
+        SELECT m.tipo, m.punto, m.parametro, m.fecha, COUNT(*), SUM(m.dato), SUM(m.dato * m.dato), MIN(m.dato), MAX(m.dato)
+        FROM mediciones_{categoria} m
+        JOIN (SELECT DISTINCT tipo, punto, parametro, fecha FROM _resumen_afectados) a
+          ON m.tipo = a.tipo AND m.punto = a.punto AND m.parametro = a.parametro AND m.fecha = a.fecha
+        GROUP BY m.tipo, m.punto, m.parametro, m.fecha;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS resumen_diario_insert ON mediciones_{categoria};
+    CREATE TRIGGER resumen_diario_insert
+        AFTER INSERT ON mediciones_{categoria}
+        REFERENCING NEW TABLE AS nuevas
+        FOR EACH STATEMENT EXECUTE FUNCTION resumen_diario_{categoria}_sumar();
+
+    DROP TRIGGER IF EXISTS resumen_diario_delete ON mediciones_{categoria};
+    CREATE TRIGGER resumen_diario_delete
+        AFTER DELETE ON mediciones_{categoria}
+        REFERENCING OLD TABLE AS anteriores
+        FOR EACH STATEMENT EXECUTE FUNCTION resumen_diario_{categoria}_recalcular();
+
+    DROP TRIGGER IF EXISTS resumen_diario_update ON mediciones_{categoria};
+    CREATE TRIGGER resumen_diario_update
+        AFTER UPDATE ON mediciones_{categoria}
+        REFERENCING OLD TABLE AS anteriores NEW TABLE AS nuevas
+        FOR EACH STATEMENT EXECUTE FUNCTION resumen_diario_{categoria}_recalcular();
+'''
+
+
+def aplicar(conn, cur):
+    cur.execute(SQL_MANIFIESTO)
+    # Recrea las funciones y triggers de los resúmenes (la tabla ya existe)
+    for categoria in CATEGORIAS:
+        cur.execute(SQL_RESUMEN_DIARIO.format(categoria=categoria))
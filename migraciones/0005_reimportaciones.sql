@@ -0,0 +1,20 @@
+-- Importaciones repetidas. archivos_importados guarda la huella SHA-256 de cada archivo
+-- importado con éxito: el mismo contenido subido otra vez no se vuelve a procesar
+-- (salvo en modo 'duplicar'). Cada trabajo guarda su modo (omitir, sobrescribir o
+-- duplicar las filas cuya clave tipo, punto, parametro, fecha ya existe) y cuántas
+-- filas sustituyó u omitió.
+CREATE TABLE IF NOT EXISTS archivos_importados (
+    categoria VARCHAR(50) NOT NULL,
+    huella CHAR(64) NOT NULL,
+    nombre_archivo TEXT,
+    importacion UUID,
+    filas INTEGER NOT NULL DEFAULT 0,
+    creado TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (categoria, huella)
+);
+
+ALTER TABLE importaciones
+    ADD COLUMN IF NOT EXISTS modo VARCHAR(20) NOT NULL DEFAULT 'omitir',
+    ADD COLUMN IF NOT EXISTS huella CHAR(64),
+    ADD COLUMN IF NOT EXISTS actualizados INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS omitidos INTEGER NOT NULL DEFAULT 0;
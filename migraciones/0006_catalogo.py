@@ -0,0 +1,80 @@
+"""Catálogo de puntos de muestreo y parámetros, con la estructura que tenía el dashboard.
+
+El SQL y la estructura inicial son copias congeladas de las de catalogo.py cuando
+se creó la migración."""
+
+# Versiones anteriores de este archivo, con el mismo efecto en las bases que ya las aplicaron
+HUELLAS_ANTERIORES = ('e5f3f404130139a0c7ef7edd4c6d997631520d48b9ccdc5450dfa3af3531b95a',)
+
+# Estructura inicial, la que tenía el dashboard: categoría -> tipo -> punto -> parámetros
+CATALOGO_INICIAL = {
+    'fisicoquimica': {
+        'vapor': {
+            'PMV001': ['PH', 'CONDUCTIVIDAD', 'CLORO', 'DUREZA', 'COLOR', 'TURBIDEZ', 'HIERRO', 'SOLIDOS', 'SULFATOS'],
+            'PMV002': ['PH', 'CONDUCTIVIDAD', 'CLORO', 'DUREZA', 'COLOR', 'TURBIDEZ', 'HIERRO', 'SOLIDOS', 'SULFATOS'],
+            'PMV003': ['DUREZA', 'HIERRO', 'SULFATOS'],
+            'PMV004': ['CONDUCTIVIDAD', 'CLORO'],
+            'PMV005': ['PH', 'CONDUCTIVIDAD'],
+            'PMV006': ['PH', 'CONDUCTIVIDAD'],
+            'PMV007': ['CONDUCTIVIDAD', 'TOC'],
+            'PMV008': ['CONDUCTIVIDAD', 'TOC'],
+        },
+        'agua': {
+            'PA001': ['TOC', 'PH', 'CONDUCTIVIDAD'],
+            'PA002': ['PH', 'CONDUCTIVIDAD', 'TOC'],
+            'PA003': ['CONDUCTIVIDAD', 'PH', 'TOC'],
+            'PA004': ['COLOR', 'TURBIDEZ', 'TOC', 'PH', 'CONDUCTIVIDAD'],
+            'PA005': ['DUREZA', 'HIERRO', 'SULFATOS', 'TOC', 'PH', 'CONDUCTIVIDAD'],
+            'PA006': ['PH', 'CONDUCTIVIDAD', 'CLORO', 'DUREZA', 'COLOR', 'TURBIDEZ', 'HIERRO', 'SOLIDOS TOTALES',
+                      'SULFATOS', 'TOC'],
+            'PA007': ['PH', 'CONDUCTIVIDAD', 'TOC'],
+            'PA008': ['PH', 'CONDUCTIVIDAD', 'CLORO', 'TOC'],
+            'PA009': ['PH', 'CONDUCTIVIDAD', 'TOC'],
+            'PA010': ['PH', 'CONDUCTIVIDAD', 'TOC'],
+            'PA011': ['PH', 'CONDUCTIVIDAD', 'TOC'],
+            'PA012': ['TOC', 'PH', 'CONDUCTIVIDAD'],
+            'PA013': ['PH', 'CONDUCTIVIDAD', 'TOC'],
+            'PA014': ['PH', 'CONDUCTIVIDAD', 'TOC'],
+            'PA015': ['PH', 'CONDUCTIVIDAD', 'TOC'],
+            'PA016': ['PH', 'CONDUCTIVIDAD', 'TOC'],
+            'PA017': ['PH', 'CONDUCTIVIDAD', 'TOC'],
+            'PA018': ['PH', 'CONDUCTIVIDAD', 'TOC'],
+        },
+    },
+}
+
+# Válido en Postgres y en SQLite
+SQL_CATALOGO = (
+    '''
+    CREATE TABLE IF NOT EXISTS catalogo (
+        categoria VARCHAR(50) NOT NULL,
+        tipo VARCHAR(50) NOT NULL,
+        punto VARCHAR(50) NOT NULL,
+        parametro VARCHAR(50) NOT NULL,
+        orden INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (categoria, tipo, punto, parametro)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS catalogo_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version BIGINT NOT NULL
+    )
+    ''',
+    'INSERT INTO catalogo_version (id, version) VALUES (1, 1) ON CONFLICT (id) DO NOTHING',
+)
+
+
+def aplicar(conn, cur):
+    for sentencia in SQL_CATALOGO:
+        cur.execute(sentencia)
+    cur.executemany('''
+        INSERT INTO catalogo (categoria, tipo, punto, parametro, orden) VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (categoria, tipo, punto, parametro) DO NOTHING
+    ''', [
+        (categoria, tipo, punto, parametro, orden)
+        for categoria, tipos in CATALOGO_INICIAL.items()
+        for tipo, puntos in tipos.items()
+        for punto, parametros in puntos.items()
+        for orden, parametro in enumerate(parametros)
+    ])
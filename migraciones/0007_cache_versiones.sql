@@ -0,0 +1,7 @@
+-- Versiones de la caché de resultados (cache.VersionesBaseDatos). Cada escritura en
+-- mediciones_<categoria> incrementa la versión de la tabla, así que las entradas
+-- cacheadas por cualquier worker o proceso dejan de servirse.
+CREATE TABLE IF NOT EXISTS cache_versiones (
+    tabla VARCHAR(63) PRIMARY KEY,
+    version BIGINT NOT NULL
+);
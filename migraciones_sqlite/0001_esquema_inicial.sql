@@ -0,0 +1,150 @@
+-- Esquema de la base embebida (SQLite): mismas tablas, columnas e índices que en
+-- Postgres, sin particiones. SQLite no tiene INCLUDE, así que tipo y dato van al
+-- final del índice compuesto para poder leer las series solo del índice.
+-- Los resúmenes diarios se mantienen con triggers por fila.
+
+CREATE TABLE IF NOT EXISTS mediciones_fisicoquimica (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tipo VARCHAR(20) NOT NULL CHECK (tipo IN ('vapor', 'agua')),
+    punto VARCHAR(20) NOT NULL,
+    parametro VARCHAR(50) NOT NULL,
+    fecha DATE NOT NULL,
+    dato DECIMAL(10, 4) NOT NULL,
+    nota TEXT,
+    timestamp TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+);
+
+CREATE TABLE IF NOT EXISTS mediciones_microbiologia (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tipo VARCHAR(50) NOT NULL,
+    punto VARCHAR(50) NOT NULL,
+    parametro VARCHAR(50) NOT NULL,
+    fecha DATE NOT NULL,
+    dato DECIMAL(10, 4) NOT NULL,
+    nota TEXT,
+    timestamp TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+);
+
+CREATE INDEX IF NOT EXISTS idx_fisicoquimica_punto_parametro_fecha
+    ON mediciones_fisicoquimica(punto, parametro, fecha DESC, timestamp DESC, id DESC, tipo, dato);
+CREATE INDEX IF NOT EXISTS idx_fisicoquimica_fecha ON mediciones_fisicoquimica(fecha DESC, timestamp DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_fisicoquimica_tipo ON mediciones_fisicoquimica(tipo);
+
+CREATE INDEX IF NOT EXISTS idx_microbiologia_punto_parametro_fecha
+    ON mediciones_microbiologia(punto, parametro, fecha DESC, timestamp DESC, id DESC, tipo, dato);
+CREATE INDEX IF NOT EXISTS idx_microbiologia_fecha ON mediciones_microbiologia(fecha DESC, timestamp DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_microbiologia_tipo ON mediciones_microbiologia(tipo);
+
+CREATE TABLE IF NOT EXISTS resumen_diario_fisicoquimica (
+    tipo VARCHAR(50) NOT NULL,
+    punto VARCHAR(50) NOT NULL,
+    parametro VARCHAR(50) NOT NULL,
+    fecha DATE NOT NULL,
+    n BIGINT NOT NULL,
+    suma NUMERIC NOT NULL,
+    suma_cuadrados NUMERIC NOT NULL,
+    minimo DECIMAL(10, 4) NOT NULL,
+    maximo DECIMAL(10, 4) NOT NULL,
+    PRIMARY KEY (punto, parametro, fecha, tipo)
+);
+
+CREATE TABLE IF NOT EXISTS resumen_diario_microbiologia (
+    tipo VARCHAR(50) NOT NULL,
+    punto VARCHAR(50) NOT NULL,
+    parametro VARCHAR(50) NOT NULL,
+    fecha DATE NOT NULL,
+    n BIGINT NOT NULL,
+    suma NUMERIC NOT NULL,
+    suma_cuadrados NUMERIC NOT NULL,
+    minimo DECIMAL(10, 4) NOT NULL,
+    maximo DECIMAL(10, 4) NOT NULL,
+    PRIMARY KEY (punto, parametro, fecha, tipo)
+);
+
+CREATE TRIGGER IF NOT EXISTS resumen_diario_fisicoquimica_insert AFTER INSERT ON mediciones_fisicoquimica
+BEGIN
+    INSERT INTO resumen_diario_fisicoquimica (tipo, punto, parametro, fecha, n, suma, suma_cuadrados, minimo, maximo)
+    VALUES (NEW.tipo, NEW.punto, NEW.parametro, NEW.fecha, 1, NEW.dato, NEW.dato * NEW.dato, NEW.dato, NEW.dato)
+    ON CONFLICT (punto, parametro, fecha, tipo) DO UPDATE SET
+        n = n + 1,
+        suma = suma + excluded.suma,
+        suma_cuadrados = suma_cuadrados + excluded.suma_cuadrados,
+        minimo = MIN(minimo, excluded.minimo),
+        maximo = MAX(maximo, excluded.maximo);
+END;
+
+CREATE TRIGGER IF NOT EXISTS resumen_diario_microbiologia_insert AFTER INSERT ON mediciones_microbiologia
+BEGIN
+    INSERT INTO resumen_diario_microbiologia (tipo, punto, parametro, fecha, n, suma, suma_cuadrados, minimo, maximo)
+    VALUES (NEW.tipo, NEW.punto, NEW.parametro, NEW.fecha, 1, NEW.dato, NEW.dato * NEW.dato, NEW.dato, NEW.dato)
+    ON CONFLICT (punto, parametro, fecha, tipo) DO UPDATE SET
+        n = n + 1,
+        suma = suma + excluded.suma,
+        suma_cuadrados = suma_cuadrados + excluded.suma_cuadrados,
+        minimo = MIN(minimo, excluded.minimo),
+        maximo = MAX(maximo, excluded.maximo);
+END;
+
+-- Bajas y modificaciones: recalcular solo el día afectado
+CREATE TRIGGER IF NOT EXISTS resumen_diario_fisicoquimica_delete AFTER DELETE ON mediciones_fisicoquimica
+BEGIN
+    DELETE FROM resumen_diario_fisicoquimica
+    WHERE tipo = OLD.tipo AND punto = OLD.punto AND parametro = OLD.parametro AND fecha = OLD.fecha;
+    INSERT INTO resumen_diario_fisicoquimica (tipo, punto, parametro, fecha, n, suma, suma_cuadrados, minimo, maximo)
+    SELECT tipo, punto, parametro, fecha, COUNT(*), SUM(dato), SUM(dato * dato), MIN(dato), MAX(dato)
+    FROM mediciones_fisicoquimica
+    WHERE tipo = OLD.tipo AND punto = OLD.punto AND parametro = OLD.parametro AND fecha = OLD.fecha
+    GROUP BY tipo, punto, parametro, fecha;
+END;
+
+CREATE TRIGGER IF NOT EXISTS resumen_diario_microbiologia_delete AFTER DELETE ON mediciones_microbiologia
+BEGIN
+    DELETE FROM resumen_diario_microbiologia
+    WHERE tipo = OLD.tipo AND punto = OLD.punto AND parametro = OLD.parametro AND fecha = OLD.fecha;
+    INSERT INTO resumen_diario_microbiologia (tipo, punto, parametro, fecha, n, suma, suma_cuadrados, minimo, maximo)
+    SELECT tipo, punto, parametro, fecha, COUNT(*), SUM(dato), SUM(dato * dato), MIN(dato), MAX(dato)
+    FROM mediciones_microbiologia
+    WHERE tipo = OLD.tipo AND punto = OLD.punto AND parametro = OLD.parametro AND fecha = OLD.fecha
+    GROUP BY tipo, punto, parametro, fecha;
+END;
+
+CREATE TRIGGER IF NOT EXISTS resumen_diario_fisicoquimica_update AFTER UPDATE ON mediciones_fisicoquimica
+BEGIN
+    DELETE FROM resumen_diario_fisicoquimica
+    WHERE (tipo = OLD.tipo AND punto = OLD.punto AND parametro = OLD.parametro AND fecha = OLD.fecha)
+       OR (tipo = NEW.tipo AND punto = NEW.punto AND parametro = NEW.parametro AND fecha = NEW.fecha);
+    INSERT INTO resumen_diario_fisicoquimica (tipo, punto, parametro, fecha, n, suma, suma_cuadrados, minimo, maximo)
+    SELECT tipo, punto, parametro, fecha, COUNT(*), SUM(dato), SUM(dato * dato), MIN(dato), MAX(dato)
+    FROM mediciones_fisicoquimica
+    WHERE (tipo = OLD.tipo AND punto = OLD.punto AND parametro = OLD.parametro AND fecha = OLD.fecha)
+       OR (tipo = NEW.tipo AND punto = NEW.punto AND parametro = NEW.parametro AND fecha = NEW.fecha)
+    GROUP BY tipo, punto, parametro, fecha;
+END;
+
+CREATE TRIGGER IF NOT EXISTS resumen_diario_microbiologia_update AFTER UPDATE ON mediciones_microbiologia
+BEGIN
+    DELETE FROM resumen_diario_microbiologia
+    WHERE (tipo = OLD.tipo AND punto = OLD.punto AND parametro = OLD.parametro AND fecha = OLD.fecha)
+       OR (tipo = NEW.tipo AND punto = NEW.punto AND parametro = NEW.parametro AND fecha = NEW.fecha);
+    INSERT INTO resumen_diario_microbiologia (tipo, punto, parametro, fecha, n, suma, suma_cuadrados, minimo, maximo)
+    SELECT tipo, punto, parametro, fecha, COUNT(*), SUM(dato), SUM(dato * dato), MIN(dato), MAX(dato)
+    FROM mediciones_microbiologia
+    WHERE (tipo = OLD.tipo AND punto = OLD.punto AND parametro = OLD.parametro AND fecha = OLD.fecha)
+       OR (tipo = NEW.tipo AND punto = NEW.punto AND parametro = NEW.parametro AND fecha = NEW.fecha)
+    GROUP BY tipo, punto, parametro, fecha;
+END;
+
+-- Respuestas de /api/guardar/lote por Idempotency-Key
+CREATE TABLE IF NOT EXISTS claves_idempotencia (
+    clave VARCHAR(255) PRIMARY KEY,
+    huella CHAR(64) NOT NULL,
+    respuesta TEXT NOT NULL,
+    creado TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+);
+
+-- Último id local enviado al servidor central por categoría (DatabaseManagerSqlite.sincronizar)
+CREATE TABLE IF NOT EXISTS sincronizacion (
+    categoria VARCHAR(50) PRIMARY KEY,
+    ultimo_id INTEGER NOT NULL DEFAULT 0,
+    actualizado TIMESTAMP
+);
@@ -0,0 +1,10 @@
+-- Huella SHA-256 de los archivos importados con éxito (ver migraciones/0005_reimportaciones.sql)
+CREATE TABLE IF NOT EXISTS archivos_importados (
+    categoria VARCHAR(50) NOT NULL,
+    huella CHAR(64) NOT NULL,
+    nombre_archivo TEXT,
+    importacion VARCHAR(36),
+    filas INTEGER NOT NULL DEFAULT 0,
+    creado TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+    PRIMARY KEY (categoria, huella)
+);
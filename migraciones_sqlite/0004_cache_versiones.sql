@@ -0,0 +1,5 @@
+-- Versiones de la caché de resultados (ver migraciones/0007_cache_versiones.sql)
+CREATE TABLE IF NOT EXISTS cache_versiones (
+    tabla VARCHAR(63) PRIMARY KEY,
+    version BIGINT NOT NULL
+);
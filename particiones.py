@@ -0,0 +1,168 @@
+"""Particionado por rango de fecha (anual) de las tablas de mediciones.
+
+Cada tabla mediciones_<categoria> es una tabla particionada por `fecha` con una
+partición por año (mediciones_<categoria>_<año>) y una partición DEFAULT que
+recoge las fechas de años sin partición. Todas las funciones reciben un cursor y
+no confirman la transacción: lo hace quien las llama.
+"""
+from datetime import date
+
+# Clave del advisory lock que serializa la creación de particiones entre procesos
+LLAVE_PARTICIONES = 7_310_251_010
+
+# Índices compuestos que siguen el patrón de obtener_mediciones:
+# filtro por punto+parametro+rango de fechas y orden fecha DESC, timestamp DESC, id DESC.
+# El primero incluye tipo y dato para que las series se lean con index-only scan.
+INDICES_MEDICIONES = {
+    'punto_parametro_fecha': '(punto, parametro, fecha DESC, timestamp DESC, id DESC) INCLUDE (tipo, dato)',
+    'fecha': '(fecha DESC, timestamp DESC, id DESC)',
+    'tipo': '(tipo)',
+}
+
+SQL_TABLA_PARTICIONADA = '''
+    CREATE TABLE IF NOT EXISTS {tabla} (
+        id {tipo_id},
+        tipo VARCHAR({largo_tipo}) NOT NULL,
+        punto VARCHAR({largo_punto}) NOT NULL,
+        parametro VARCHAR(50) NOT NULL,
+        fecha DATE NOT NULL,
+        dato DECIMAL(10, 4) NOT NULL,
+        nota TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (id, fecha)
+    ) PARTITION BY RANGE (fecha)
+'''
+
+LARGOS = {
+    'fisicoquimica': {'largo_tipo': 20, 'largo_punto': 20},
+    'microbiologia': {'largo_tipo': 50, 'largo_punto': 50},
+}
+
+
+def tipo_tabla(cur, tabla):
+    """'p' si la tabla está particionada, 'r' si es una tabla normal, None si no existe"""
+    cur.execute('SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)', (tabla,))
+    fila = cur.fetchone()
+    return fila[0] if fila else None
+
+
+def crear_tabla(cur, categoria):
+    """Crear (o migrar desde una tabla sin particionar) la tabla de mediciones de una categoría"""
+    tabla = f'mediciones_{categoria}'
+    actual = tipo_tabla(cur, tabla)
+
+    if actual == 'r':
+        _migrar_tabla(cur, categoria)
+    elif actual is None:
+        cur.execute(SQL_TABLA_PARTICIONADA.format(tabla=tabla, tipo_id='SERIAL', **LARGOS[categoria]))
+
+    cur.execute(f'CREATE TABLE IF NOT EXISTS {tabla}_default PARTITION OF {tabla} DEFAULT')
+    for nombre, columnas in INDICES_MEDICIONES.items():
+        crear_indice(cur, f'idx_{categoria}_{nombre}', tabla, columnas)
+
+
+def crear_indice(cur, indice, tabla, columnas):
+    """Crear un índice; si existe con otra definición (guardada como comentario) se reconstruye"""
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL, obj_description(to_regclass(%s), 'pg_class')", (indice, indice))
+    existe, definicion = cur.fetchone()
+    if existe and definicion == columnas:
+        return False
+    if existe:
+        print(f"Reconstruyendo índice {indice}...")
+        cur.execute(f'DROP INDEX {indice}')
+    cur.execute(f'CREATE INDEX {indice} ON {tabla} {columnas}')
+    cur.execute(f'COMMENT ON INDEX {indice} IS %s', (columnas,))
+    return True
+
+
+def _migrar_tabla(cur, categoria):
+    """Convertir una tabla sin particionar en particionada conservando datos, ids y secuencia"""
+    tabla = f'mediciones_{categoria}'
+    antigua = f'{tabla}_sin_particionar'
+    print(f"Migrando {tabla} a tabla particionada por fecha...")
+
+    cur.execute(f'LOCK TABLE {tabla} IN ACCESS EXCLUSIVE MODE')
+    cur.execute("SELECT pg_get_serial_sequence(%s, 'id')", (tabla,))
+    secuencia = cur.fetchone()[0]
+
+    cur.execute(f'ALTER TABLE {tabla} RENAME TO {antigua}')
+    # Los triggers de resúmenes se van con la tabla antigua: la copia no vuelve a sumar
+    cur.execute(SQL_TABLA_PARTICIONADA.format(
+        tabla=tabla,
+        tipo_id=f"INTEGER NOT NULL DEFAULT nextval('{secuencia}')",
+        **LARGOS[categoria]
+    ))
+    cur.execute(f'CREATE TABLE {tabla}_default PARTITION OF {tabla} DEFAULT')
+
+    cur.execute(f'SELECT EXTRACT(YEAR FROM MIN(fecha))::int, EXTRACT(YEAR FROM MAX(fecha))::int FROM {antigua}')
+    desde, hasta = cur.fetchone()
+    if desde is not None:
+        for anio in range(desde, hasta + 1):
+            crear_particion(cur, categoria, anio)
+
+    cur.execute(f'''
+        INSERT INTO {tabla} (id, tipo, punto, parametro, fecha, dato, nota, timestamp)
+        SELECT id, tipo, punto, parametro, fecha, dato, nota, timestamp FROM {antigua}
+    ''')
+    copiadas = cur.rowcount
+    cur.execute(f'ALTER SEQUENCE {secuencia} OWNED BY {tabla}.id')
+    cur.execute(f'DROP TABLE {antigua}')
+    cur.execute(f'ANALYZE {tabla}')
+    print(f"✓ {tabla} migrada ({copiadas} filas)")
+
+
+def particiones_existentes(cur, categoria):
+    """Años que ya tienen partición propia"""
+    cur.execute('''
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+    ''', (f'mediciones_{categoria}',))
+    prefijo = f'mediciones_{categoria}_'
+    anios = set()
+    for (nombre,) in cur.fetchall():
+        sufijo = nombre[len(prefijo):]
+        if sufijo.isdigit():
+            anios.add(int(sufijo))
+    return anios
+
+
+def crear_particion(cur, categoria, anio):
+    """Crear la partición de un año moviendo antes las filas que estuvieran en DEFAULT"""
+    tabla = f'mediciones_{categoria}'
+    particion = f'{tabla}_{anio}'
+    if tipo_tabla(cur, particion) is not None:
+        return False
+
+    desde = date(anio, 1, 1)
+    hasta = date(anio + 1, 1, 1)
+    cur.execute(f'CREATE TABLE {particion} (LIKE {tabla} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    # Mover las filas directamente entre particiones no dispara los triggers de la tabla padre
+    cur.execute(f'''
+        WITH movidas AS (
+            DELETE FROM {tabla}_default WHERE fecha >= %s AND fecha < %s RETURNING *
+        )
+        INSERT INTO {particion} SELECT * FROM movidas
+    ''', (desde, hasta))
+    cur.execute(f'''
+        ALTER TABLE {tabla} ATTACH PARTITION {particion}
+        FOR VALUES FROM (%s) TO (%s)
+    ''', (desde, hasta))
+    return True
+
+
+def asegurar_particiones(cur, categoria, anios):
+    """Crear las particiones de los años indicados que falten; devuelve los años creados"""
+    existentes = particiones_existentes(cur, categoria)
+    creadas = []
+    for anio in sorted(set(anios) - existentes):
+        if crear_particion(cur, categoria, anio):
+            creadas.append(anio)
+    return creadas
+
+
+def anios_en_default(cur, categoria):
+    """Años con filas en la partición DEFAULT (candidatos a tener partición propia)"""
+    cur.execute(f'SELECT DISTINCT EXTRACT(YEAR FROM fecha)::int FROM mediciones_{categoria}_default')
+    return [fila[0] for fila in cur.fetchall()]
@@ -0,0 +1,243 @@
+import os
+import threading
+import time
+import weakref
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolConexiones:
+    """Pool de conexiones thread-safe con verificación al préstamo"""
+
+    def __init__(self, fabrica, minimo=1, maximo=10, timeout=30.0, verificar_tras=30.0):
+        if minimo < 0 or maximo < 1 or minimo > maximo:
+            raise ValueError('Tamaño de pool inválido: se requiere 0 <= minimo <= maximo y maximo >= 1')
+
+        self._fabrica = fabrica
+        self.minimo = minimo
+        self.maximo = maximo
+        self.timeout = timeout
+        self.verificar_tras = verificar_tras
+
+        self._lock = threading.Condition(threading.Lock())
+        self._libres = []          # [(conexion, instante_devolucion)]
+        self._en_uso = set()
+        self._heredadas = []       # conexiones del proceso padre tras un fork
+        self._abiertas = 0
+        self._esperando = 0
+        self._pid = os.getpid()
+        self._cerrado = False
+
+        self._contadores = {
+            'prestamos': 0,
+            'creadas': 0,
+            'descartadas': 0,
+            'reconexiones': 0,
+            'timeouts': 0,
+            'errores_conexion': 0,
+            'espera_total_ms': 0.0,
+        }
+
+        # Desvincular las conexiones heredadas nada más bifurcar, aunque el hijo no use el pool
+        referencia = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: referencia() and referencia()._tras_fork())
+
+        self._precargar()
+
+    def _precargar(self):
+        """Abrir las conexiones mínimas (sin fallar si la base no está disponible)"""
+        for _ in range(self.minimo):
+            conn = self._crear()
+            if conn is None:
+                break
+            with self._lock:
+                self._abiertas += 1
+                self._libres.append((conn, time.monotonic()))
+
+    def _crear(self):
+        """Abrir una conexión nueva usando la fábrica"""
+        try:
+            conn = self._fabrica()
+        except Exception as e:
+            print(f"Error de conexión: {e}")
+            conn = None
+
+        with self._lock:
+            if conn is None:
+                self._contadores['errores_conexion'] += 1
+            else:
+                self._contadores['creadas'] += 1
+        return conn
+
+    def _verificar_proceso(self):
+        """Descartar las conexiones heredadas tras un fork (p. ej. gunicorn --preload)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # El socket es compartido con el padre: al liberarse, psycopg2 haría PQfinish y
+            # enviaría Terminate por él. En este proceso el descriptor pasa a apuntar a
+            # /dev/null y los objetos quedan referenciados sin volver a usarse.
+            heredadas = [conn for conn, _ in self._libres] + list(self._en_uso)
+            for conn in heredadas:
+                self._desvincular(conn)
+            self._heredadas.extend(heredadas)
+            self._libres = []
+            self._en_uso = set()
+            self._abiertas = 0
+            self._pid = os.getpid()
+
+    def _tras_fork(self):
+        # En el hijo solo existe el hilo que bifurcó: el lock pudo quedar tomado por otro
+        self._lock = threading.Condition(threading.Lock())
+        self._verificar_proceso()
+
+    @staticmethod
+    def _desvincular(conn):
+        """Sustituir en este proceso el socket de una conexión heredada por /dev/null"""
+        try:
+            if conn.closed:
+                return
+            nulo = os.open(os.devnull, os.O_RDWR)
+            try:
+                os.dup2(nulo, conn.fileno())
+            finally:
+                os.close(nulo)
+        except (OSError, psycopg2.Error):
+            pass
+
+    @staticmethod
+    def _esta_sana(conn):
+        """Comprobar que la conexión sigue viva con una consulta trivial"""
+        if conn.closed:
+            return False
+        try:
+            if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def obtener(self):
+        """Tomar una conexión del pool; devuelve None si no hay conexión disponible"""
+        self._verificar_proceso()
+        inicio = time.monotonic()
+        limite = inicio + self.timeout
+
+        with self._lock:
+            if self._cerrado:
+                return None
+            while not self._libres and self._abiertas >= self.maximo:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self._contadores['timeouts'] += 1
+                    print(f"Error de conexión: pool agotado tras {self.timeout}s")
+                    return None
+                self._esperando += 1
+                try:
+                    self._lock.wait(restante)
+                finally:
+                    self._esperando -= 1
+
+            if self._libres:
+                conn, devuelta = self._libres.pop()
+            else:
+                conn, devuelta = None, None
+            # Se reserva el hueco antes de soltar el lock para no superar el máximo
+            if conn is None:
+                self._abiertas += 1
+
+        if conn is not None and (conn.closed or time.monotonic() - devuelta >= self.verificar_tras):
+            if not self._esta_sana(conn):
+                self._cerrar_silencioso(conn)
+                with self._lock:
+                    self._contadores['reconexiones'] += 1
+                conn = None
+
+        if conn is None:
+            conn = self._crear()
+            if conn is None:
+                with self._lock:
+                    self._abiertas -= 1
+                    self._lock.notify()
+                return None
+
+        with self._lock:
+            self._en_uso.add(conn)
+            self._contadores['prestamos'] += 1
+            self._contadores['espera_total_ms'] += (time.monotonic() - inicio) * 1000
+        return conn
+
+    def devolver(self, conn, descartar=False):
+        """Devolver una conexión al pool, descartándola si está rota"""
+        if conn is None:
+            return
+
+        if not descartar and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                descartar = True
+        descartar = descartar or bool(conn.closed)
+
+        with self._lock:
+            if conn not in self._en_uso:
+                # Conexión de otro proceso o ya devuelta
+                return
+            self._en_uso.discard(conn)
+            if descartar or self._cerrado:
+                self._abiertas -= 1
+                self._contadores['descartadas'] += 1
+            else:
+                self._libres.append((conn, time.monotonic()))
+            self._lock.notify()
+
+        if descartar or self._cerrado:
+            self._cerrar_silencioso(conn)
+
+    @staticmethod
+    def _cerrar_silencioso(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def cerrar(self):
+        """Cerrar todas las conexiones libres y rechazar nuevos préstamos"""
+        with self._lock:
+            self._cerrado = True
+            libres = self._libres
+            self._libres = []
+            self._abiertas -= len(libres)
+            self._lock.notify_all()
+        for conn, _ in libres:
+            self._cerrar_silencioso(conn)
+
+    def estadisticas(self):
+        """Estado actual del pool para dimensionarlo por worker"""
+        with self._lock:
+            prestamos = self._contadores['prestamos']
+            return {
+                'pid': self._pid,
+                'minimo': self.minimo,
+                'maximo': self.maximo,
+                'timeout': self.timeout,
+                'abiertas': self._abiertas,
+                'en_uso': len(self._en_uso),
+                'libres': len(self._libres),
+                'esperando': self._esperando,
+                'prestamos': prestamos,
+                'creadas': self._contadores['creadas'],
+                'descartadas': self._contadores['descartadas'],
+                'reconexiones': self._contadores['reconexiones'],
+                'timeouts': self._contadores['timeouts'],
+                'errores_conexion': self._contadores['errores_conexion'],
+                'espera_media_ms': round(self._contadores['espera_total_ms'] / prestamos, 3) if prestamos else 0.0,
+            }
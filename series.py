@@ -0,0 +1,67 @@
+"""Reducción de series temporales para gráficos de tendencia.
+
+Las dos funciones reciben arrays NumPy x (ordenado) e y y devuelven los índices
+de los puntos a conservar, siempre incluyendo el primero y el último.
+"""
+import numpy as np
+
+METODOS = ('lttb', 'minmax')
+
+
+def lttb(x, y, umbral):
+    """Largest-Triangle-Three-Buckets: conserva la forma visual de la serie con `umbral` puntos.
+
+    El bucle recorre cubos (tantos como puntos de salida), no filas; el trabajo por
+    fila (áreas de los triángulos) se hace vectorizado dentro de cada cubo.
+    """
+    n = len(x)
+    if umbral >= n or umbral < 3:
+        return np.arange(n)
+
+    # umbral - 2 cubos entre el primer y el último punto
+    limites = np.linspace(1, n - 1, umbral - 1).astype(np.int64)
+    limites = np.append(limites, n)
+    suma_x = np.concatenate(([0.0], np.cumsum(x)))
+    suma_y = np.concatenate(([0.0], np.cumsum(y)))
+
+    seleccion = np.empty(umbral, dtype=np.int64)
+    seleccion[0] = 0
+    seleccion[-1] = n - 1
+    a = 0
+    for i in range(umbral - 2):
+        inicio, fin = limites[i], limites[i + 1]
+        sig_inicio, sig_fin = limites[i + 1], limites[i + 2]
+        # Vértice C: media del cubo siguiente (el último "cubo" es el punto final)
+        cantidad = sig_fin - sig_inicio
+        cx = (suma_x[sig_fin] - suma_x[sig_inicio]) / cantidad
+        cy = (suma_y[sig_fin] - suma_y[sig_inicio]) / cantidad
+        bx = x[inicio:fin]
+        by = y[inicio:fin]
+        areas = np.abs((x[a] - cx) * (by - y[a]) - (x[a] - bx) * (cy - y[a]))
+        a = inicio + int(areas.argmax())
+        seleccion[i + 1] = a
+    return seleccion
+
+
+def minmax(x, y, umbral):
+    """Mínimo y máximo de cada cubo: conserva los picos (útil para detectar excursiones)"""
+    n = len(x)
+    if umbral >= n or umbral < 4:
+        return np.arange(n)
+
+    cubos = (umbral - 2) // 2
+    limites = np.linspace(1, n - 1, cubos + 1).astype(np.int64)
+    indices = [0]
+    for inicio, fin in zip(limites[:-1], limites[1:]):
+        tramo = y[inicio:fin]
+        indices.append(inicio + int(tramo.argmin()))
+        indices.append(inicio + int(tramo.argmax()))
+    indices.append(n - 1)
+    return np.unique(indices)
+
+
+def reducir(x, y, umbral, metodo='lttb'):
+    """Índices de la serie reducida con el método indicado"""
+    if metodo not in METODOS:
+        raise ValueError(f'Método de reducción no soportado: {metodo}')
+    return lttb(x, y, umbral) if metodo == 'lttb' else minmax(x, y, umbral)
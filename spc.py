@@ -0,0 +1,308 @@
+"""Control estadístico de procesos (SPC) incremental por serie (punto, parametro).
+
+El estado de cada serie (media y varianza de Welford, EWMA, CUSUM y las últimas
+puntuaciones z para las reglas de Western Electric) se guarda en spc_estado y se
+actualiza en O(1) por medición dentro de la misma transacción que la inserta.
+Cada punto nuevo se evalúa contra el estado anterior a él; los eventos fuera de
+control o fuera de especificación se guardan en spc_eventos.
+
+Las mediciones se procesan en el orden en que llegan (ordenadas por fecha dentro
+de cada lote). Las series con filas sustituidas por una importación en modo
+sobrescribir se reconstruyen enteras en la misma transacción. Tras borrar
+mediciones o importar histórico desordenado, el estado y los eventos se
+reconstruyen con `python gestion.py recalcular-spc`, que recorre también las
+filas archivadas en Parquet.
+"""
+import heapq
+import math
+import os
+from datetime import date
+from itertools import groupby
+
+import archivo
+
+from psycopg2.extras import execute_values
+
+MIN_PUNTOS = int(os.environ.get('SPC_MIN_PUNTOS', 20))
+EWMA_LAMBDA = float(os.environ.get('SPC_EWMA_LAMBDA', 0.2))
+EWMA_L = float(os.environ.get('SPC_EWMA_L', 3))
+CUSUM_K = float(os.environ.get('SPC_CUSUM_K', 0.5))
+CUSUM_H = float(os.environ.get('SPC_CUSUM_H', 5))
+VENTANA_Z = 5
+
+REGLAS = {
+    'especificacion': 'Fuera de los límites de especificación',
+    'we1': 'Un punto más allá de 3σ',
+    'we2': '2 de 3 puntos consecutivos más allá de 2σ del mismo lado',
+    'we3': '4 de 5 puntos consecutivos más allá de 1σ del mismo lado',
+    'we4': '8 puntos consecutivos del mismo lado de la media',
+    'ewma': 'EWMA fuera de sus límites de control',
+    'cusum': 'CUSUM supera el intervalo de decisión',
+}
+
+COLUMNAS_ESTADO = ('n', 'media', 'm2', 'ewma', 'cusum_pos', 'cusum_neg', 'ultimos_z', 'racha', 'ultima_fecha')
+
+
+def estado_inicial():
+    return {'n': 0, 'media': 0.0, 'm2': 0.0, 'ewma': None, 'cusum_pos': 0.0, 'cusum_neg': 0.0,
+            'ultimos_z': [], 'racha': 0, 'ultima_fecha': None}
+
+
+def sigma(estado):
+    """Desviación estándar muestral del estado (None con menos de dos puntos)"""
+    return math.sqrt(estado['m2'] / (estado['n'] - 1)) if estado['n'] > 1 else None
+
+
+def limites_control(estado):
+    """Límites de control actuales de la serie (Shewhart ±3σ y EWMA asintóticos)"""
+    s = sigma(estado)
+    if s is None or estado['n'] < MIN_PUNTOS:
+        return None
+    ancho_ewma = EWMA_L * s * math.sqrt(EWMA_LAMBDA / (2 - EWMA_LAMBDA))
+    return {
+        'media': estado['media'],
+        'sigma': s,
+        'lcs': estado['media'] + 3 * s,
+        'lci': estado['media'] - 3 * s,
+        'ewma_lcs': estado['media'] + ancho_ewma,
+        'ewma_lci': estado['media'] - ancho_ewma,
+    }
+
+
+def evaluar(estado, x, fecha, limites=None):
+    """Evaluar un punto contra el estado y actualizarlo en O(1); devuelve [(regla, valor, limite)]"""
+    eventos = []
+    if limites:
+        inferior, superior = limites
+        if inferior is not None and x < inferior:
+            eventos.append(('especificacion', x, inferior))
+        elif superior is not None and x > superior:
+            eventos.append(('especificacion', x, superior))
+
+    s = sigma(estado)
+    if s and estado['n'] >= MIN_PUNTOS:
+        media = estado['media']
+        z = (x - media) / s
+        lado = 1 if z > 0 else -1 if z < 0 else 0
+
+        # Western Electric (el punto actual tiene que participar en la regla)
+        ventana = (estado['ultimos_z'] + [z])[-VENTANA_Z:]
+        if abs(z) > 3:
+            eventos.append(('we1', z, 3 * lado))
+        if abs(z) > 2 and sum(1 for v in ventana[-3:] if v * lado > 2) >= 2:
+            eventos.append(('we2', z, 2 * lado))
+        if abs(z) > 1 and len(ventana) == VENTANA_Z and sum(1 for v in ventana if v * lado > 1) >= 4:
+            eventos.append(('we3', z, lado))
+        estado['ultimos_z'] = ventana
+        if lado and estado['racha'] * lado > 0:
+            estado['racha'] += lado
+        else:
+            estado['racha'] = lado
+        if abs(estado['racha']) == 8:
+            eventos.append(('we4', estado['racha'], 8 * lado))
+
+        # EWMA: tras una señal se reinicia en la media para no repetir la alarma
+        ewma = EWMA_LAMBDA * x + (1 - EWMA_LAMBDA) * (media if estado['ewma'] is None else estado['ewma'])
+        ancho = EWMA_L * s * math.sqrt(EWMA_LAMBDA / (2 - EWMA_LAMBDA))
+        if abs(ewma - media) > ancho:
+            eventos.append(('ewma', ewma, media + ancho * (1 if ewma > media else -1)))
+            ewma = media
+        estado['ewma'] = ewma
+
+        # CUSUM tabular en unidades de σ, reiniciado tras cada señal
+        estado['cusum_pos'] = max(0.0, estado['cusum_pos'] + z - CUSUM_K)
+        estado['cusum_neg'] = max(0.0, estado['cusum_neg'] - z - CUSUM_K)
+        if estado['cusum_pos'] > CUSUM_H or estado['cusum_neg'] > CUSUM_H:
+            valor = estado['cusum_pos'] if estado['cusum_pos'] > CUSUM_H else -estado['cusum_neg']
+            eventos.append(('cusum', valor, CUSUM_H if valor > 0 else -CUSUM_H))
+            estado['cusum_pos'] = estado['cusum_neg'] = 0.0
+
+    # Welford
+    estado['n'] += 1
+    delta = x - estado['media']
+    estado['media'] += delta / estado['n']
+    estado['m2'] += delta * (x - estado['media'])
+    if estado['ultima_fecha'] is None or fecha > estado['ultima_fecha']:
+        estado['ultima_fecha'] = fecha
+    return eventos
+
+
+def procesar(cur, categoria, filas, ids=None):
+    """Actualizar el estado SPC con mediciones recién insertadas (tuplas en el orden de
+    COLUMNAS_MEDICION) y guardar los eventos; se ejecuta en la transacción de la inserción"""
+    if not filas:
+        return 0
+    ids = ids or [None] * len(filas)
+    orden = sorted(range(len(filas)), key=lambda i: (filas[i][1], filas[i][2], filas[i][3]))
+    series = sorted({(filas[i][1], filas[i][2]) for i in orden})
+
+    # Crear las series nuevas y bloquear las afectadas en orden (sin interbloqueos entre lotes)
+    execute_values(cur, '''
+        INSERT INTO spc_estado (categoria, punto, parametro) VALUES %s
+        ON CONFLICT DO NOTHING
+    ''', [(categoria, punto, parametro) for punto, parametro in series])
+    estados = _leer_estados(cur, categoria, series, bloquear=True)
+    limites = _leer_limites(cur, categoria, series)
+
+    eventos = []
+    for i in orden:
+        tipo, punto, parametro, fecha, dato = filas[i][:5]
+        if not isinstance(fecha, date):
+            fecha = date.fromisoformat(str(fecha)[:10])
+        x = float(dato)
+        for regla, valor, limite in evaluar(estados[(punto, parametro)], x, fecha, limites.get((punto, parametro))):
+            eventos.append((categoria, tipo, punto, parametro, ids[i], fecha, x, regla, valor, limite))
+
+    guardar_estados(cur, categoria, estados)
+    _guardar_eventos(cur, eventos)
+    return len(eventos)
+
+
+def _leer_estados(cur, categoria, series, bloquear=False):
+    cur.execute(f'''
+        SELECT punto, parametro, {', '.join(COLUMNAS_ESTADO)}
+        FROM spc_estado
+        WHERE categoria = %s AND (punto, parametro) IN %s
+        ORDER BY punto, parametro
+        {'FOR UPDATE' if bloquear else ''}
+    ''', (categoria, tuple(series)))
+    return {(fila[0], fila[1]): dict(zip(COLUMNAS_ESTADO, fila[2:])) for fila in cur.fetchall()}
+
+
+def _leer_limites(cur, categoria, series=None):
+    """Límites de especificación de las series (de toda la categoría si series es None)"""
+    cur.execute(f'''
+        SELECT punto, parametro, limite_inferior, limite_superior
+        FROM limites_especificacion
+        WHERE categoria = %s {'' if series is None else 'AND (punto, parametro) IN %s'}
+    ''', (categoria,) if series is None else (categoria, tuple(series)))
+    return {(fila[0], fila[1]): (fila[2], fila[3]) for fila in cur.fetchall()}
+
+
+def _guardar_eventos(cur, eventos):
+    if eventos:
+        execute_values(cur, '''
+            INSERT INTO spc_eventos (categoria, tipo, punto, parametro, medicion_id, fecha, dato, regla, valor, limite)
+            VALUES %s
+        ''', eventos)
+
+
+def guardar_estados(cur, categoria, estados):
+    """Escribir (upsert) el estado de varias series"""
+    execute_values(cur, f'''
+        INSERT INTO spc_estado (categoria, punto, parametro, {', '.join(COLUMNAS_ESTADO)}) VALUES %s
+        ON CONFLICT (categoria, punto, parametro) DO UPDATE SET
+            {', '.join(f'{c} = EXCLUDED.{c}' for c in COLUMNAS_ESTADO)},
+            actualizado = CURRENT_TIMESTAMP
+    ''', [
+        (categoria, punto, parametro) + tuple(estado[c] for c in COLUMNAS_ESTADO)
+        for (punto, parametro), estado in estados.items()
+    ], template='(%s, %s, %s, ' + ', '.join(
+        '%s::double precision[]' if c == 'ultimos_z' else '%s' for c in COLUMNAS_ESTADO
+    ) + ')')
+
+
+def recalcular(conn, categoria, tabla, tamano_lote=10000, series=None):
+    """Reconstruir el estado y los eventos recorriendo el histórico en orden.
+
+    Sin `series` se reconstruye la categoría entera bloqueando la tabla; con un conjunto
+    de (punto, parametro) solo esas series, dentro de la transacción de quien escribe
+    (tras sustituir filas con el modo sobrescribir) y bloqueando solo su estado. Los
+    eventos de las series se borran y se vuelven a generar con los límites actuales.
+
+    Las filas archivadas se mezclan con las de la tabla como en las series del dashboard
+    (a igual fecha, antes lo archivado); el archivo se lee punto a punto.
+    """
+    cur = conn.cursor()
+    if series is None:
+        cur.execute(f'LOCK TABLE {tabla} IN SHARE MODE')
+        cur.execute('DELETE FROM spc_estado WHERE categoria = %s', (categoria,))
+        cur.execute('DELETE FROM spc_eventos WHERE categoria = %s', (categoria,))
+        filtro, params = '', ()
+    else:
+        series = sorted(set(series))
+        if not series:
+            cur.close()
+            return 0
+        # Mismo orden de bloqueo que procesar(): las inserciones concurrentes de estas series esperan
+        execute_values(cur, '''
+            INSERT INTO spc_estado (categoria, punto, parametro) VALUES %s
+            ON CONFLICT DO NOTHING
+        ''', [(categoria, punto, parametro) for punto, parametro in series])
+        _leer_estados(cur, categoria, series, bloquear=True)
+        cur.execute(
+            'DELETE FROM spc_estado WHERE categoria = %s AND (punto, parametro) IN %s', (categoria, tuple(series))
+        )
+        cur.execute(
+            'DELETE FROM spc_eventos WHERE categoria = %s AND (punto, parametro) IN %s', (categoria, tuple(series))
+        )
+        filtro, params = 'WHERE (punto, parametro) IN %s', (tuple(series),)
+    limites = _leer_limites(cur, categoria, series)
+
+    puntos_archivados = set()
+    # Migrando con --hasta anterior a 0004 el manifiesto del archivo todavía no existe
+    cur.execute("SELECT to_regclass('archivo_manifiesto') IS NOT NULL")
+    if cur.fetchone()[0]:
+        cur.execute('SELECT DISTINCT punto FROM archivo_manifiesto WHERE categoria = %s', (categoria,))
+        puntos_archivados = {fila[0] for fila in cur.fetchall()}
+    buscadas = None if series is None else set(series)
+    if buscadas is not None:
+        puntos_archivados &= {punto for punto, _ in buscadas}
+
+    def series_archivadas(punto):
+        if punto not in puntos_archivados:
+            return {}
+        puntos_archivados.discard(punto)
+        filtros = {'punto': punto}
+        leidas = archivo.leer_series(archivo.archivos(cur, categoria, filtros), filtros)
+        if series is not None:
+            leidas = {parametro: filas for parametro, filas in leidas.items() if (punto, parametro) in buscadas}
+        return leidas
+
+    estados = {}
+    eventos = []
+
+    def reconstruir(punto, parametro, filas):
+        nonlocal estados, eventos
+        if len(estados) >= 500 or len(eventos) >= tamano_lote:
+            guardar_estados(cur, categoria, estados)
+            _guardar_eventos(cur, eventos)
+            estados, eventos = {}, []
+        estado = estados[(punto, parametro)] = estado_inicial()
+        limite = limites.get((punto, parametro))
+        for fecha, x, tipo, medicion_id in filas:
+            for regla, valor, limite_regla in evaluar(estado, x, fecha, limite):
+                eventos.append((categoria, tipo, punto, parametro, medicion_id, fecha, x, regla, valor, limite_regla))
+
+    lector = conn.cursor(name=f'spc_{categoria}')
+    lector.itersize = tamano_lote
+    lector.execute(f'''
+        SELECT punto, parametro, fecha, dato::float8, tipo, id
+        FROM {tabla}
+        {filtro}
+        ORDER BY punto, parametro, fecha, timestamp, id
+    ''', params)
+    punto_actual, archivadas = None, {}
+    for (punto, parametro), filas in groupby(lector, key=lambda f: (f[0], f[1])):
+        if punto != punto_actual:
+            # Series del punto anterior que solo están en el archivo
+            for parametro_archivo, filas_archivo in archivadas.items():
+                reconstruir(punto_actual, parametro_archivo, filas_archivo)
+            punto_actual, archivadas = punto, series_archivadas(punto)
+        filas_tabla = (f[2:] for f in filas)
+        reconstruir(punto, parametro, heapq.merge(archivadas.pop(parametro, ()), filas_tabla, key=lambda f: f[0]))
+    lector.close()
+    for parametro_archivo, filas_archivo in archivadas.items():
+        reconstruir(punto_actual, parametro_archivo, filas_archivo)
+    # Puntos que solo están en el archivo
+    for punto in sorted(puntos_archivados):
+        for parametro, filas in series_archivadas(punto).items():
+            reconstruir(punto, parametro, filas)
+
+    if estados:
+        guardar_estados(cur, categoria, estados)
+    _guardar_eventos(cur, eventos)
+    cur.execute('SELECT COUNT(*) FROM spc_estado WHERE categoria = %s', (categoria,))
+    total = cur.fetchone()[0]
+    cur.close()
+    return total
@@ -0,0 +1,387 @@
+let sidebarOpen = true;
+
+// Puntos y parámetros de /api/catalogo: categoría -> tipo -> punto -> parámetros
+let catalogo = {};
+
+const nombresTipo = {
+    nitrogeno: 'Nitrógeno',
+    aire_comprimido: 'Aire comprimido',
+    vapor_micro: 'Vapor'
+};
+
+function toggleSidebar() {
+    sidebarOpen = !sidebarOpen;
+    const sidebar = document.getElementById('sidebar');
+    const slideButton = document.getElementById('slideButton');
+    
+    if (sidebarOpen) {
+        sidebar.classList.remove('w-0');
+        sidebar.classList.add('w-80');
+        slideButton.classList.add('hidden');
+    } else {
+        sidebar.classList.remove('w-80');
+        sidebar.classList.add('w-0');
+        slideButton.classList.remove('hidden');
+    }
+}
+
+function toggleSection(section) {
+    const sectionEl = document.getElementById('section-' + section);
+    const icon = document.getElementById('icon-' + section);
+    
+    if (sectionEl.classList.contains('hidden')) {
+        sectionEl.classList.remove('hidden');
+        icon.classList.remove('icono-chevron-right');
+        icon.classList.add('icono-chevron-down');
+    } else {
+        sectionEl.classList.add('hidden');
+        icon.classList.remove('icono-chevron-down');
+        icon.classList.add('icono-chevron-right');
+    }
+}
+
+function showParameterForm(punto, parametro, tipo) {
+    document.getElementById('pageTitle').textContent = parametro + ' - ' + punto;
+    document.getElementById('mainContent').innerHTML = `
+        <div class="max-w-2xl mx-auto">
+            <div class="bg-white rounded-xl border border-gray-200 p-8">
+                <div class="mb-6">
+                    <div class="flex items-center gap-3 mb-2">
+                        <span class="px-3 py-1 rounded-full text-sm font-medium ${
+                            tipo === 'vapor' ? 'bg-orange-100 text-orange-700' :
+                            tipo === 'agua' ? 'bg-blue-100 text-blue-700' :
+                            'bg-green-100 text-green-700'
+                        }">${punto}</span>
+                        <i class="icono icono-chevron-right text-gray-400"></i>
+                        <span class="text-lg font-semibold text-gray-800">${parametro}</span>
+                    </div>
+                </div>
+
+                <form onsubmit="submitForm(event, '${punto}', '${parametro}', '${tipo}')" class="space-y-6">
+                    <div>
+                        <label class="block text-sm font-medium text-gray-700 mb-2">Fecha de medición</label>
+                        <input type="date" id="fecha" required 
+                            value="${new Date().toISOString().split('T')[0]}"
+                            class="w-full px-4 py-3 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500 focus:border-transparent">
+                    </div>
+
+                    <div>
+                        <label class="block text-sm font-medium text-gray-700 mb-2">Valor (${parametro})</label>
+                        <input type="text" id="dato" required placeholder="Ej: 150.5"
+                            oninput="validateNumber(this)"
+                            class="w-full px-4 py-3 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500 focus:border-transparent">
+                        <p class="mt-1 text-xs text-gray-500">Use punto (.) para decimales. No se permiten comas.</p>
+                    </div>
+
+                    <div>
+                        <label class="block text-sm font-medium text-gray-700 mb-2">Notas (opcional)</label>
+                        <textarea id="nota" rows="3" placeholder="Agregar observaciones..."
+                            class="w-full px-4 py-3 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500 focus:border-transparent resize-none"></textarea>
+                    </div>
+
+                    <div class="flex gap-3">
+                        <button type="button" onclick="showView('home')"
+                            class="flex-1 px-6 py-3 border border-gray-300 text-gray-700 rounded-lg hover:bg-gray-50 font-medium">
+                            Cancelar
+                        </button>
+                        <button type="submit"
+                            class="flex-1 px-6 py-3 bg-blue-600 text-white rounded-lg hover:bg-blue-700 font-medium">
+                            Guardar Datos
+                        </button>
+                    </div>
+                </form>
+            </div>
+        </div>
+    `;
+}
+
+function showCategoryForm(tipo, categoria) {
+    const puntos = (catalogo[categoria] || {})[tipo] || {};
+    const conCatalogo = Object.keys(puntos).length > 0;
+    const campo = 'w-full px-4 py-3 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500 focus:border-transparent';
+    document.getElementById('pageTitle').textContent = 'Microbiología - ' + (nombresTipo[tipo] || tipo);
+    document.getElementById('mainContent').innerHTML = `
+        <div class="max-w-2xl mx-auto">
+            <div class="bg-white rounded-xl border border-gray-200 p-8">
+                <div class="mb-6">
+                    <span class="px-3 py-1 rounded-full text-sm font-medium bg-green-100 text-green-700">${nombresTipo[tipo] || tipo}</span>
+                </div>
+
+                <form onsubmit="submitCategoryForm(event, '${tipo}')" class="space-y-6">
+                    <div class="grid grid-cols-1 md:grid-cols-2 gap-4">
+                        <div>
+                            <label class="block text-sm font-medium text-gray-700 mb-2">Punto</label>
+                            ${conCatalogo ? `
+                                <select id="punto" required onchange="updateParameterOptions('${categoria}', '${tipo}')" class="${campo}">
+                                    ${Object.keys(puntos).map(punto => `<option value="${punto}">${punto}</option>`).join('')}
+                                </select>
+                            ` : `<input type="text" id="punto" required placeholder="Ej: N2-01" class="${campo}">`}
+                        </div>
+                        <div>
+                            <label class="block text-sm font-medium text-gray-700 mb-2">Parámetro</label>
+                            ${conCatalogo ? `<select id="parametro" required class="${campo}"></select>` :
+                                `<input type="text" id="parametro" required placeholder="Ej: RECUENTO_TOTAL" class="${campo}">`}
+                        </div>
+                    </div>
+
+                    <div>
+                        <label class="block text-sm font-medium text-gray-700 mb-2">Fecha de medición</label>
+                        <input type="date" id="fecha" required
+                            value="${new Date().toISOString().split('T')[0]}"
+                            class="${campo}">
+                    </div>
+
+                    <div>
+                        <label class="block text-sm font-medium text-gray-700 mb-2">Valor</label>
+                        <input type="text" id="dato" required placeholder="Ej: 12"
+                            oninput="validateNumber(this)"
+                            class="${campo}">
+                        <p class="mt-1 text-xs text-gray-500">Use punto (.) para decimales. No se permiten comas.</p>
+                    </div>
+
+                    <div>
+                        <label class="block text-sm font-medium text-gray-700 mb-2">Notas (opcional)</label>
+                        <textarea id="nota" rows="3" placeholder="Agregar observaciones..."
+                            class="${campo} resize-none"></textarea>
+                    </div>
+
+                    <div class="flex gap-3">
+                        <button type="button" onclick="showView('home')"
+                            class="flex-1 px-6 py-3 border border-gray-300 text-gray-700 rounded-lg hover:bg-gray-50 font-medium">
+                            Cancelar
+                        </button>
+                        <button type="submit"
+                            class="flex-1 px-6 py-3 bg-blue-600 text-white rounded-lg hover:bg-blue-700 font-medium">
+                            Guardar Datos
+                        </button>
+                    </div>
+                </form>
+            </div>
+        </div>
+    `;
+    if (conCatalogo) {
+        updateParameterOptions(categoria, tipo);
+    }
+}
+
+function updateParameterOptions(categoria, tipo) {
+    const punto = document.getElementById('punto').value;
+    const parametros = catalogo[categoria][tipo][punto] || [];
+    document.getElementById('parametro').innerHTML = parametros
+        .map(param => `<option value="${param}">${param}</option>`).join('');
+}
+
+function submitCategoryForm(event, tipo) {
+    const punto = document.getElementById('punto').value.trim();
+    const parametro = document.getElementById('parametro').value.trim().toUpperCase();
+    return submitForm(event, punto, parametro, tipo);
+}
+
+function validateNumber(input) {
+    let value = input.value;
+    value = value.replace(/,/g, '.');
+    value = value.replace(/[^0-9.]/g, '');
+    const parts = value.split('.');
+    if (parts.length > 2) {
+        value = parts[0] + '.' + parts.slice(1).join('');
+    }
+    input.value = value;
+}
+
+async function submitForm(event, punto, parametro, tipo) {
+    event.preventDefault();
+    
+    const fecha = document.getElementById('fecha').value;
+    const dato = document.getElementById('dato').value;
+    const nota = document.getElementById('nota').value;
+
+    const data = {
+        punto: punto,
+        parametro: parametro,
+        tipo: tipo,
+        fecha: fecha,
+        dato: parseFloat(dato),
+        nota: nota
+    };
+
+    try {
+        const response = await fetch('/api/guardar', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(data)
+        });
+
+        const result = await response.json();
+        
+        if (result.success) {
+            alert('✓ Datos guardados correctamente');
+            showView('home');
+        } else {
+            alert('Error: ' + result.message);
+        }
+    } catch (error) {
+        alert('Error de conexión: ' + error.message);
+    }
+}
+
+function showView(view) {
+    document.getElementById('pageTitle').textContent = 
+        view === 'home' ? 'Panel Principal' :
+        view === 'import' ? 'Importar Datos' :
+        view === 'export' ? 'Exportar Datos' :
+        'Base de Datos';
+    
+    if (view === 'export') {
+        showExportView();
+    }
+    // Implementar otras vistas aquí
+}
+
+function showExportView() {
+    document.getElementById('mainContent').innerHTML = `
+        <div class="max-w-2xl mx-auto">
+            <div class="bg-white rounded-xl border border-gray-200 p-8">
+                <form onsubmit="submitExport(event)" class="space-y-6">
+                    <div class="grid grid-cols-1 md:grid-cols-2 gap-4">
+                        <div>
+                            <label class="block text-sm font-medium text-gray-700 mb-2">Categoría</label>
+                            <select id="exp-categoria" class="w-full px-4 py-3 border border-gray-300 rounded-lg">
+                                <option value="fisicoquimica">Fisicoquímica</option>
+                                <option value="microbiologia">Microbiología</option>
+                            </select>
+                        </div>
+                        <div>
+                            <label class="block text-sm font-medium text-gray-700 mb-2">Formato</label>
+                            <select id="exp-formato" class="w-full px-4 py-3 border border-gray-300 rounded-lg">
+                                <option value="csv">CSV</option>
+                                <option value="xlsx">Excel (XLSX)</option>
+                                <option value="parquet">Parquet</option>
+                            </select>
+                        </div>
+                        <div>
+                            <label class="block text-sm font-medium text-gray-700 mb-2">Punto (opcional)</label>
+                            <input type="text" id="exp-punto" placeholder="Ej: PA006"
+                                class="w-full px-4 py-3 border border-gray-300 rounded-lg">
+                        </div>
+                        <div>
+                            <label class="block text-sm font-medium text-gray-700 mb-2">Parámetro (opcional)</label>
+                            <input type="text" id="exp-parametro" placeholder="Ej: CONDUCTIVIDAD"
+                                class="w-full px-4 py-3 border border-gray-300 rounded-lg">
+                        </div>
+                        <div>
+                            <label class="block text-sm font-medium text-gray-700 mb-2">Desde</label>
+                            <input type="date" id="exp-fecha-inicio" class="w-full px-4 py-3 border border-gray-300 rounded-lg">
+                        </div>
+                        <div>
+                            <label class="block text-sm font-medium text-gray-700 mb-2">Hasta</label>
+                            <input type="date" id="exp-fecha-fin" class="w-full px-4 py-3 border border-gray-300 rounded-lg">
+                        </div>
+                    </div>
+                    <label class="flex items-center gap-2 text-sm text-gray-700">
+                        <input type="checkbox" id="exp-gzip"> Comprimir la descarga (gzip)
+                    </label>
+                    <button type="submit"
+                        class="w-full px-6 py-3 bg-blue-600 text-white rounded-lg hover:bg-blue-700 font-medium">
+                        <i class="icono icono-download"></i> Exportar
+                    </button>
+                </form>
+            </div>
+        </div>
+    `;
+}
+
+function submitExport(event) {
+    event.preventDefault();
+    const params = new URLSearchParams({ formato: document.getElementById('exp-formato').value });
+    const filtros = {
+        punto: document.getElementById('exp-punto').value.trim(),
+        parametro: document.getElementById('exp-parametro').value.trim().toUpperCase(),
+        fecha_inicio: document.getElementById('exp-fecha-inicio').value,
+        fecha_fin: document.getElementById('exp-fecha-fin').value
+    };
+    Object.entries(filtros).forEach(([clave, valor]) => { if (valor) params.set(clave, valor); });
+    if (document.getElementById('exp-gzip').checked) params.set('gzip', '1');
+    const categoria = document.getElementById('exp-categoria').value;
+    window.location.href = `/api/exportar/${categoria}?${params.toString()}`;
+}
+
+function formatNumber(valor) {
+    return valor === null || valor === undefined ? '-' : Number(valor).toFixed(2);
+}
+
+async function loadGroupSummary() {
+    const tbody = document.getElementById('resumenGrupos');
+    try {
+        const response = await fetch('/api/estadisticas/fisicoquimica/grupos');
+        const result = await response.json();
+        if (!result.success) throw new Error(result.message);
+        tbody.innerHTML = result.data.length ? result.data.map(g => `
+            <tr>
+                <td class="px-4 py-2 font-mono text-xs">${g.punto}</td>
+                <td class="px-4 py-2">${g.parametro}</td>
+                <td class="px-4 py-2 text-right">${g.total}</td>
+                <td class="px-4 py-2 text-right">${formatNumber(g.promedio)}</td>
+                <td class="px-4 py-2 text-right">${formatNumber(g.mediana)}</td>
+                <td class="px-4 py-2 text-right">${formatNumber(g.minimo)}</td>
+                <td class="px-4 py-2 text-right">${formatNumber(g.maximo)}</td>
+                <td class="px-4 py-2 text-right">${formatNumber(g.ultimo_valor)}</td>
+                <td class="px-4 py-2 text-right">${new Date(g.ultima_fecha).toISOString().split('T')[0]}</td>
+            </tr>
+        `).join('') : '<tr><td colspan="9" class="px-4 py-6 text-center text-gray-400">Sin mediciones</td></tr>';
+    } catch (error) {
+        tbody.innerHTML = `<tr><td colspan="9" class="px-4 py-6 text-center text-red-500">Error: ${error.message}</td></tr>`;
+    }
+}
+
+function buildSidebarSection(tipo, puntos, color) {
+    const section = document.getElementById('section-' + tipo);
+    section.innerHTML = '';
+    Object.keys(puntos).forEach(punto => {
+        const div = document.createElement('div');
+        div.innerHTML = `
+            <button onclick="toggleSection('${punto}')" class="w-full flex items-center justify-between px-3 py-2 text-sm rounded-lg text-gray-600 hover:bg-gray-50">
+                <span class="font-mono text-xs">${punto}</span>
+                <i class="icono icono-chevron-right text-xs" id="icon-${punto}"></i>
+            </button>
+            <div id="section-${punto}" class="hidden ml-4 mt-1 space-y-1 border-l-2 border-${color}-200 pl-3">
+                ${puntos[punto].map(param => `
+                    <button onclick="showParameterForm('${punto}', '${param}', '${tipo}')"
+                        class="w-full text-left text-xs text-gray-600 py-1.5 px-2 hover:bg-${color}-50 hover:text-${color}-600 rounded flex items-center justify-between group">
+                        <span>${param}</span>
+                        <i class="icono icono-plus text-xs opacity-0 group-hover:opacity-100"></i>
+                    </button>
+                `).join('')}
+            </div>
+        `;
+        section.appendChild(div);
+    });
+}
+
+async function loadCatalog() {
+    try {
+        // Cache-Control: no-cache + ETag: el navegador revalida y recibe 304 si no ha cambiado
+        const response = await fetch('/api/catalogo');
+        const result = await response.json();
+        if (!result.success) throw new Error(result.message);
+        catalogo = result.data;
+    } catch (error) {
+        console.error('Error al cargar el catálogo:', error);
+        return;
+    }
+
+    const fisicoquimica = catalogo.fisicoquimica || {};
+    const vapor = fisicoquimica.vapor || {};
+    const agua = fisicoquimica.agua || {};
+    buildSidebarSection('vapor', vapor, 'orange');
+    buildSidebarSection('agua', agua, 'blue');
+
+    document.getElementById('totalVapor').textContent = Object.keys(vapor).length;
+    document.getElementById('totalAgua').textContent = Object.keys(agua).length;
+    document.getElementById('totalPuntos').textContent = Object.keys(vapor).length + Object.keys(agua).length;
+}
+
+// Cargar puntos al iniciar
+window.onload = function() {
+    loadGroupSummary();
+    loadCatalog();
+};
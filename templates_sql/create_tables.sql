@@ -1,42 +1,82 @@
 -- Script para crear las tablas del sistema de laboratorio
 -- Fecha: 2025-01-01
+--
+-- Referencia de las tablas principales. El esquema real lo aplican las migraciones
+-- versionadas de migraciones/ (python gestion.py migrar), que además crean
+-- schema_version y las tablas de resúmenes, SPC e idempotencia.
+
+-- Las tablas de mediciones están particionadas por año de fecha; las fechas sin
+-- partición propia caen en la partición DEFAULT (python gestion.py crear-particiones)
 
 -- Tabla para fisicoquímica (vapor y agua)
 CREATE TABLE IF NOT EXISTS mediciones_fisicoquimica (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     tipo VARCHAR(20) NOT NULL CHECK (tipo IN ('vapor', 'agua')),
     punto VARCHAR(20) NOT NULL,
     parametro VARCHAR(50) NOT NULL,
     fecha DATE NOT NULL,
     dato DECIMAL(10, 4) NOT NULL,
     nota TEXT,
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, fecha)
+) PARTITION BY RANGE (fecha);
+
+CREATE TABLE IF NOT EXISTS mediciones_fisicoquimica_default PARTITION OF mediciones_fisicoquimica DEFAULT;
 
 -- Tabla para microbiología
 CREATE TABLE IF NOT EXISTS mediciones_microbiologia (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     tipo VARCHAR(50) NOT NULL,
     punto VARCHAR(50) NOT NULL,
     parametro VARCHAR(50) NOT NULL,
     fecha DATE NOT NULL,
     dato DECIMAL(10, 4) NOT NULL,
     nota TEXT,
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, fecha)
+) PARTITION BY RANGE (fecha);
 
--- Índices para mejorar el rendimiento
-CREATE INDEX IF NOT EXISTS idx_fisico_fecha ON mediciones_fisicoquimica(fecha);
-CREATE INDEX IF NOT EXISTS idx_fisico_punto ON mediciones_fisicoquimica(punto);
-CREATE INDEX IF NOT EXISTS idx_fisico_parametro ON mediciones_fisicoquimica(parametro);
-CREATE INDEX IF NOT EXISTS idx_fisico_tipo ON mediciones_fisicoquimica(tipo);
+CREATE TABLE IF NOT EXISTS mediciones_microbiologia_default PARTITION OF mediciones_microbiologia DEFAULT;
+
+-- Índices compuestos según el filtro (punto, parametro, rango de fechas) y el orden de las consultas
+CREATE INDEX IF NOT EXISTS idx_fisicoquimica_punto_parametro_fecha
+    ON mediciones_fisicoquimica(punto, parametro, fecha DESC, timestamp DESC, id DESC) INCLUDE (tipo, dato);
+CREATE INDEX IF NOT EXISTS idx_fisicoquimica_fecha ON mediciones_fisicoquimica(fecha DESC, timestamp DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_fisicoquimica_tipo ON mediciones_fisicoquimica(tipo);
+
+CREATE INDEX IF NOT EXISTS idx_microbiologia_punto_parametro_fecha
+    ON mediciones_microbiologia(punto, parametro, fecha DESC, timestamp DESC, id DESC) INCLUDE (tipo, dato);
+CREATE INDEX IF NOT EXISTS idx_microbiologia_fecha ON mediciones_microbiologia(fecha DESC, timestamp DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_microbiologia_tipo ON mediciones_microbiologia(tipo);
+
+-- Trabajos de importación en segundo plano (el archivo se guarda como large object)
+CREATE TABLE IF NOT EXISTS importaciones (
+    id UUID PRIMARY KEY,
+    categoria VARCHAR(50) NOT NULL,
+    formato VARCHAR(10) NOT NULL,
+    nombre_archivo TEXT,
+    archivo_oid OID,
+    estado VARCHAR(20) NOT NULL DEFAULT 'en_cola',
+    cancelar BOOLEAN NOT NULL DEFAULT FALSE,
+    filas_procesadas INTEGER NOT NULL DEFAULT 0,
+    insertados INTEGER NOT NULL DEFAULT 0,
+    total_errores INTEGER NOT NULL DEFAULT 0,
+    errores JSONB NOT NULL DEFAULT '[]',
+    mensaje TEXT,
+    intentos INTEGER NOT NULL DEFAULT 0,
+    trabajador TEXT,
+    latido TIMESTAMP,
+    creado TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    iniciado TIMESTAMP,
+    finalizado TIMESTAMP
+);
 
-CREATE INDEX IF NOT EXISTS idx_micro_fecha ON mediciones_microbiologia(fecha);
-CREATE INDEX IF NOT EXISTS idx_micro_tipo ON mediciones_microbiologia(tipo);
+CREATE INDEX IF NOT EXISTS idx_importaciones_estado ON importaciones(estado, creado);
 
 -- Comentarios para documentación
 COMMENT ON TABLE mediciones_fisicoquimica IS 'Mediciones de parámetros fisicoquímicos (vapor y agua)';
 COMMENT ON TABLE mediciones_microbiologia IS 'Mediciones microbiológicas';
+COMMENT ON TABLE importaciones IS 'Cola y estado de las importaciones de archivos en segundo plano';
 
 COMMENT ON COLUMN mediciones_fisicoquimica.tipo IS 'Tipo: vapor o agua';
 COMMENT ON COLUMN mediciones_fisicoquimica.punto IS 'Punto de muestreo (PMV001-008 o PA001-018)';
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from catalogo import IndiceCatalogo, normalizar, normalizar_columnas
+
+
+class BaseCatalogo:
+    """Lo que IndiceCatalogo usa de DatabaseManager, con contadores de lecturas"""
+
+    def __init__(self, filas, version=1):
+        self.filas = filas
+        self.version = version
+        self.lecturas = 0
+
+    def version_catalogo(self):
+        return self.version
+
+    def filas_catalogo(self):
+        self.lecturas += 1
+        return self.filas
+
+
+FILAS = [
+    ('fisicoquimica', 'agua', 'PA001', 'PH'),
+    ('fisicoquimica', 'agua', 'PA001', 'TOC'),
+    ('fisicoquimica', 'vapor', 'PMV001', 'PH'),
+]
+
+
+def test_normalizar():
+    assert normalizar(' Agua ', ' PA001 ', ' ph ') == ('agua', 'PA001', 'PH')
+    assert normalizar(None, 'PA001', None) == (None, 'PA001', None)
+    assert normalizar('VAPOR', 5, 'Conductividad') == ('vapor', '5', 'CONDUCTIVIDAD')
+
+
+def test_normalizar_columnas_coincide_con_normalizar():
+    tipos = pd.Series([' Agua', 'VAPOR ', None], dtype='string')
+    puntos = pd.Series([' PA001 ', 'PMV001', 'PA002'], dtype='string')
+    parametros = pd.Series(['ph', ' Toc ', None], dtype='string')
+    t, p, q = normalizar_columnas(tipos, puntos, parametros)
+    assert list(zip(t[:2], p[:2], q[:2])) == [
+        normalizar(' Agua', ' PA001 ', 'ph'), normalizar('VAPOR ', 'PMV001', ' Toc ')
+    ]
+    assert pd.isna(t[2]) and pd.isna(q[2])
+
+
+def test_indice_valida_contra_el_catalogo():
+    indice = IndiceCatalogo(BaseCatalogo(FILAS), refresco=3600)
+    assert indice.contiene('fisicoquimica', 'agua', 'PA001', 'PH')
+    assert not indice.contiene('fisicoquimica', 'vapor', 'PA001', 'PH')
+    with pytest.raises(ValueError, match='no está en el catálogo'):
+        indice.comprobar('fisicoquimica', 'agua', 'PA999', 'PH')
+    filtro = indice.filtro('fisicoquimica', ['agua', 'agua', 'vapor'], ['PA001', 'PA002', 'PMV001'], ['TOC', 'PH', 'PH'])
+    np.testing.assert_array_equal(filtro, [True, False, True])
+
+
+def test_categoria_sin_catalogo_no_se_valida():
+    indice = IndiceCatalogo(BaseCatalogo(FILAS), refresco=3600)
+    assert indice.contiene('microbiologia', 'cualquiera', 'X', 'Y')
+    assert indice.filtro('microbiologia', ['a', 'b'], ['c', 'd'], ['e', 'f']).all()
+
+
+def test_estructura_y_recarga_solo_al_cambiar_la_version():
+    base = BaseCatalogo(FILAS)
+    indice = IndiceCatalogo(base, refresco=0)
+    estructura, etag = indice.estructura()
+    assert estructura == {'fisicoquimica': {'agua': {'PA001': ['PH', 'TOC']}, 'vapor': {'PMV001': ['PH']}}}
+    indice.estructura()
+    assert base.lecturas == 1
+
+    base.filas = FILAS + [('fisicoquimica', 'agua', 'PA002', 'PH')]
+    base.version = 2
+    estructura, etag_nuevo = indice.estructura()
+    assert base.lecturas == 2
+    assert 'PA002' in estructura['fisicoquimica']['agua']
+    assert etag_nuevo != etag
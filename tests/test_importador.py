@@ -0,0 +1,108 @@
+import io
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from importador import ImportadorDatos, detectar_codificacion, detectar_separador
+
+
+@pytest.fixture
+def importador():
+    return ImportadorDatos(None)
+
+
+def test_validar_normaliza_y_convierte(importador):
+    df = pd.DataFrame({
+        'fecha': ['2025-01-02', '2025-01-03', '2025-01-04'],
+        'tipo': ['AGUA ', None, ' Vapor'],
+        'punto': [' PA001 ', 'PA002', 'PMV001'],
+        'parametro': [' ph ', 'toc', 'Conductividad'],
+        'dato': ['7,5', '3', 12],
+        'nota': [None, 'revisar', None],
+    })
+    datos, filas, errores = importador._validar_dataframe(df, fila_inicial=2)
+    assert errores == []
+    assert filas == [2, 3, 4]
+    assert datos == [
+        ('agua', 'PA001', 'PH', date(2025, 1, 2), 7.5, None),
+        ('agua', 'PA002', 'TOC', date(2025, 1, 3), 3.0, 'revisar'),
+        ('vapor', 'PMV001', 'CONDUCTIVIDAD', date(2025, 1, 4), 12.0, None),
+    ]
+
+
+def test_validar_sin_columna_tipo_usa_agua(importador):
+    df = pd.DataFrame({'fecha': ['2025-01-02'], 'punto': ['PA001'], 'parametro': ['PH'], 'dato': [7.0]})
+    datos, _, _ = importador._validar_dataframe(df)
+    assert datos[0][0] == 'agua'
+
+
+def test_validar_informa_el_motivo_de_cada_fila(importador):
+    df = pd.DataFrame({
+        'fecha': ['2025-01-02', 'ayer', None, '2025-01-02', '2025-01-02', '2025-01-02', '2025-01-02'],
+        'punto': ['PA001', 'PA001', 'PA001', 'PA001', 'PA001', '  ', 'PA001'],
+        'parametro': ['PH', 'PH', 'PH', 'PH', 'PH', 'PH', None],
+        'dato': ['7', '7', '7', None, 'xx', '7', '7'],
+    })
+    datos, filas, errores = importador._validar_dataframe(df, fila_inicial=10)
+    assert filas == [10]
+    assert len(datos) == 1
+    assert errores == [
+        "Fila 11: fecha inválida 'ayer'",
+        'Fila 12: fecha vacía',
+        'Fila 13: dato vacío',
+        "Fila 14: dato no numérico 'xx'",
+        'Fila 15: punto vacío',
+        'Fila 16: parametro vacío',
+    ]
+
+
+def test_validar_contra_el_catalogo():
+    class Catalogo:
+        def filtro(self, categoria, tipos, puntos, parametros):
+            return np.array([p == 'PH' for p in parametros])
+
+    class Base:
+        catalogo = Catalogo()
+
+    df = pd.DataFrame({'fecha': ['2025-01-02'] * 2, 'punto': ['PA001'] * 2, 'parametro': ['ph', 'zz'], 'dato': [7, 8]})
+    datos, filas, errores = ImportadorDatos(Base())._validar_dataframe(df, categoria='fisicoquimica')
+    assert filas == [2]
+    assert errores == ['Fila 3: agua PA001 ZZ no está en el catálogo']
+
+
+def test_convertir_fechas_con_formatos_mezclados():
+    fechas = ImportadorDatos._convertir_fechas(pd.Series(['2025-01-02', '2025-01-03 10:00', '3 Feb 2025', 'no', None]))
+    assert list(fechas[:3].dt.date) == [date(2025, 1, 2), date(2025, 1, 3), date(2025, 2, 3)]
+    assert fechas[3:].isna().all()
+
+
+def test_convertir_datos():
+    datos = ImportadorDatos._convertir_datos(pd.Series(['1,5', ' 2 ', '-3.25', 'n/d', None], dtype=object))
+    np.testing.assert_array_equal(datos.to_numpy(dtype=float, na_value=np.nan)[:3], [1.5, 2.0, -3.25])
+    assert datos[3:].isna().all()
+    assert ImportadorDatos._convertir_datos(pd.Series([1, 2])).dtype == float
+
+
+@pytest.mark.parametrize('contenido, esperada', [
+    ('fecha;dato\n2025-01-02;1\n'.encode('utf-8-sig'), 'utf-8-sig'),
+    ('parámetro\n'.encode('utf-8'), 'utf-8'),
+    ('parámetro\n'.encode('cp1252'), 'cp1252'),
+])
+def test_detectar_codificacion(contenido, esperada):
+    assert detectar_codificacion(contenido) == esperada
+
+
+@pytest.mark.parametrize('separador', [',', ';', '\t', '|'])
+def test_detectar_separador(separador):
+    texto = '\n'.join(separador.join(f) for f in [
+        ['fecha', 'punto', 'parametro', 'dato'], ['2025-01-02', 'PA001', 'PH', '7'], ['2025-01-03', 'PA001', 'PH', '8'],
+    ])
+    assert detectar_separador(texto.encode(), 'utf-8') == separador
+
+
+def test_procesar_txt_sin_columnas_requeridas():
+    archivo = io.BytesIO(b'fecha;valor\n2025-01-02;1\n')
+    resultado = ImportadorDatos(None).procesar_txt(archivo, 'fisicoquimica')
+    assert resultado == {'success': False, 'message': 'Faltan columnas: punto, parametro, dato'}
@@ -0,0 +1,22 @@
+from datetime import date, datetime
+
+import pytest
+
+from database import codificar_cursor, decodificar_cursor
+
+
+@pytest.mark.parametrize('marca_tiempo', [datetime(2025, 3, 4, 10, 20, 30, 123456), None])
+def test_cursor_ida_y_vuelta(marca_tiempo):
+    cursor = codificar_cursor(date(2025, 3, 4), marca_tiempo, 987654)
+    assert decodificar_cursor(cursor) == (date(2025, 3, 4), marca_tiempo, 987654)
+
+
+def test_cursor_es_seguro_en_urls():
+    cursor = codificar_cursor(date(2025, 12, 31), datetime(2025, 12, 31, 23, 59, 59), 2 ** 40)
+    assert '=' not in cursor and '+' not in cursor and '/' not in cursor
+
+
+@pytest.mark.parametrize('cursor', ['', 'no-es-base64!', 'WyJ4Il0', codificar_cursor(date(2025, 1, 1), None, 1)[:-3]])
+def test_cursor_no_valido(cursor):
+    with pytest.raises(ValueError, match='Cursor de paginación no válido'):
+        decodificar_cursor(cursor)
@@ -0,0 +1,52 @@
+from datetime import date
+
+import psycopg2
+
+import particiones
+
+
+def _contar(url, tabla):
+    conn = psycopg2.connect(url)
+    try:
+        cur = conn.cursor()
+        cur.execute(f'SELECT COUNT(*) FROM {tabla}')
+        return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_crear_particiones_mueve_las_filas_de_default(db_postgres, postgres_url):
+    anio = date.today().year + 5
+    conn = psycopg2.connect(postgres_url)
+    cur = conn.cursor()
+    cur.executemany(
+        'INSERT INTO mediciones_fisicoquimica (tipo, punto, parametro, fecha, dato) VALUES (%s, %s, %s, %s, %s)',
+        [('agua', 'PA001', 'PH', date(anio, mes, 1), 7.0) for mes in (1, 6, 12)]
+    )
+    conn.commit()
+    conn.close()
+    assert _contar(postgres_url, 'mediciones_fisicoquimica_default') == 3
+
+    resultado = db_postgres.crear_particiones()
+
+    assert resultado['success'], resultado['message']
+    assert anio in resultado['data']['fisicoquimica']
+    assert _contar(postgres_url, 'mediciones_fisicoquimica_default') == 0
+    assert _contar(postgres_url, f'mediciones_fisicoquimica_{anio}') == 3
+    assert _contar(postgres_url, 'mediciones_fisicoquimica') == 3
+
+
+def test_crear_particiones_cubre_el_anio_actual_y_el_siguiente(db_postgres, postgres_url):
+    conn = psycopg2.connect(postgres_url)
+    cur = conn.cursor()
+    for anio in (date.today().year, date.today().year + 1):
+        cur.execute(f'ALTER TABLE mediciones_microbiologia DETACH PARTITION mediciones_microbiologia_{anio}')
+        cur.execute(f'DROP TABLE mediciones_microbiologia_{anio}')
+    conn.commit()
+
+    resultado = db_postgres.crear_particiones()
+
+    assert resultado['success'], resultado['message']
+    assert {date.today().year, date.today().year + 1} <= particiones.particiones_existentes(cur, 'microbiologia')
+    assert resultado['data']['microbiologia'] == [date.today().year, date.today().year + 1]
+    conn.close()
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from series import lttb, minmax, reducir
+
+
+def _serie(n=1000, semilla=0):
+    rng = np.random.default_rng(semilla)
+    x = np.arange(n, dtype=float)
+    y = np.cumsum(rng.normal(size=n))
+    return x, y
+
+
+def test_lttb_conserva_extremos_y_numero_de_puntos():
+    x, y = _serie()
+    indices = lttb(x, y, 100)
+    assert len(indices) == 100
+    assert indices[0] == 0 and indices[-1] == len(x) - 1
+    assert np.all(np.diff(indices) > 0)
+
+
+def test_lttb_conserva_un_pico_aislado():
+    x = np.arange(500, dtype=float)
+    y = np.zeros(500)
+    y[237] = 50.0
+    assert 237 in lttb(x, y, 20)
+
+
+@pytest.mark.parametrize('umbral', [2, 1000, 5000])
+def test_lttb_sin_reduccion_devuelve_todos(umbral):
+    x, y = _serie()
+    np.testing.assert_array_equal(lttb(x, y, umbral), np.arange(len(x)))
+
+
+def test_minmax_conserva_maximo_y_minimo_globales():
+    x, y = _serie(semilla=3)
+    indices = minmax(x, y, 60)
+    assert int(y.argmax()) in indices
+    assert int(y.argmin()) in indices
+    assert indices[0] == 0 and indices[-1] == len(x) - 1
+    assert len(indices) <= 60
+    assert np.all(np.diff(indices) > 0)
+
+
+def test_minmax_sin_reduccion_devuelve_todos():
+    x, y = _serie(n=10)
+    np.testing.assert_array_equal(minmax(x, y, 3), np.arange(10))
+
+
+def test_reducir_elige_metodo_y_rechaza_desconocidos():
+    x, y = _serie()
+    np.testing.assert_array_equal(reducir(x, y, 50, 'lttb'), lttb(x, y, 50))
+    np.testing.assert_array_equal(reducir(x, y, 50, 'minmax'), minmax(x, y, 50))
+    with pytest.raises(ValueError):
+        reducir(x, y, 50, 'media')
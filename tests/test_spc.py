@@ -0,0 +1,89 @@
+import math
+from datetime import date, timedelta
+
+import numpy as np
+
+import spc
+
+INICIO = date(2025, 1, 1)
+
+
+def _alimentar(estado, valores, limites=None, desde=0):
+    """Evaluar los valores en orden; devuelve la lista de reglas disparadas por punto"""
+    reglas = []
+    for i, x in enumerate(valores):
+        eventos = spc.evaluar(estado, x, INICIO + timedelta(days=desde + i), limites)
+        reglas.append([regla for regla, _, _ in eventos])
+    return reglas
+
+
+def _estado_estable(n=40):
+    """Serie en control alrededor de 10 (media 10, σ ≈ 1)"""
+    estado = spc.estado_inicial()
+    reglas = _alimentar(estado, [9.0, 11.0] * (n // 2))
+    assert not any(reglas)
+    return estado
+
+
+def test_welford_coincide_con_numpy():
+    valores = np.random.default_rng(7).normal(5, 2, size=200)
+    estado = spc.estado_inicial()
+    _alimentar(estado, valores)
+    assert estado['n'] == 200
+    assert math.isclose(estado['media'], valores.mean(), rel_tol=1e-12)
+    assert math.isclose(spc.sigma(estado), valores.std(ddof=1), rel_tol=1e-9)
+    assert estado['ultima_fecha'] == INICIO + timedelta(days=199)
+
+
+def test_sin_reglas_de_control_antes_de_min_puntos():
+    estado = spc.estado_inicial()
+    reglas = _alimentar(estado, [10.0] * (spc.MIN_PUNTOS - 2) + [10.5])
+    assert spc.limites_control(estado) is None
+    reglas += _alimentar(estado, [100.0], desde=spc.MIN_PUNTOS - 1)
+    assert not any(reglas)
+    assert spc.limites_control(estado) is not None
+
+
+def test_especificacion_se_evalua_desde_el_primer_punto():
+    estado = spc.estado_inicial()
+    eventos = spc.evaluar(estado, 9.0, INICIO, (None, 8.0))
+    assert eventos == [('especificacion', 9.0, 8.0)]
+    assert spc.evaluar(estado, 5.0, INICIO, (6.0, None)) == [('especificacion', 5.0, 6.0)]
+
+
+def test_we1_un_punto_mas_alla_de_3_sigma():
+    estado = _estado_estable()
+    assert 'we1' in _alimentar(estado, [14.5], desde=40)[0]
+
+
+def test_we2_dos_de_tres_mas_alla_de_2_sigma():
+    estado = _estado_estable()
+    reglas = _alimentar(estado, [12.5, 12.5], desde=40)
+    assert 'we2' not in reglas[0]
+    assert 'we2' in reglas[1]
+
+
+def test_we4_ocho_puntos_del_mismo_lado():
+    estado = _estado_estable()
+    # El punto bajo corta la racha de la serie estable (que acaba por encima de la media)
+    reglas = _alimentar(estado, [9.0] + [10.3] * 8, desde=40)
+    assert not any('we4' in r for r in reglas[:8])
+    assert 'we4' in reglas[8]
+
+
+def test_cusum_detecta_un_desplazamiento_sostenido_y_se_reinicia():
+    estado = _estado_estable()
+    reglas = _alimentar(estado, [11.2] * 10, desde=40)
+    disparo = next(i for i, r in enumerate(reglas) if 'cusum' in r)
+    assert disparo < 10
+    # Cada paso suma z - k ≈ 0.7: hacen falta varios puntos para superar h = 5
+    assert disparo >= 5
+    assert estado['cusum_pos'] < spc.CUSUM_H
+
+
+def test_limites_control_simetricos():
+    estado = _estado_estable()
+    limites = spc.limites_control(estado)
+    assert math.isclose(limites['lcs'] - limites['media'], limites['media'] - limites['lci'])
+    assert math.isclose(limites['lcs'] - limites['lci'], 6 * limites['sigma'])
+    assert limites['ewma_lci'] < limites['media'] < limites['ewma_lcs']
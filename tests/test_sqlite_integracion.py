@@ -0,0 +1,89 @@
+"""Recorrido completo sobre el backend SQLite: migrar, importar, paginar, estadísticas y reintentos"""
+import io
+from datetime import date, timedelta
+
+import pytest
+
+from database_sqlite import DatabaseManagerSqlite
+from importador import ImportadorDatos
+
+FILAS = 25
+
+
+def _csv(filas_extra=''):
+    lineas = ['fecha;tipo;punto;parametro;dato']
+    for i in range(FILAS):
+        fecha = date(2025, 1, 1) + timedelta(days=i)
+        lineas.append(f'{fecha.isoformat()};agua;PA001;PH;{7 + i / 100:.2f}'.replace('.', ',', 1)
+                      if i % 2 else f'{fecha.isoformat()};Agua ; PA001 ;ph;{7 + i / 100:.2f}')
+    return ('\n'.join(lineas) + '\n' + filas_extra).encode('utf-8')
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManagerSqlite(f'sqlite:///{tmp_path}/laboratorio.db')
+    resultado = db.migrar()
+    assert resultado['success'], resultado['message']
+    return db
+
+
+def test_importar_paginar_y_estadisticas(db):
+    errores = '2025-02-01;agua;PA001;PH;xx\n2025-02-01;agua;ZZZ;PH;7\n'
+    resultado = ImportadorDatos(db).procesar_txt(io.BytesIO(_csv(errores)), 'fisicoquimica')
+    assert resultado['success'], resultado['message']
+    assert resultado['insertados'] == FILAS
+    assert resultado['errores'] == [
+        "Fila 27: dato no numérico 'xx'",
+        'Fila 28: agua ZZZ PH no está en el catálogo',
+    ]
+
+    vistas, cursor = [], None
+    while True:
+        pagina = db.obtener_mediciones('fisicoquimica', limite=10, cursor=cursor)
+        assert pagina['success']
+        vistas.extend(pagina['data'])
+        cursor = pagina.get('siguiente')
+        if cursor is None:
+            break
+    assert len(vistas) == FILAS
+    assert len({m['id'] for m in vistas}) == FILAS
+    claves = [(m['fecha'], m['timestamp'], m['id']) for m in vistas]
+    assert claves == sorted(claves, reverse=True)
+    assert {(m['tipo'], m['punto'], m['parametro']) for m in vistas} == {('agua', 'PA001', 'PH')}
+    assert vistas[0]['fecha'] == date(2025, 1, 1) + timedelta(days=FILAS - 1)
+
+    estadisticas = db.obtener_estadisticas('fisicoquimica', punto='PA001', parametro='PH')
+    assert estadisticas['success']
+    assert estadisticas['data']['total'] == FILAS
+    assert float(estadisticas['data']['minimo']) == pytest.approx(7.0)
+    assert float(estadisticas['data']['maximo']) == pytest.approx(7 + (FILAS - 1) / 100)
+
+
+def test_reimportar_omite_duplicados(db):
+    importador = ImportadorDatos(db)
+    assert importador.procesar_txt(io.BytesIO(_csv()), 'fisicoquimica')['insertados'] == FILAS
+    resultado = importador.procesar_txt(io.BytesIO(_csv()), 'fisicoquimica', modo='omitir')
+    assert resultado['success']
+    assert (resultado['insertados'], resultado['omitidos']) == (0, FILAS)
+    assert db.obtener_estadisticas('fisicoquimica')['data']['total'] == FILAS
+
+
+def test_lote_idempotente(db):
+    items = [
+        {'categoria': 'fisicoquimica', 'tipo': 'agua', 'punto': 'PA001', 'parametro': 'PH',
+         'fecha': '2025-02-01', 'dato': 7.1},
+        {'categoria': 'fisicoquimica', 'tipo': 'agua', 'punto': 'PA001', 'parametro': 'PH',
+         'fecha': '2025-02-02', 'dato': 'xx'},
+    ]
+    primera = db.insertar_mediciones_lote(items, 'clave-1', 'huella-1')
+    assert primera['success']
+    assert (primera['insertados'], primera['errores']) == (1, 1)
+
+    repetida = db.insertar_mediciones_lote(items, 'clave-1', 'huella-1')
+    assert repetida.pop('repetida') is True
+    assert repetida == primera
+    assert db.obtener_estadisticas('fisicoquimica')['data']['total'] == 1
+
+    conflicto = db.insertar_mediciones_lote(items[:1], 'clave-1', 'otra-huella')
+    assert conflicto['success'] is False
+    assert conflicto['conflicto'] is True